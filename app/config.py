@@ -6,10 +6,18 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 class Settings:
     """Application settings loaded from environment variables.
 
-    Currently only exposes DATABASE_URL, which is read once at startup.
+    Values are read once at startup; numeric settings fall back to
+    conservative defaults when unset.
     """
 
     def __init__(self) -> None:
@@ -17,5 +25,122 @@ class Settings:
         # when attempting to use an empty URL.
         self.DATABASE_URL: Optional[str] = os.getenv("DATABASE_URL")
 
+        # Optional read replica for GET endpoints. For DB_READ_STICKY_SECONDS
+        # after a user's own write, their reads stay on the primary; keep it
+        # above the replica's usual lag.
+        self.DATABASE_REPLICA_URL: Optional[str] = os.getenv("DATABASE_REPLICA_URL") or None
+        self.DB_READ_STICKY_SECONDS: float = float(os.getenv("DB_READ_STICKY_SECONDS", "5"))
+
+        # Connection pool (per worker). DB_PGBOUNCER turns off prepared
+        # statements for PgBouncer / Supabase pooler transaction mode;
+        # DB_POOL_WARMUP connections are opened at startup.
+        self.DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+        self.DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+        self.DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+        self.DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+        self.DB_POOL_PRE_PING: bool = _env_bool("DB_POOL_PRE_PING", True)
+        self.DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+        self.DB_PGBOUNCER: bool = _env_bool("DB_PGBOUNCER", False)
+        self.DB_POOL_WARMUP: int = int(os.getenv("DB_POOL_WARMUP", "2"))
+
+        # Gemini client. AI_MAX_CONCURRENCY bounds the generations in flight
+        # per worker; AI_TIMEOUT_SECONDS bounds a model call, retries included.
+        # Prompts estimated above AI_MAX_PROMPT_TOKENS are refused (0: no limit).
+        self.GEMINI_API_KEY: Optional[str] = os.getenv("GEMINI_API_KEY")
+        self.GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+        self.AI_MAX_CONCURRENCY: int = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+        self.AI_TIMEOUT_SECONDS: float = float(os.getenv("AI_TIMEOUT_SECONDS", "90"))
+        self.AI_MAX_PROMPT_TOKENS: int = int(os.getenv("AI_MAX_PROMPT_TOKENS", "0"))
+
+        # Resilience. AI_ATTEMPT_TIMEOUT_SECONDS bounds each attempt within a
+        # call. Timeouts, transient upstream errors and unparseable replies
+        # are retried AI_RETRIES times, with jittered backoff from
+        # AI_RETRY_BACKOFF_SECONDS. AI_HEDGE_AFTER_SECONDS (0: off) sends a
+        # duplicate request when an attempt is that slow and a slot is
+        # free. After AI_BREAKER_FAILURES upstream failures in a row, calls
+        # fail fast for AI_BREAKER_RESET_SECONDS and plans are built locally.
+        self.AI_ATTEMPT_TIMEOUT_SECONDS: float = float(os.getenv("AI_ATTEMPT_TIMEOUT_SECONDS", "45"))
+        self.AI_RETRIES: int = int(os.getenv("AI_RETRIES", "2"))
+        self.AI_RETRY_BACKOFF_SECONDS: float = float(os.getenv("AI_RETRY_BACKOFF_SECONDS", "0.5"))
+        self.AI_HEDGE_AFTER_SECONDS: float = float(os.getenv("AI_HEDGE_AFTER_SECONDS", "0"))
+        self.AI_BREAKER_FAILURES: int = int(os.getenv("AI_BREAKER_FAILURES", "5"))
+        self.AI_BREAKER_RESET_SECONDS: float = float(os.getenv("AI_BREAKER_RESET_SECONDS", "30"))
+
+        # AI plans are generated AI_PLAN_CHUNK_DAYS days per call, the calls
+        # running concurrently; a chunk whose reply is unusable is retried
+        # alone up to AI_PLAN_CHUNK_RETRIES times. Plans longer than
+        # AI_PLAN_CYCLE_DAYS repeat a plan of that length (0: never repeat).
+        self.AI_PLAN_CHUNK_DAYS: int = int(os.getenv("AI_PLAN_CHUNK_DAYS", "7"))
+        self.AI_PLAN_CHUNK_RETRIES: int = int(os.getenv("AI_PLAN_CHUNK_RETRIES", "1"))
+        self.AI_PLAN_CYCLE_DAYS: int = int(os.getenv("AI_PLAN_CYCLE_DAYS", "7"))
+
+        # Plan engine: "local" builds plans from the IFCT 2017 table, "ai"
+        # asks Gemini for the whole plan. PLAN_AI_ENRICH lets Gemini rewrite
+        # the descriptions of locally built meals.
+        self.PLAN_ENGINE: str = os.getenv("PLAN_ENGINE", "local").lower()
+        self.PLAN_AI_ENRICH: bool = _env_bool("PLAN_AI_ENRICH", False)
+
+        # Password hashing. Stored hashes with fewer rounds are upgraded to
+        # PASSWORD_BCRYPT_ROUNDS after a successful login. bcrypt runs on
+        # PASSWORD_HASH_WORKERS threads; beyond PASSWORD_HASH_MAX_PENDING
+        # queued calls, logins get 503.
+        self.PASSWORD_BCRYPT_ROUNDS: int = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", "12"))
+        self.PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+        self.PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+        # Auth: verified tokens are cached until their exp (capped at
+        # AUTH_TOKEN_CACHE_TTL_SECONDS); user records for a short TTL.
+        self.AUTH_TOKEN_CACHE_SIZE: int = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "4096"))
+        self.AUTH_TOKEN_CACHE_TTL_SECONDS: float = float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "900"))
+        self.AUTH_USER_CACHE_SIZE: int = int(os.getenv("AUTH_USER_CACHE_SIZE", "4096"))
+        self.AUTH_USER_CACHE_TTL_SECONDS: float = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60"))
+
+        # Where new plans keep their meals: "json" (nutrition_plans.days) or
+        # "tables" (plan_days / plan_meals). With "tables", existing JSON
+        # plans are moved over at startup unless PLAN_STORAGE_MIGRATE is off.
+        self.PLAN_STORAGE: str = os.getenv("PLAN_STORAGE", "json").lower()
+        self.PLAN_STORAGE_MIGRATE: bool = _env_bool("PLAN_STORAGE_MIGRATE", True)
+
+        # Stored BMI / BMR / TDEE are recomputed for every profile whose age
+        # changed once a day at ENERGY_METRICS_REFRESH_HOUR (UTC; -1: never).
+        self.ENERGY_METRICS_REFRESH_HOUR: int = int(os.getenv("ENERGY_METRICS_REFRESH_HOUR", "3"))
+        self.ENERGY_METRICS_BATCH_SIZE: int = int(os.getenv("ENERGY_METRICS_BATCH_SIZE", "1000"))
+
+        # Longest plan (days) a generate request may ask for.
+        self.PLAN_MAX_DURATION_DAYS: int = int(os.getenv("PLAN_MAX_DURATION_DAYS", "90"))
+
+        # Generated meals whose stated macros are further than this fraction
+        # from the recomputed values are corrected (see plan_validation).
+        self.PLAN_MACRO_TOLERANCE: float = float(os.getenv("PLAN_MACRO_TOLERANCE", "0.15"))
+
+        # Background plan generation (POST /plans/jobs).
+        self.PLAN_JOB_BACKEND: str = os.getenv("PLAN_JOB_BACKEND", "memory")
+        self.PLAN_JOB_WORKERS: int = int(os.getenv("PLAN_JOB_WORKERS", "4"))
+        self.PLAN_JOB_RETENTION_SECONDS: float = float(
+            os.getenv("PLAN_JOB_RETENTION_SECONDS", "3600")
+        )
+
+        # Responses of at least RESPONSE_COMPRESSION_MIN_BYTES are brotli
+        # (if installed) or gzip compressed when the client accepts it.
+        self.RESPONSE_COMPRESSION_MIN_BYTES: int = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+        self.RESPONSE_GZIP_LEVEL: int = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+        self.RESPONSE_BROTLI_QUALITY: int = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+
+        # Cached GET /plans and onboarding responses, revalidated by ETag.
+        # RESPONSE_CACHE_SQLITE_PATH shares the cache between workers.
+        self.RESPONSE_CACHE_ENABLED: bool = _env_bool("RESPONSE_CACHE_ENABLED", True)
+        self.RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+        self.RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+        self.RESPONSE_CACHE_SQLITE_PATH: Optional[str] = os.getenv("RESPONSE_CACHE_SQLITE_PATH")
+
+        # Cache for AI plan/swap responses. AI_CACHE_SQLITE_PATH enables the
+        # persistent tier; AI_CACHE_TDEE_BUCKET is the kcal band width used
+        # when keying plans.
+        self.AI_CACHE_ENABLED: bool = _env_bool("AI_CACHE_ENABLED", True)
+        self.AI_CACHE_MAX_ENTRIES: int = int(os.getenv("AI_CACHE_MAX_ENTRIES", "512"))
+        self.AI_CACHE_TTL_SECONDS: float = float(os.getenv("AI_CACHE_TTL_SECONDS", "86400"))
+        self.AI_CACHE_SQLITE_PATH: Optional[str] = os.getenv("AI_CACHE_SQLITE_PATH")
+        self.AI_CACHE_TDEE_BUCKET: float = float(os.getenv("AI_CACHE_TDEE_BUCKET", "100"))
+
 
 settings = Settings()
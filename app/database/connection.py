@@ -1,29 +1,107 @@
+import asyncio
 import ssl
+import uuid
 from collections.abc import AsyncGenerator
+from typing import Optional
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.config import settings
+from app.utils.lru import LRUCache
 
 
-raw_url = settings.DATABASE_URL
+def _async_url(url: str) -> str:
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql+asyncpg://")
 
-if raw_url.startswith("postgres://"):
-    raw_url = raw_url.replace("postgres://", "postgresql+asyncpg://")
+    if url.startswith("postgresql://") and "+asyncpg" not in url:
+        url = url.replace("postgresql://", "postgresql+asyncpg://")
+    return url
 
-if raw_url.startswith("postgresql://") and "+asyncpg" not in raw_url:
-    raw_url = raw_url.replace("postgresql://", "postgresql+asyncpg://")
+
+raw_url = _async_url(settings.DATABASE_URL)
 
 ssl_context = ssl.create_default_context()
 ssl_context.check_hostname = False
 ssl_context.verify_mode = ssl.CERT_NONE  # Required for Supabase local connections
 
-engine = create_async_engine(
-    raw_url,
-    echo=False,
-    connect_args={"ssl": ssl_context}
-)
+
+def _connect_args() -> dict:
+    args = {"ssl": ssl_context, "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    if settings.DB_PGBOUNCER:
+        # PgBouncer in transaction mode hands each transaction to any
+        # server connection, so named prepared statements can't be reused
+        # (or even kept unique) across them.
+        args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=lambda: f"__asyncpg_{uuid.uuid4()}__",
+        )
+    return args
+
+
+class PoolMetrics:
+    """Connection lifecycle counters, fed by pool events."""
+
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        self.counters = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0}
+        for name, key in (
+            ("connect", "connects"), ("checkout", "checkouts"),
+            ("checkin", "checkins"), ("invalidate", "invalidations"),
+        ):
+            event.listen(engine.sync_engine, name, self._counter(key))
+
+    def _counter(self, key: str):
+        def count(*args) -> None:
+            self.counters[key] += 1
+        return count
+
+    def stats(self) -> dict:
+        pool = self.engine.sync_engine.pool
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "timeout": settings.DB_POOL_TIMEOUT,
+            **self.counters,
+        }
+
+
+def make_engine(url: str) -> AsyncEngine:
+    return create_async_engine(
+        url,
+        echo=False,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=_connect_args(),
+    )
+
+
+async def warm_up(engine: AsyncEngine, connections: int) -> None:
+    """Open ``connections`` pooled connections up front, so the first
+    requests after a deploy don't each pay for a TLS handshake."""
+    connections = min(connections, settings.DB_POOL_SIZE)
+    if connections <= 0:
+        return
+    conns = []
+    try:
+        conns = await asyncio.gather(*(engine.connect().start() for _ in range(connections)))
+        await asyncio.gather(*(c.execute(text("SELECT 1")) for c in conns))
+    finally:
+        await asyncio.gather(*(c.close() for c in conns))
+
+
+engine = make_engine(raw_url)
+pool_metrics = PoolMetrics(engine)
 
 async_session = sessionmaker(
     bind=engine,
@@ -31,8 +109,50 @@ async_session = sessionmaker(
     expire_on_commit=False,
 )
 
+# Read replica: without DATABASE_REPLICA_URL reads share the primary
+replica_engine: Optional[AsyncEngine] = (
+    make_engine(_async_url(settings.DATABASE_REPLICA_URL)) if settings.DATABASE_REPLICA_URL else None
+)
+replica_metrics: Optional[PoolMetrics] = PoolMetrics(replica_engine) if replica_engine else None
+
+read_session = sessionmaker(
+    bind=replica_engine or engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+)
+
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """Yield a database session for the duration of a request."""
     async with async_session() as session:
         yield session
+
+
+# ---------------------------------------------------
+# Read-your-writes
+# ---------------------------------------------------
+# user id -> True while their reads must stay on the primary. Kept per
+# worker, so with several workers a read served by a different one than
+# the write can still see replica lag.
+_recent_writers = LRUCache(10_000, ttl=settings.DB_READ_STICKY_SECONDS)
+
+
+def mark_written(user_id) -> None:
+    """Record a committed write by ``user_id``; their reads go to the
+    primary for the next DB_READ_STICKY_SECONDS."""
+    if replica_engine is not None and user_id:
+        _recent_writers.set(str(user_id), True)
+
+
+def reads_from_primary(user_id) -> bool:
+    return replica_engine is None or (bool(user_id) and _recent_writers.get(str(user_id)) is not None)
+
+
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """Like ``get_db``, but on the replica when one is configured. Routes
+    with a ``{user_id}`` path read from the primary right after that
+    user's own writes."""
+    user_id = request.path_params.get("user_id")
+    maker = async_session if reads_from_primary(user_id) else read_session
+    async with maker() as session:
+        yield session
@@ -0,0 +1,73 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+
+# ---------------------------------------------------
+# In-place upgrades for tables created by older versions.
+# create_all() only creates missing tables, so column changes
+# are applied here; every statement is safe to re-run.
+# ---------------------------------------------------
+MIGRATIONS = (
+    # nutrition_plans.days: JSON -> JSONB (enables jsonb_set updates)
+    """
+    DO $$
+    BEGIN
+        IF (SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'nutrition_plans' AND column_name = 'days') = 'json' THEN
+            ALTER TABLE nutrition_plans ALTER COLUMN days TYPE jsonb USING days::jsonb;
+        END IF;
+    END $$
+    """,
+    "ALTER TABLE nutrition_plans ADD COLUMN IF NOT EXISTS meal_index jsonb",
+    "ALTER TABLE nutrition_plans ADD COLUMN IF NOT EXISTS storage varchar DEFAULT 'json'",
+    "ALTER TABLE nutrition_plans ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 0",
+    "ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 0",
+    "ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS bmi double precision",
+    "ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS bmr integer",
+    "ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS tdee integer",
+    "ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS metrics_age integer",
+    "ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS metrics_on date",
+    "ALTER TABLE nutrition_plans ADD COLUMN IF NOT EXISTS meal_status_ts jsonb",
+    "ALTER TABLE plan_meals ADD COLUMN IF NOT EXISTS status_updated_at timestamptz",
+    # nutrition_plans.created_at: ISO string (naive UTC) -> timestamptz
+    """
+    DO $$
+    BEGIN
+        IF (SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'nutrition_plans' AND column_name = 'created_at') = 'character varying' THEN
+            ALTER TABLE nutrition_plans ALTER COLUMN created_at TYPE timestamptz
+                USING COALESCE(NULLIF(created_at, '')::timestamp AT TIME ZONE 'UTC', now());
+            ALTER TABLE nutrition_plans ALTER COLUMN created_at SET DEFAULT now();
+            ALTER TABLE nutrition_plans ALTER COLUMN created_at SET NOT NULL;
+        END IF;
+    END $$
+    """,
+    # Keep only each user's newest active plan active
+    """
+    UPDATE nutrition_plans p SET status = 'archived'
+    WHERE p.status = 'active' AND EXISTS (
+        SELECT 1 FROM nutrition_plans newer
+        WHERE newer.user_id = p.user_id AND newer.status = 'active'
+          AND (newer.created_at, newer.id) > (p.created_at, p.id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_nutrition_plans_user_status_created"
+    " ON nutrition_plans (user_id, status, created_at DESC)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_nutrition_plans_one_active"
+    " ON nutrition_plans (user_id) WHERE status = 'active'",
+    # Build the meal id -> [day, meal] index for existing plans
+    """
+    UPDATE nutrition_plans p SET meal_index = COALESCE((
+        SELECT jsonb_object_agg(m.meal ->> 'id', jsonb_build_array(d.i - 1, m.j - 1))
+        FROM jsonb_array_elements(p.days) WITH ORDINALITY AS d(day, i),
+             jsonb_array_elements(d.day -> 'meals') WITH ORDINALITY AS m(meal, j)
+        WHERE m.meal ? 'id'
+    ), '{}'::jsonb)
+    WHERE p.meal_index IS NULL
+    """,
+)
+
+
+async def run_migrations(conn: AsyncConnection) -> None:
+    for statement in MIGRATIONS:
+        await conn.execute(text(statement))
@@ -1,9 +1,22 @@
-from fastapi import FastAPI
-from app.routes import users, onboarding, plans
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app.routes import users, onboarding, plans, metrics, foods
 from fastapi.middleware.cors import CORSMiddleware
 from app.database.base import Base
-from app.database.connection import engine
-app = FastAPI(title="AI Nutrition Backend")
+from app.config import settings
+from app.database.connection import async_session, engine, replica_engine, warm_up
+from app.database.migrations import run_migrations
+from app.services.ai_client import AIServiceError, AITimeoutError, AIUnavailableError, ai_client
+from app.services.food_search import get_food_search
+from app.services.plan_jobs import plan_job_queue
+from app.services.plan_store import fail_stale_plans
+from app.services.profile_metrics import start_nightly_refresh, stop_nightly_refresh
+from app.services.plan_tables import migrate_json_plans
+from app.services.plan_validation import PlanValidationError
+from app.utils.compression import CompressionMiddleware
+from app.utils.hashing import HasherBusyError
+from app.utils.responses import ORJSONResponse
+app = FastAPI(title="AI Nutrition Backend", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,17 +25,79 @@ app.add_middleware(
     allow_methods=["*"], 
     allow_headers=["*"], 
 )
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.RESPONSE_COMPRESSION_MIN_BYTES,
+    compresslevel=settings.RESPONSE_GZIP_LEVEL,
+    brotli_quality=settings.RESPONSE_BROTLI_QUALITY,
+)
 
 # register routers
 app.include_router(onboarding.router, prefix="/onboarding")
 app.include_router(plans.router, prefix="/plans")
 app.include_router(users.router, prefix="/users")
+app.include_router(foods.router, prefix="/foods")
+app.include_router(metrics.router, prefix="/metrics")
+
+@app.exception_handler(AITimeoutError)
+async def ai_timeout_handler(request: Request, exc: AITimeoutError):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+@app.exception_handler(AIUnavailableError)
+async def ai_unavailable_handler(request: Request, exc: AIUnavailableError):
+    retry_after = max(1, round(ai_client.breaker.retry_after()))
+    return JSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(retry_after)}
+    )
+
+
+@app.exception_handler(AIServiceError)
+async def ai_error_handler(request: Request, exc: AIServiceError):
+    return JSONResponse(status_code=502, content={"detail": str(exc)})
+
+
+@app.exception_handler(PlanValidationError)
+async def plan_validation_handler(request: Request, exc: PlanValidationError):
+    return JSONResponse(
+        status_code=422, content={"detail": str(exc), "violations": exc.violations}
+    )
+
+
+@app.exception_handler(HasherBusyError)
+async def hasher_busy_handler(request: Request, exc: HasherBusyError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 
 @app.on_event("startup")
 async def on_startup() -> None:
     # Ensure database tables exist before handling requests
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
+
+    if settings.PLAN_STORAGE == "tables" and settings.PLAN_STORAGE_MIGRATE:
+        async with async_session() as db:
+            await migrate_json_plans(db)
+
+    async with async_session() as db:
+        await fail_stale_plans(db)
+
+    await warm_up(engine, settings.DB_POOL_WARMUP)
+    if replica_engine is not None:
+        await warm_up(replica_engine, settings.DB_POOL_WARMUP)
+
+    # Parse the IFCT table and build its search index once, before the
+    # first plan or /foods request
+    get_food_search()
+    await plan_job_queue.start()
+    start_nightly_refresh()
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await plan_job_queue.stop()
+    await stop_nightly_refresh()
 
 
 @app.get("/")
@@ -0,0 +1,46 @@
+from sqlalchemy import Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, String
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from app.database.base import Base
+
+
+# Normalized storage for plans with storage == "tables" (PLAN_STORAGE).
+# Keys the generated JSON carries that have no column here go to ``extra``.
+class PlanDay(Base):
+    __tablename__ = "plan_days"
+
+    plan_id = Column(UUID(as_uuid=True), ForeignKey("nutrition_plans.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Integer, primary_key=True)
+    date = Column(Date)
+    tag = Column(String)
+    extra = Column(JSONB)
+
+
+class PlanMeal(Base):
+    __tablename__ = "plan_meals"
+
+    plan_id = Column(UUID(as_uuid=True), ForeignKey("nutrition_plans.id", ondelete="CASCADE"), primary_key=True)
+    meal_id = Column(String, primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+
+    day = Column(Integer, nullable=False)
+    position = Column(Integer, nullable=False)
+    date = Column(Date)
+
+    time = Column(String)
+    name = Column(String)
+    description = Column(String)
+    calories = Column(Float)
+    protein = Column(Float)
+    carbs = Column(Float)
+    fats = Column(Float)
+    status = Column(String, default="pending")
+    status_updated_at = Column(DateTime(timezone=True))
+    is_swapped = Column(Boolean, default=False)
+    extra = Column(JSONB)
+
+    __table_args__ = (
+        # (plan_id, meal_id) is the primary key; this one serves adherence
+        # queries such as "meals eaten by a user per day"
+        Index("ix_plan_meals_user_status_date", "user_id", "status", "date"),
+        Index("ix_plan_meals_plan_day", "plan_id", "day", "position"),
+    )
@@ -1,6 +1,7 @@
 import uuid
-from sqlalchemy import Column, String, Integer, JSON, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, DateTime, String, Integer, ForeignKey, Index, text
+from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 from app.database.base import Base
 
@@ -16,9 +17,29 @@ class NutritionPlan(Base):
     duration = Column(Integer, nullable=False)
     status = Column(String, default="active")
 
-    days = Column(JSON, nullable=False)
+    days = Column(JSONB, nullable=False)
+    # meal id -> [day index, meal index] into ``days``, so single meals can
+    # be updated in place with jsonb_set (see services/plan_store.py)
+    meal_index = Column(JSONB)
+    # meal id -> epoch seconds of its last status change, so offline
+    # clients' changes resolve last-writer-wins (see set_meal_statuses)
+    meal_status_ts = Column(JSONB)
+    # "json": meals live in ``days``; "tables": in plan_days / plan_meals
+    storage = Column(String, default="json", server_default="json")
+    # Bumped by every change to the plan's meals; part of the GET ETag
+    version = Column(Integer, nullable=False, default=0, server_default="0")
 
-    created_at = Column(String)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     startDate = Column(String)
 
     user = relationship("User", backref="nutrition_plans")
+
+    __table_args__ = (
+        # "latest active plan" is one index probe
+        Index("ix_nutrition_plans_user_status_created", user_id, status, created_at.desc()),
+        # at most one active plan per user (create_plan archives the old one)
+        Index(
+            "uq_nutrition_plans_one_active", user_id,
+            unique=True, postgresql_where=text("status = 'active'"),
+        ),
+    )
@@ -15,5 +15,14 @@ class UserProfile(Base):
     activity_level = Column(String)
     kitchen_type = Column(String)
     water_target_liters = Column(Float)
+    # BMI / BMR / TDEE as of the last save or nightly refresh (see
+    # profile_metrics); metrics_age is the age they were computed for
+    bmi = Column(Float)
+    bmr = Column(Integer)
+    tdee = Column(Integer)
+    metrics_age = Column(Integer)
+    metrics_on = Column(Date)
+    # Bumped by every onboarding save; part of the GET ETag
+    version = Column(Integer, nullable=False, default=0, server_default="0")
 
     user = relationship("User", backref="profile")
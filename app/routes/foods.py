@@ -0,0 +1,102 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.schemas.foods import NutrientTotalsRequest
+from app.services.food_search import get_food_search
+from app.services.food_store import get_food_store
+
+
+router = APIRouter(tags=["Foods"])
+
+
+def _split(values: Optional[str]):
+    return [v.strip() for v in values.split(",") if v.strip()] if values else None
+
+
+# ----------------------------------------------------------
+# 1) List foods (optionally one IFCT group, e.g. ?group=B)
+# ----------------------------------------------------------
+@router.get("")
+async def list_foods(
+    group: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=600),
+    offset: int = Query(0, ge=0),
+):
+    store = get_food_store()
+    rows = [
+        i for i, g in enumerate(store.groups)
+        if not group or g == group.upper()
+    ]
+    return {
+        "total": len(rows),
+        "foods": [store.summary(i) for i in rows[offset:offset + limit]],
+    }
+
+
+# ----------------------------------------------------------
+# 2) Fuzzy search over IFCT names and scientific names
+# ----------------------------------------------------------
+@router.get("/search")
+async def search_foods(
+    q: str = Query(..., min_length=1),
+    k: int = Query(10, ge=1, le=50),
+):
+    index = get_food_search()
+    return {
+        "query": q,
+        "foods": [
+            {**index.store.summary(row), "score": score}
+            for row, score in index.search(q, k=k)
+        ],
+    }
+
+
+# ----------------------------------------------------------
+# 3) Top-k foods by a nutrient, e.g. ?nutrient=protein&per=calories
+# ----------------------------------------------------------
+@router.get("/top")
+async def top_foods(
+    nutrient: str,
+    per: Optional[str] = None,
+    k: int = Query(10, ge=1, le=100),
+    groups: Optional[str] = None,
+):
+    try:
+        foods = get_food_store().top_k(nutrient, k=k, per=per, groups=groups)
+    except KeyError as exc:
+        raise HTTPException(400, exc.args[0])
+    return {"nutrient": nutrient, "per": per, "foods": foods}
+
+
+# ----------------------------------------------------------
+# 4) Nutrient totals for a list of (code, grams)
+# ----------------------------------------------------------
+@router.post("/totals")
+async def food_totals(body: NutrientTotalsRequest):
+    store = get_food_store()
+    items = [(item.code.upper(), item.grams) for item in body.items]
+
+    unknown = [code for code, _ in items if code not in store]
+    if unknown:
+        raise HTTPException(404, f"Unknown food codes: {unknown}")
+
+    try:
+        return store.totals(items, nutrients=body.nutrients)
+    except KeyError as exc:
+        raise HTTPException(400, exc.args[0])
+
+
+# ----------------------------------------------------------
+# 5) One food by IFCT code (?nutrients=protcnt,fatce&errors=true)
+# ----------------------------------------------------------
+@router.get("/{code}")
+async def get_food(code: str, nutrients: Optional[str] = None, errors: bool = False):
+    store = get_food_store()
+    if code.upper() not in store:
+        raise HTTPException(404, "Food not found")
+
+    try:
+        return store.food(code.upper(), nutrients=_split(nutrients), errors=errors)
+    except KeyError as exc:
+        raise HTTPException(400, exc.args[0])
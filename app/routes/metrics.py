@@ -0,0 +1,36 @@
+from fastapi import APIRouter
+
+from app.database.connection import pool_metrics, replica_metrics
+from app.services.ai_cache import ai_cache
+from app.services.ai_client import ai_client
+from app.services.response_cache import response_cache
+from app.utils.hashing import password_hasher
+
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/ai")
+async def ai_metrics() -> dict:
+    return {
+        "client": ai_client.stats(),
+        "cache": ai_cache.stats(),
+    }
+
+
+@router.get("/responses")
+async def response_cache_metrics() -> dict:
+    return {"cache": response_cache.stats()}
+
+
+@router.get("/auth")
+async def auth_metrics() -> dict:
+    return {"password_hasher": password_hasher.stats()}
+
+
+@router.get("/db")
+async def db_metrics() -> dict:
+    return {
+        "pool": pool_metrics.stats(),
+        "replica": replica_metrics.stats() if replica_metrics else None,
+    }
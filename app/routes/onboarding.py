@@ -1,11 +1,16 @@
 from datetime import date, datetime
 from typing import Any, Dict
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.connection import get_db
+from app.database.connection import get_db, get_read_db, mark_written
+from app.services.profile_metrics import metric_values, stored_metrics
+from app.services.response_cache import conditional_response, invalidate_user, onboarding_key
+from app.utils.auth import AuthContext, require_user
 from app.models.users import User
 from app.models.profiles import UserProfile
 from app.models.athlete_meta import AthleteMeta
@@ -15,6 +20,38 @@ from app.models.dietary_preferences import DietaryPreferences
 router = APIRouter(prefix="/api/onboarding", tags=["Onboarding"])
 
 
+def _upsert(model, user_id: str, values: Dict[str, Any]):
+    """INSERT ... ON CONFLICT (user_id) DO UPDATE for a one-row-per-user table."""
+    # Versioned tables start at 1 (0 means "no row yet") and count up
+    versioned = "version" in model.__table__.c
+    stmt = pg_insert(model).values(user_id=user_id, **values, **({"version": 1} if versioned else {}))
+    set_ = {key: stmt.excluded[key] for key in values}
+    if versioned:
+        set_["version"] = model.version + 1
+    return stmt.on_conflict_do_update(index_elements=[model.user_id], set_=set_)
+
+
+# Postgres' default names for the three user_id -> users.id foreign keys
+_USER_FKEYS = {
+    f"{model.__tablename__}_user_id_fkey" for model in (UserProfile, AthleteMeta, DietaryPreferences)
+}
+
+
+def _missing_user(exc: IntegrityError) -> bool:
+    """True if an upsert failed only because the user doesn't exist (a
+    foreign-key violation on users), not for any other constraint."""
+    orig = exc.orig
+    return (
+        getattr(orig, "sqlstate", None) == "23503"
+        and getattr(orig.__cause__, "constraint_name", None) in _USER_FKEYS
+    )
+
+
+def onboarding_etag(user_id: str, version) -> str:
+    # Age, and so BMR / TDEE, depend on today's date
+    return f'"onboarding-{user_id}-{version or 0}-{date.today().isoformat()}"'
+
+
 # ------------------------------------------------------
 #  POST /complete/{user_id}
 #  → Saves onboarding questionnaire answers
@@ -24,15 +61,10 @@ router = APIRouter(prefix="/api/onboarding", tags=["Onboarding"])
 async def complete_onboarding(
     user_id: str,
     body: Dict[str, Any],
+    auth: AuthContext = Depends(require_user),
     db: AsyncSession = Depends(get_db),
 ):
 
-    # Validate user existence
-    q_user = await db.execute(select(User).where(User.id == user_id))
-    user = q_user.scalar_one_or_none()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     # --------------------------------------------------
     # Parse DOB
     # --------------------------------------------------
@@ -46,198 +78,140 @@ async def complete_onboarding(
     # --------------------------------------------------
     # 1️⃣ Save PHYSICAL PROFILE
     # --------------------------------------------------
-    q_profile = await db.execute(select(UserProfile).where(UserProfile.user_id == user_id))
-    profile = q_profile.scalar_one_or_none()
-
-    if profile:
-        profile.gender = body.get("gender") # type: ignore
-        profile.dob = dob_value # type: ignore
-        profile.height_cm = body.get("height_cm") # type: ignore
-        profile.current_weight_kg = body.get("current_weight_kg") # type: ignore
-        profile.activity_level = body.get("activity_level") # type: ignore
-        profile.kitchen_type = body.get("kitchen_type") # type: ignore
-        profile.water_target_liters = body.get("water_target_liters") # type: ignore
-    else:
-        profile = UserProfile(
-            user_id=user_id,
-            gender=body.get("gender"),
-            dob=dob_value,
-            height_cm=body.get("height_cm"),
-            current_weight_kg=body.get("current_weight_kg"),
-            activity_level=body.get("activity_level"),
-            kitchen_type=body.get("kitchen_type"),
-            water_target_liters=body.get("water_target_liters"),
-        )
-        db.add(profile)
+    profile_values = {
+        "gender": body.get("gender"),
+        "dob": dob_value,
+        "height_cm": body.get("height_cm"),
+        "current_weight_kg": body.get("current_weight_kg"),
+        "activity_level": body.get("activity_level"),
+        "kitchen_type": body.get("kitchen_type"),
+        "water_target_liters": body.get("water_target_liters"),
+    }
 
     # --------------------------------------------------
-    # Compute BMI / BMR / TDEE
+    # Compute BMI / BMR / TDEE, stored with the profile
     # --------------------------------------------------
-    height = body.get("height_cm")
-    weight = body.get("current_weight_kg")
-    gender = body.get("gender")
-    activity = body.get("activity_level")
-
-    # BMI
-    bmi = None
-    if height and weight:
-        h_m = height / 100
-        if h_m > 0:
-            bmi = round(weight / (h_m * h_m), 2)
-
-    # AGE
-    age = None
-    if dob_value:
-        today = date.today()
-        age = today.year - dob_value.year - ((today.month, today.day) < (dob_value.month, dob_value.day))
-
-    # BMR
-    bmr = None
-    if gender and height and weight and age is not None:
-        if gender.lower() == "male":
-            bmr = 10 * weight + 6.25 * height - 5 * age + 5
-        else:
-            bmr = 10 * weight + 6.25 * height - 5 * age - 161
-
-    # Activity multipliers
-    activity_map = {
-        "sedentary": 1.2,
-        "light": 1.375,
-        "active": 1.55,
-        "very_active": 1.725,
-    }
-
-    multiplier = activity_map.get(str(activity).lower(), 1.2)
-
-    # TDEE
-    tdee = round(bmr * multiplier) if bmr else None
+    metrics = metric_values(
+        body.get("gender"),
+        dob_value,
+        body.get("height_cm"),
+        body.get("current_weight_kg"),
+        body.get("activity_level"),
+    )
+    profile_values.update(metrics)
 
     # --------------------------------------------------
     # 2️⃣ Save ATHLETE OR LIFESTYLE DATA
     # --------------------------------------------------
     user_type = body.get("what_drives_you")  # Athlete / Lifestyle
 
-    q_meta = await db.execute(select(AthleteMeta).where(AthleteMeta.user_id == user_id))
-    meta = q_meta.scalar_one_or_none()
-
     # Select correct field: athlete uses phase, lifestyle uses primary_goal
     phase_or_goal = (
         body.get("phase") if user_type == "Athlete"
         else body.get("primary_goal")
     )
 
-    if meta:
-        meta.is_athlete = (user_type == "Athlete") # type: ignore
-        meta.sport = body.get("sport") # type: ignore
-        meta.position_role = body.get("role") # type: ignore
-        meta.current_phase = phase_or_goal # type: ignore
-    else:
-        meta = AthleteMeta(
-            user_id=user_id,
-            is_athlete=(user_type == "Athlete"),
-            sport=body.get("sport"),
-            position_role=body.get("role"),
-            current_phase=phase_or_goal,
-        )
-        db.add(meta)
+    meta_values = {
+        "is_athlete": (user_type == "Athlete"),
+        "sport": body.get("sport"),
+        "position_role": body.get("role"),
+        "current_phase": phase_or_goal,
+    }
 
     # --------------------------------------------------
     # 3️⃣ Save DIETARY PREFERENCES
     # --------------------------------------------------
-    q_prefs = await db.execute(select(DietaryPreferences).where(DietaryPreferences.user_id == user_id))
-    prefs = q_prefs.scalar_one_or_none()
+    prefs_values = {
+        "diet_type": body.get("diet_type"),
+        "allergies": body.get("allergies"),
+        "dislikes": body.get("dislikes"),
+        "medical_conditions": body.get("medical_conditions"),
+        "supplements_stack": body.get("supplements_stack"),
+    }
 
-    if prefs:
-        prefs.diet_type = body.get("diet_type") # type: ignore
-        prefs.allergies = body.get("allergies") # type: ignore
-        prefs.dislikes = body.get("dislikes") # type: ignore
-        prefs.medical_conditions = body.get("medical_conditions") # type: ignore
-        prefs.supplements_stack = body.get("supplements_stack") # type: ignore
-    else: 
-        prefs = DietaryPreferences(
-            user_id=user_id,
-            diet_type=body.get("diet_type"),
-            allergies=body.get("allergies"),
-            dislikes=body.get("dislikes"),
-            medical_conditions=body.get("medical_conditions"),
-            supplements_stack=body.get("supplements_stack"),
+    # --------------------------------------------------
+    # Write all three rows in one statement: each upsert is a
+    # data-modifying CTE, so this is a single round trip. A missing
+    # user fails the foreign keys.
+    # --------------------------------------------------
+    profile_cte, meta_cte, prefs_cte = (
+        _upsert(model, user_id, values).returning(model.user_id).cte(name)
+        for name, model, values in (
+            ("profile_upsert", UserProfile, profile_values),
+            ("meta_upsert", AthleteMeta, meta_values),
+            ("prefs_upsert", DietaryPreferences, prefs_values),
         )
-        db.add(prefs)
-
-    await db.commit()
+    )
+    written = (
+        select(profile_cte.c.user_id)
+        .join(meta_cte, meta_cte.c.user_id == profile_cte.c.user_id)
+        .join(prefs_cte, prefs_cte.c.user_id == profile_cte.c.user_id)
+    )
+    try:
+        await db.execute(written)
+        await db.commit()
+    except IntegrityError as exc:
+        await db.rollback()
+        if not _missing_user(exc):
+            raise
+        raise HTTPException(status_code=404, detail="User not found")
+    mark_written(user_id)
+    await invalidate_user(user_id)
 
     return {
         "message": "Onboarding completed successfully",
-        "bmi": bmi,
-        "bmr": round(bmr) if bmr else None,
-        "tdee": tdee,
+        "bmi": metrics["bmi"],
+        "bmr": metrics["bmr"],
+        "tdee": metrics["tdee"],
     }
 
 
 # ------------------------------------------------------
 #  GET /{user_id}
 #  → Returns ALL onboarding data merged
+#  → ETag / If-None-Match: 304 when nothing changed
 # ------------------------------------------------------
 @router.get("/{user_id}")
 async def get_onboarding(
     user_id: str,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    auth: AuthContext = Depends(require_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
+    # Current version from two primary-key lookups; the full load only
+    # runs when neither the client nor the cache has it
+    q = await db.execute(
+        select(UserProfile.version)
+        .select_from(User)
+        .outerjoin(UserProfile, UserProfile.user_id == User.id)
+        .where(User.id == user_id)
+    )
+    row = q.one_or_none()
+    etag = onboarding_etag(user_id, row.version) if row else None
 
-    # User
-    q_user = await db.execute(select(User).where(User.id == user_id))
-    user = q_user.scalar_one_or_none()
-    if not user:
-        raise HTTPException(404, "User not found")
-
-    # Profile
-    q_profile = await db.execute(select(UserProfile).where(UserProfile.user_id == user_id))
-    profile = q_profile.scalar_one_or_none()
-
-    # Athlete/Lifestyle
-    q_meta = await db.execute(select(AthleteMeta).where(AthleteMeta.user_id == user_id))
-    meta = q_meta.scalar_one_or_none()
-
-    # Dietary preferences
-    q_prefs = await db.execute(select(DietaryPreferences).where(DietaryPreferences.user_id == user_id))
-    prefs = q_prefs.scalar_one_or_none()
-
-    # Recompute BMI/BMR/TDEE for display
-    bmi = None
-    bmr = None
-    tdee = None
-
-    if profile and profile.height_cm and profile.current_weight_kg: # type: ignore
-        h_m = profile.height_cm / 100
-        if h_m > 0: # type: ignore
-            bmi = round(profile.current_weight_kg / (h_m * h_m), 1) # type: ignore
+    return await conditional_response(
+        request, onboarding_key(user_id), etag, lambda: _load_onboarding(db, user_id)
+    )
 
-    # AGE
-    age = None
-    if profile and profile.dob: # type: ignore
-        today = date.today()
-        age = today.year - profile.dob.year - ((today.month, today.day) < (profile.dob.month, profile.dob.day))
 
-    # BMR + TDEE
-    if profile and age is not None:
-        if profile.gender and profile.height_cm and profile.current_weight_kg: # type: ignore
-            gender_norm = profile.gender.lower()
-            if gender_norm == "male":
-                bmr = 10 * profile.current_weight_kg + 6.25 * profile.height_cm - 5 * age + 5
-            else:
-                bmr = 10 * profile.current_weight_kg + 6.25 * profile.height_cm - 5 * age - 161
+async def _load_onboarding(db: AsyncSession, user_id: str):
+    """(ETag, merged onboarding data) of one user."""
+    # User and the three onboarding rows in one joined query
+    q = await db.execute(
+        select(User, UserProfile, AthleteMeta, DietaryPreferences)
+        .outerjoin(UserProfile, UserProfile.user_id == User.id)
+        .outerjoin(AthleteMeta, AthleteMeta.user_id == User.id)
+        .outerjoin(DietaryPreferences, DietaryPreferences.user_id == User.id)
+        .where(User.id == user_id)
+    )
+    row = q.one_or_none()
+    if not row:
+        raise HTTPException(404, "User not found")
+    user, profile, meta, prefs = row
 
-            activity_map = {
-                "sedentary": 1.2,
-                "light": 1.375,
-                "active": 1.55,
-                "very_active": 1.725,
-            }
-            factor = activity_map.get(str(profile.activity_level).lower(), 1.2)
-            tdee = round(bmr * factor)
-            bmr = round(bmr)
+    metrics = stored_metrics(profile) if profile else {"bmi": None, "bmr": None, "tdee": None}
 
-    return {
+    return onboarding_etag(user_id, profile.version if profile else 0), {
         "user": {
             "id": str(user.id),
             "email": user.email,
@@ -257,9 +231,7 @@ async def get_onboarding(
             "sport": meta.sport if meta else None,
             "role": meta.position_role if meta else None,
             "phase_or_goal": meta.current_phase if meta else None,
-            "bmi": bmi,
-            "bmr": bmr,
-            "tdee": tdee,
+            **metrics,
         },
         "dietary_preferences": {
             "diet_type": prefs.diet_type if prefs else None,
@@ -1,90 +1,213 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import logging
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
-from datetime import datetime
+from datetime import date
+from typing import List, Optional
 import uuid
 
-from app.database.connection import get_db
-from app.models.plans import NutritionPlan
-from app.schemas.plans import GeneratePlanRequest,SwapMealRequest
-from app.services.ai_service import generate_plan_ai, generate_swap_ai
-
+import orjson
+
+from app.database.connection import async_session, get_db, get_read_db
+from app.schemas.plans import GeneratePlanRequest, MealStatusChange, SwapMealRequest
+from app.services.ai_client import AIServiceError, AITimeoutError, AIUnavailableError
+from app.services.ai_service import generate_swap_ai, generate_swaps_ai
+from app.services.plan_jobs import FINISHED, plan_job_queue
+from app.services import plan_service
+from app.services.plan_validation import PlanValidationError
+from app.services.response_cache import conditional_response, plan_key
+from app.services.plan_store import (
+    activate_plan,
+    active_plan_etag,
+    append_days,
+    create_plan,
+    fail_plan,
+    latest_active_plan,
+    load_days,
+    plan_avoided_terms,
+    PlanWindow,
+    plan_etag,
+    plan_exists,
+    remove_plan,
+    replace_meal,
+    replace_meals,
+    serialize_plan,
+    set_meal_status,
+    set_meal_statuses,
+    start_plan,
+)
+from app.utils.responses import ORJSONResponse
+
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter( tags=["Nutrition Plans"])
 
 
 # ----------------------------------------------------------
-# 1) Generate Plan (AI)
+# 1) Generate Plan (local IFCT engine or AI, see PLAN_ENGINE)
 # ----------------------------------------------------------
 @router.post("/generate")
 async def generate_plan(body: GeneratePlanRequest, db: AsyncSession = Depends(get_db)):
 
-    # Ask Gemini to generate the plan
-    plan_data = await generate_plan_ai(body.user_profile, body.formData)
+    plan_data = await plan_service.generate_plan(body.user_profile, body.formData)
 
     # Save to DB
-    plan = NutritionPlan(
-        id=uuid.uuid4(),
-        user_id=body.user_profile["id"],
-        name=plan_data["name"],
-        goal=plan_data["goal"],
-        duration=plan_data["duration"],
-        status="active",
-        days=plan_data["days"],
-        startDate=datetime.utcnow().isoformat(),
-        created_at=datetime.utcnow().isoformat(),
-    )
+    plan = await create_plan(db, body.user_profile["id"], plan_data)
+    return ORJSONResponse(serialize_plan(plan, plan_data["days"]))
 
-    db.add(plan)
-    await db.commit()
-    await db.refresh(plan)
 
-    return {
-        "id": str(plan.id),
-        "name": plan.name,
-        "goal": plan.goal,
-        "duration": plan.duration,
-        "status": plan.status,
-        "days": plan.days,
-        "startDate": plan.startDate,
-        "created_at": plan.created_at,
-    }
+async def _fail_streamed_plan(plan_id) -> None:
+    # A fresh session: the stream's may be mid-transaction or cancelled
+    async with async_session() as db:
+        await fail_plan(db, plan_id)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(data, default=str).decode()}\n\n"
 
 
 # ----------------------------------------------------------
-# 2) Get active plan for a user
+# 1a) Generate Plan, streamed day by day (server-sent events)
+#     → "plan" (no days yet), one "day" per day as soon as it is
+#       generated and saved, then "done" or "error"
+#     → the plan becomes the active plan only once it is complete
 # ----------------------------------------------------------
-@router.get("/{user_id}")
-async def get_user_plan(user_id: str, db: AsyncSession = Depends(get_db)):
+@router.post("/generate/stream")
+async def stream_generated_plan(body: GeneratePlanRequest):
+    if "id" not in body.user_profile:
+        raise HTTPException(400, "user_profile must include 'id' field")
+
+    async def events():
+        # Its own session: the stream outlives the request's dependencies
+        async with async_session() as db:
+            plan, written, active = None, 0, False
+            try:
+                async for kind, data in plan_service.stream_plan(body.user_profile, body.formData):
+                    if kind == "plan":
+                        plan = await start_plan(db, body.user_profile["id"], data)
+                        yield _sse("plan", serialize_plan(plan))
+                    else:
+                        # Days are numbered as written; models repeat numbers
+                        data["day"] = written + 1
+                        await append_days(db, plan, [data], written)
+                        written += 1
+                        yield _sse("day", data)
+                await activate_plan(db, plan)
+                active = True
+                yield _sse("done", {"id": str(plan.id), "days": written})
+            except PlanValidationError as exc:
+                yield _sse("error", {"detail": str(exc), "violations": exc.violations, "days": written})
+            except AIServiceError as exc:
+                yield _sse("error", {"detail": str(exc), "days": written})
+            except Exception:
+                logger.exception("Streamed plan generation failed")
+                await db.rollback()
+                yield _sse("error", {"detail": "Plan generation failed", "days": written})
+            finally:
+                if plan is not None and not active:
+                    # Shielded: also runs when the client disconnected and
+                    # this generator is being cancelled
+                    await asyncio.shield(_fail_streamed_plan(plan.id))
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
-    q = await db.execute(
-        select(NutritionPlan).where(
-            NutritionPlan.user_id == user_id,
-            NutritionPlan.status == "active"
-        )
-    )
 
-    plans = list(q.scalars().all())   # convert to list so .sort() works
+# ----------------------------------------------------------
+# 1b) Generate Plan as a background job
+#     → returns a job id immediately; poll or stream its status
+# ----------------------------------------------------------
+@router.post("/jobs", status_code=202)
+async def submit_plan_job(
+    body: GeneratePlanRequest,
+    idempotency_key: Optional[str] = Header(None),
+):
+    if "id" not in body.user_profile:
+        raise HTTPException(400, "user_profile must include 'id' field")
 
-    if not plans:
-        return {"message": "No active plan", "plan": None}
+    job = await plan_job_queue.submit(body.user_profile, body.formData, idempotency_key)
 
-    # Sort by created_at (latest first)
-    plans.sort(key=lambda x: x.created_at, reverse=True)
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/plans/jobs/{job.id}",
+        "events_url": f"/plans/jobs/{job.id}/events",
+    }
 
-    plan = plans[0]
 
+@router.get("/jobs/{job_id}")
+async def get_plan_job(job_id: str):
+    job = await plan_job_queue.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return ORJSONResponse(job.to_dict())
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_plan_job(job_id: str):
+    job = await plan_job_queue.get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+
+    async def events():
+        last_status = None
+        while True:
+            current = await plan_job_queue.get(job_id)
+            if not current:
+                return
+            # Read before yielding: changes made while the frame is being
+            # sent end the wait below at once
+            revision = current.revision
+            if current.status != last_status:
+                last_status = current.status
+                yield _sse(current.status, current.to_dict())
+            if current.status in FINISHED:
+                return
+            await plan_job_queue.backend.wait(job_id, revision, timeout=15)
+            # SSE comment keeps idle proxies from closing the stream
+            yield ": keep-alive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
-    return {
-        "id": str(plan.id),
-        "name": plan.name,
-        "goal": plan.goal,
-        "duration": plan.duration,
-        "status": plan.status,
-        "days": plan.days,
-        "startDate": plan.startDate,
-        "created_at": plan.created_at,
-    }
+
+# ----------------------------------------------------------
+# 2) Get active plan for a user
+#    → ?from_day=&to_day= or ?date= for some days only,
+#      ?fields=tag,meals.name,meals.status for some keys only
+#    → ETag / If-None-Match: 304 when the plan is unchanged
+# ----------------------------------------------------------
+@router.get("/{user_id}")
+async def get_user_plan(
+    user_id: str,
+    request: Request,
+    from_day: Optional[int] = Query(None, ge=1),
+    to_day: Optional[int] = Query(None, ge=1),
+    on_date: Optional[date] = Query(None, alias="date"),
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    try:
+        window = PlanWindow(from_day, to_day, on_date, fields)
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+
+    async def build():
+        plan = await latest_active_plan(db, user_id, with_days=window.is_full)
+        if not plan:
+            return None, {"message": "No active plan", "plan": None}
+        body = serialize_plan(plan, await load_days(db, plan, window))
+        if not window.is_full:
+            body["window"] = window.describe(plan)
+        return plan_etag(plan.id, plan.version, window.variant), body
+
+    return await conditional_response(
+        request,
+        plan_key(user_id) + window.variant,
+        await active_plan_etag(db, user_id, window.variant),
+        build,
+    )
 
 
 # ----------------------------------------------------------
@@ -92,8 +215,7 @@ async def get_user_plan(user_id: str, db: AsyncSession = Depends(get_db)):
 # ----------------------------------------------------------
 @router.delete("/{plan_id}")
 async def delete_plan(plan_id: str, db: AsyncSession = Depends(get_db)):
-    await db.execute(delete(NutritionPlan).where(NutritionPlan.id == plan_id))
-    await db.commit()
+    await remove_plan(db, plan_id)
     return {"message": "Plan deleted"}
 
 
@@ -107,29 +229,34 @@ async def update_meal_status(plan_id: str, meal_id: str, status: str, db: AsyncS
     if status not in allowed:
         raise HTTPException(400, f"Invalid status. Allowed: {allowed}")
 
-    q = await db.execute(select(NutritionPlan).where(NutritionPlan.id == plan_id))
-    plan = q.scalar_one_or_none()
-
-    if not plan:
-        raise HTTPException(404, "Plan not found")
-
-    found = False
+    # Only the one meal's status is written (jsonb_set), not the whole plan
+    if not await set_meal_status(db, plan_id, meal_id, status):
+        if not await plan_exists(db, plan_id):
+            raise HTTPException(404, "Plan not found")
+        raise HTTPException(404, "Meal not found")
 
-    for day in plan.days:
-        for meal in day["meals"]:
-            if meal["id"] == meal_id: #type: ignore
-                meal["status"] = status #type: ignore
-                found = True
+    return {"message": "Meal status updated"}
 
-    if not found:
-        raise HTTPException(404, "Meal not found")
 
-    await db.execute(
-        update(NutritionPlan).where(NutritionPlan.id == plan_id).values(days=plan.days)
-    )
-    await db.commit()
+# ----------------------------------------------------------
+# 4b) Update many meal statuses at once (a day's meals, offline sync)
+#     → per meal, the change with the latest client_ts wins
+# ----------------------------------------------------------
+@router.patch("/{plan_id}/meals")
+async def update_meal_statuses(
+    plan_id: str,
+    changes: List[MealStatusChange] = Body(..., min_length=1, max_length=200),
+    db: AsyncSession = Depends(get_db),
+):
+    results = await set_meal_statuses(db, plan_id, [c.model_dump() for c in changes])
+    if results is None:
+        raise HTTPException(404, "Plan not found")
 
-    return {"message": "Meal status updated"}
+    return {
+        "plan_id": plan_id,
+        "updated": sum(r["result"] == "updated" for r in results),
+        "results": results,
+    }
 
 
 # ----------------------------------------------------------
@@ -142,33 +269,83 @@ async def swap_meal(plan_id: str, meal: dict, db: AsyncSession = Depends(get_db)
     if "id" not in meal:
         raise HTTPException(400, "Meal must include 'id' field")
 
-    # generate replacement from AI
-    new_meal = await generate_swap_ai(meal)
+    # generate replacement from AI, avoiding the owner's allergies / dislikes
+    new_meal = await generate_swap_ai(meal, await plan_avoided_terms(db, plan_id))
 
     # enforce frontend structure
     new_meal["id"] = str(uuid.uuid4())
     new_meal["isSwapped"] = True
     new_meal["status"] = "pending"  # default for a swapped meal
 
-    q = await db.execute(select(NutritionPlan).where(NutritionPlan.id == plan_id))
-    plan = q.scalar_one_or_none()
-    if not plan:
-        raise HTTPException(404, "Plan not found")
+    if not await replace_meal(db, plan_id, meal["id"], new_meal):
+        if not await plan_exists(db, plan_id):
+            raise HTTPException(404, "Plan not found")
+        raise HTTPException(404, "Meal to swap not found")
 
-    replaced = False
+    return {"new_meal": new_meal}
 
-    for day in plan.days:
-        for idx, m in enumerate(day["meals"]): #type: ignore
-            if m["id"] == meal["id"]:
-                day["meals"][idx] = new_meal #type: ignore
-                replaced = True
 
-    if not replaced:
-        raise HTTPException(404, "Meal to swap not found")
+# ----------------------------------------------------------
+# 5b) Swap several meals at once (AI)
+#     → the swaps run concurrently, then one write to the plan
+# ----------------------------------------------------------
+# What a failed swap reports, most specific first (the exception's own
+# text stays in the log)
+SWAP_FAILURES = (
+    (AITimeoutError, "AI service timed out"),
+    (AIUnavailableError, "AI service unavailable"),
+    (PlanValidationError, "Replacement broke the diet rules"),
+    (AIServiceError, "AI service error"),
+)
+
+
+def _swap_failure(exc: Exception) -> str:
+    return next(message for kind, message in SWAP_FAILURES if isinstance(exc, kind))
+
+
+@router.post("/{plan_id}/swaps")
+async def swap_meals(
+    plan_id: str,
+    meals: List[dict] = Body(..., min_length=1, max_length=20),
+    db: AsyncSession = Depends(get_db),
+):
+    if any("id" not in meal for meal in meals):
+        raise HTTPException(400, "Every meal must include 'id' field")
+    if len({meal["id"] for meal in meals}) != len(meals):
+        raise HTTPException(400, "Duplicate meal ids")
+
+    avoid = await plan_avoided_terms(db, plan_id)
+    swaps = await generate_swaps_ai(meals, avoid)
+
+    # Nothing to write: fail the way a single swap would
+    errors = [swap for swap in swaps if isinstance(swap, Exception)]
+    if len(errors) == len(swaps):
+        raise errors[0]
+
+    replacements = {}
+    for meal, new_meal in zip(meals, swaps):
+        if not isinstance(new_meal, Exception):
+            new_meal.update(id=str(uuid.uuid4()), isSwapped=True, status="pending")
+            replacements[meal["id"]] = new_meal
+
+    replaced = await replace_meals(db, plan_id, replacements)
+    if replaced is None:
+        raise HTTPException(404, "Plan not found")
 
-    await db.execute(
-        update(NutritionPlan).where(NutritionPlan.id == plan_id).values(days=plan.days)
-    )
-    await db.commit()
+    results = []
+    for meal, new_meal in zip(meals, swaps):
+        result = {"meal_id": meal["id"]}
+        if isinstance(new_meal, Exception):
+            logger.warning("Swap of meal %s failed: %s", meal["id"], new_meal)
+            result.update(result="failed", error=_swap_failure(new_meal))
+        elif meal["id"] not in replaced:
+            result["result"] = "not_found"
+        else:
+            result.update(result="swapped", new_meal=new_meal)
+        results.append(result)
 
-    return {"new_meal": new_meal}
+    return {
+        "plan_id": plan_id,
+        "swapped": len(replaced),
+        "results": results,
+    }
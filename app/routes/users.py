@@ -1,16 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
+import logging
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.database.connection import get_db
+from sqlalchemy import select, update
+from app.database.connection import async_session, get_db, get_read_db, mark_written
 from app.models.users import User
-from app.utils.hashing import hash_password, verify_password
-from app.utils.jwt_handler import create_token, decode_token
-from fastapi.security import OAuth2PasswordBearer
+from app.utils.hashing import needs_rehash, password_hasher
+from app.utils.auth import AuthContext, get_auth, get_user_record, require_user
+from app.utils.jwt_handler import create_token
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
+router = APIRouter()
 
 
 class RegisterRequest(BaseModel):
@@ -28,12 +30,23 @@ class LoginRequest(BaseModel):
 # HELPERS
 # -------------------------
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    payload = decode_token(token)
-    user_id = payload.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid token payload")
-    return payload
+async def upgrade_password_hash(user_id, password: str, old_hash: str) -> None:
+    """Re-hash a password at the configured cost after a login.
+
+    Runs as a background task, so the slower hash never adds to login
+    latency; the update only applies if the hash was not changed meanwhile.
+    """
+    try:
+        new_hash = await password_hasher.hash(password)
+        async with async_session() as db:
+            await db.execute(
+                update(User)
+                .where(User.id == user_id, User.hashed_password == old_hash)
+                .values(hashed_password=new_hash)
+            )
+            await db.commit()
+    except Exception:
+        logger.warning("Password rehash failed for user %s", user_id, exc_info=True)
 
 
 # -------------------------
@@ -41,8 +54,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
 # -------------------------
 
 @router.get("/me")
-async def get_me(user = Depends(get_current_user)):
-    return user
+async def get_me(auth: AuthContext = Depends(get_auth)):
+    return auth.claims
 
 
 # -------------------------
@@ -63,11 +76,12 @@ async def register_user(payload: RegisterRequest, db: AsyncSession = Depends(get
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed = hash_password(password)
+    hashed = await password_hasher.hash(password)
     new_user = User(email=email, full_name=full_name, hashed_password=hashed)
 
     db.add(new_user)
     await db.commit()
+    mark_written(new_user.id)
 
     return {"message": "User registered"}
 
@@ -76,19 +90,27 @@ async def register_user(payload: RegisterRequest, db: AsyncSession = Depends(get
 # LOGIN
 # -------------------------
 @router.post("/login")
-async def login(payload: LoginRequest, db: AsyncSession = Depends(get_db)) -> dict:
+async def login(
+    payload: LoginRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+) -> dict:
     email = payload.email
     password = payload.password
 
-    query = await db.execute(select(User).where(User.email == email))
-    user = query.scalar_one_or_none()
+    # Unknown emails are rejected before any bcrypt work
+    query = await db.execute(select(User.id, User.hashed_password).where(User.email == email))
+    user = query.one_or_none()
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if not verify_password(password, user.hashed_password):
+    if not await password_hasher.verify(password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Wrong password")
 
+    if needs_rehash(user.hashed_password):
+        background_tasks.add_task(upgrade_password_hash, user.id, password, user.hashed_password)
+
     token = create_token({"user_id": str(user.id)})
 
     return {"access_token": token, "user_id": str(user.id)}
@@ -98,16 +120,14 @@ async def login(payload: LoginRequest, db: AsyncSession = Depends(get_db)) -> di
 # GET USER (dynamic route)
 # -------------------------
 @router.get("/{user_id}")
-async def get_user(user_id: str, db: AsyncSession = Depends(get_db)):
-    query = await db.execute(select(User).where(User.id == user_id))
-    user = query.scalar_one_or_none()
+async def get_user(
+    user_id: str,
+    auth: AuthContext = Depends(require_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    user = await get_user_record(db, auth.user_id)
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    return {
-        "id": str(user.id),
-        "email": user.email,
-        "full_name": user.full_name,
-        "created_at": user.created_at
-    }
+    return user
@@ -0,0 +1,13 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class FoodAmount(BaseModel):
+    code: str
+    grams: float = Field(gt=0)
+
+
+class NutrientTotalsRequest(BaseModel):
+    items: List[FoodAmount]
+    nutrients: Optional[List[str]] = None   # IFCT columns; all when omitted
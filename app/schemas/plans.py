@@ -1,11 +1,47 @@
-from pydantic import BaseModel
-from typing import Dict, Any
+import math
+from datetime import datetime
+from pydantic import BaseModel, field_validator
+from typing import Dict, Any, Literal, Optional
+
+from app.config import settings
+from app.utils.profile import profile_value
+
+
+def _positive_number(value) -> bool:
+    if isinstance(value, bool):
+        return False
+    try:
+        return math.isfinite(float(value)) and float(value) > 0
+    except (TypeError, ValueError):
+        return False
 
 
 class GeneratePlanRequest(BaseModel):
     user_profile: Dict[str, Any]   # required
     formData: Dict[str, Any]       # required
 
+    @field_validator("user_profile")
+    @classmethod
+    def _check_profile(cls, user_profile: Dict[str, Any]) -> Dict[str, Any]:
+        # The numbers the plan's calorie targets are computed from
+        for name, paths in (
+            ("tdee", ("athlete_or_lifestyle.tdee", "tdee")),
+            ("current_weight_kg", ("profile.current_weight_kg", "current_weight_kg")),
+        ):
+            value = profile_value(user_profile, *paths)
+            if value not in (None, "") and not _positive_number(value):
+                raise ValueError(f"{name} must be a positive number")
+        return user_profile
+
+    @field_validator("formData")
+    @classmethod
+    def _check_duration(cls, formData: Dict[str, Any]) -> Dict[str, Any]:
+        limit = settings.PLAN_MAX_DURATION_DAYS
+        duration = formData.get("duration")
+        if not _positive_number(duration) or float(duration) != int(float(duration)) or float(duration) > limit:
+            raise ValueError(f"duration must be a whole number of days from 1 to {limit}")
+        return {**formData, "duration": int(float(duration))}
+
 
 class NutritionPlanResponse(BaseModel):
     id: str
@@ -17,4 +53,11 @@ class NutritionPlanResponse(BaseModel):
     startDate: str
     created_at: str
 class SwapMealRequest(BaseModel):
-    meal_id: str
\ No newline at end of file
+    meal_id: str
+
+
+class MealStatusChange(BaseModel):
+    meal_id: str
+    status: Literal["eaten", "pending", "skipped"]
+    # When the change was made on the device; defaults to when it arrives
+    client_ts: Optional[datetime] = None
@@ -0,0 +1,93 @@
+import hashlib
+import json
+from typing import Any, Optional
+
+from app.config import settings
+from app.services.ai_prompts import profile_facts
+from app.utils.cache import TwoTierCache
+from app.utils.profile import profile_value, text_list
+
+
+# ---------------------------------------------------
+# Cache keys
+# ---------------------------------------------------
+def _bucket(value: Any, size: float) -> Optional[int]:
+    try:
+        return int(round(float(value) / size) * size)
+    except (TypeError, ValueError):
+        return None
+
+
+def _digest(kind: str, fields: dict) -> str:
+    canonical = json.dumps(fields, sort_keys=True, separators=(",", ":"), default=str)
+    return kind + ":" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# formData keys that never change what the model is asked for
+_VOLATILE_FORM_FIELDS = {"startDate", "start_date", "timestamp", "requestId"}
+
+
+# profile_facts keys keyed by band rather than exact value (bucket size)
+_BUCKETED_FACTS = {"age": 5, "height_cm": 5, "weight_kg": 5, "tdee": settings.AI_CACHE_TDEE_BUCKET}
+_LIST_FACTS = {"allergies", "dislikes", "medical"}
+
+
+def plan_cache_key(user_profile: dict, formData: dict) -> str:
+    """Key a plan request on the inputs that shape the generated plan.
+
+    The profile part is built from the same ``profile_facts`` the prompt
+    sends, so identity fields never count and nothing the model is told is
+    left out. Continuous values are bucketed, so users with the same diet,
+    goal, duration and TDEE band share one cached plan.
+    """
+    profile = {"diet_type": profile_value(user_profile, "dietary_preferences.diet_type") or "veg"}
+    for key, value in profile_facts(user_profile).items():
+        if key in _BUCKETED_FACTS:
+            value = _bucket(value, _BUCKETED_FACTS[key])
+        elif key in _LIST_FACTS:
+            value = text_list(value)
+        elif isinstance(value, str):
+            value = value.strip().lower()
+        profile[key] = value
+    form = {
+        k: v for k, v in formData.items()
+        if k not in _VOLATILE_FORM_FIELDS
+    }
+    return _digest("plan", {"profile": profile, "form": form})
+
+
+def swap_cache_key(meal: dict, avoid=()) -> str:
+    """Key a swap on the meal being replaced (not on its id or status) and
+    on the allergies / dislikes the replacement must avoid."""
+    return _digest("swap", {
+        "avoid": text_list(avoid),
+        "diet_type": meal.get("diet_type", "veg"),
+        "name": " ".join(str(meal.get("name", "")).lower().split()),
+        "time": str(meal.get("time", "")).upper(),
+        "calories": _bucket(meal.get("calories"), 50),
+    })
+
+
+# ---------------------------------------------------
+# Two-tier cache
+# ---------------------------------------------------
+class AIResponseCache(TwoTierCache):
+    """Cache of model replies, counted per kind ("plan", "swap"). Its
+    SQLite tier uses its own ``ai_cache`` table."""
+
+    def __init__(
+        self,
+        enabled: bool,
+        max_entries: int,
+        ttl: float,
+        sqlite_path: Optional[str] = None,
+    ) -> None:
+        super().__init__(enabled, max_entries, ttl, sqlite_path, table="ai_cache")
+
+
+ai_cache = AIResponseCache(
+    enabled=settings.AI_CACHE_ENABLED,
+    max_entries=settings.AI_CACHE_MAX_ENTRIES,
+    ttl=settings.AI_CACHE_TTL_SECONDS,
+    sqlite_path=settings.AI_CACHE_SQLITE_PATH,
+)
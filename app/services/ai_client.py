@@ -0,0 +1,346 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Callable, Optional
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from app.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class AIServiceError(Exception):
+    """Raised when the upstream model cannot produce a usable response."""
+
+
+class AITimeoutError(AIServiceError):
+    """Raised when a model call exceeds its timeout."""
+
+
+class AIUpstreamError(AIServiceError):
+    """Raised on a transient upstream failure (5xx, rate limit, network)."""
+
+
+class AIReplyError(AIServiceError):
+    """Raised when the model answered, but not with anything usable."""
+
+
+class AIUnavailableError(AIServiceError):
+    """Raised without calling the model while the circuit breaker is open."""
+
+
+# Upstream errors worth another attempt; they also count towards the breaker
+TRANSIENT_ERRORS = (google_exceptions.ServerError, google_exceptions.TooManyRequests, ConnectionError)
+RETRYABLE_ERRORS = (AITimeoutError, AIUpstreamError, AIReplyError)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting: Gemini averages about four
+    characters per token on this kind of text."""
+    return (len(text) + 3) // 4
+
+
+class CircuitBreaker:
+    """Fails calls fast after ``failures`` upstream failures in a row.
+
+    Once open, calls are refused for ``reset_after`` seconds; then one trial
+    call goes through (half-open) and its outcome closes or reopens the
+    breaker. ``failures <= 0`` disables it.
+    """
+
+    def __init__(self, failures: int, reset_after: float) -> None:
+        self.failures = failures
+        self.reset_after = reset_after
+        self.consecutive = 0
+        self.opened_at: Optional[float] = None
+        self.trial_at: Optional[float] = None
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_after:
+            return "open"
+        return "half_open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_after - time.monotonic())
+
+    def allow(self) -> bool:
+        state = self.state
+        if self.failures <= 0 or state == "closed":
+            return True
+        if state == "half_open":
+            now = time.monotonic()
+            # One trial at a time; a trial that never reported back (its
+            # caller was cancelled) is replaced after reset_after
+            if self.trial_at is None or now - self.trial_at >= self.reset_after:
+                self.trial_at = now
+                return True
+        return False
+
+    def success(self) -> None:
+        self.consecutive = 0
+        self.opened_at = self.trial_at = None
+
+    def failure(self) -> None:
+        self.consecutive += 1
+        if self.failures > 0 and (self.trial_at is not None or self.consecutive >= self.failures):
+            if self.state != "open":
+                self.opens += 1
+                logger.warning("AI circuit breaker open after %d failures", self.consecutive)
+            self.opened_at = time.monotonic()
+            self.trial_at = None
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive,
+            "opens": self.opens,
+            "retry_after": round(self.retry_after(), 1),
+        }
+
+
+class AIClient:
+    """Non-blocking wrapper around a Gemini model.
+
+    Calls go through the SDK's async API so the event loop keeps serving
+    other requests while a generation is in flight. A semaphore caps the
+    number of concurrent generations. If the awaiting task is cancelled
+    (client disconnect, shutdown) the pending model request is cancelled
+    with it.
+
+    Each call has a deadline (``timeout``) and each attempt within it at
+    most ``attempt_timeout``. Timeouts, transient upstream errors and
+    replies the caller cannot parse are retried up to ``retries`` times
+    with jittered exponential backoff. With ``hedge_after``, an attempt
+    still running after that many seconds gets a duplicate request if a
+    slot is free, and the first reply wins. The circuit breaker refuses
+    calls while the upstream keeps failing (AIUnavailableError).
+
+    Every call is labelled with a ``kind`` ("plan", "swap", ...); prompt and
+    reply token counts are logged per call and summed per kind in stats().
+    """
+
+    def __init__(
+        self,
+        model,
+        max_concurrency: int,
+        timeout: float,
+        attempt_timeout: float = 0,
+        retries: int = 0,
+        retry_backoff: float = 0.5,
+        hedge_after: float = 0,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.attempt_timeout = attempt_timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker(0, 0)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.tokens = {}
+        self.counters = {"retries": 0, "hedges": 0, "hedge_wins": 0}
+
+    def _check_prompt(self, prompt: str) -> None:
+        estimate = estimate_tokens(prompt)
+        if settings.AI_MAX_PROMPT_TOKENS and estimate > settings.AI_MAX_PROMPT_TOKENS:
+            raise AIServiceError(f"Prompt too long ({estimate} tokens)")
+
+    def _record(self, kind: str, prompt: str, reply: str, usage, started: float) -> None:
+        # usage_metadata has the model's own counts; fall back on estimates
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt)
+        reply_tokens = getattr(usage, "candidates_token_count", None) or estimate_tokens(reply)
+        totals = self.tokens.setdefault(kind, {"calls": 0, "prompt_tokens": 0, "reply_tokens": 0})
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["reply_tokens"] += reply_tokens
+        logger.info(
+            "AI %s call: %d prompt tokens, %d reply tokens, %.1fs",
+            kind, prompt_tokens, reply_tokens, time.monotonic() - started,
+        )
+
+    def _upstream_error(self, exc: Exception) -> AIServiceError:
+        if isinstance(exc, TRANSIENT_ERRORS):
+            self.breaker.failure()
+            return AIUpstreamError(f"Model call failed: {exc}")
+        if isinstance(exc, ValueError):
+            # response.text on a reply without text (e.g. blocked)
+            return AIReplyError("Model returned no text")
+        return AIServiceError(f"Model call failed: {exc}")
+
+    def _allow(self) -> None:
+        if not self.breaker.allow():
+            raise AIUnavailableError("AI model temporarily unavailable")
+
+    async def _acquire(self) -> None:
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+    async def generate_text(
+        self,
+        prompt: str,
+        timeout: Optional[float] = None,
+        kind: str = "other",
+        parse: Optional[Callable[[str], Any]] = None,
+    ) -> Any:
+        """Run one generation and return the stripped response text, or
+        ``parse(text)``; ``parse`` raising AIReplyError retries the call."""
+        self._check_prompt(prompt)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._hedged(prompt, kind, parse, deadline)
+            except RETRYABLE_ERRORS as exc:
+                # Full jitter, so callers that failed together don't retry together
+                delay = random.uniform(0, self.retry_backoff * 2 ** attempt)
+                if attempt == self.retries or loop.time() + delay >= deadline:
+                    raise
+                self.counters["retries"] += 1
+                logger.warning("AI %s call failed (%s), retrying in %.1fs", kind, exc, delay)
+                await asyncio.sleep(delay)
+
+    async def _hedged(self, prompt: str, kind: str, parse, deadline: float) -> Any:
+        if not self.hedge_after:
+            return await self._attempt(prompt, kind, parse, deadline)
+
+        first = asyncio.ensure_future(self._attempt(prompt, kind, parse, deadline))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            # A duplicate only uses spare capacity, never queues behind others
+            if not done and not self._semaphore.locked():
+                self.counters["hedges"] += 1
+                tasks.append(asyncio.ensure_future(self._attempt(prompt, kind, parse, deadline)))
+
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _attempt(self, prompt: str, kind: str, parse, deadline: float) -> Any:
+        self._allow()
+        await self._acquire()
+
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                raise AITimeoutError("Model call timed out")
+            response = await asyncio.wait_for(
+                self.model.generate_content_async(prompt),
+                min(self.attempt_timeout, remaining) if self.attempt_timeout else remaining,
+            )
+            text = response.text.strip()
+        except asyncio.TimeoutError:
+            self.breaker.failure()
+            raise AITimeoutError("Model call timed out")
+        except AIServiceError:
+            raise
+        except Exception as exc:
+            raise self._upstream_error(exc) from exc
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+        self.breaker.success()
+        self._record(kind, prompt, text, getattr(response, "usage_metadata", None), started)
+        return parse(text) if parse else text
+
+    async def stream_text(
+        self, prompt: str, timeout: Optional[float] = None, kind: str = "other"
+    ) -> AsyncIterator[str]:
+        """Run one generation, yielding its text as the model produces it.
+
+        The whole stream shares one timeout and holds a concurrency slot
+        until it ends or the caller stops iterating. Streams are not
+        retried or hedged (the caller has already used what it got).
+        """
+        self._check_prompt(prompt)
+        self._allow()
+        await self._acquire()
+
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        started, usage, reply = time.monotonic(), None, []
+        try:
+            response = await asyncio.wait_for(
+                self.model.generate_content_async(prompt, stream=True),
+                deadline - loop.time(),
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+                    text = chunk.text
+                except StopAsyncIteration:
+                    self.breaker.success()
+                    self._record(kind, prompt, "".join(reply), usage, started)
+                    return
+                # Each chunk carries the running totals
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                reply.append(text)
+                yield text
+        except asyncio.TimeoutError:
+            self.breaker.failure()
+            raise AITimeoutError("Model call timed out")
+        except AIServiceError:
+            raise
+        except Exception as exc:
+            raise self._upstream_error(exc) from exc
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            **self.counters,
+            "breaker": self.breaker.stats(),
+            "tokens": self.tokens,
+        }
+
+
+genai.configure(api_key=settings.GEMINI_API_KEY)
+
+ai_client = AIClient(
+    genai.GenerativeModel(settings.GEMINI_MODEL),
+    max_concurrency=settings.AI_MAX_CONCURRENCY,
+    timeout=settings.AI_TIMEOUT_SECONDS,
+    attempt_timeout=settings.AI_ATTEMPT_TIMEOUT_SECONDS,
+    retries=settings.AI_RETRIES,
+    retry_backoff=settings.AI_RETRY_BACKOFF_SECONDS,
+    hedge_after=settings.AI_HEDGE_AFTER_SECONDS,
+    breaker=CircuitBreaker(settings.AI_BREAKER_FAILURES, settings.AI_BREAKER_RESET_SECONDS),
+)
@@ -0,0 +1,89 @@
+import json
+from typing import Any, Dict, List
+
+from app.services.ai_client import AIReplyError
+from app.services.energy_metrics import age_on, parse_date, profile_tdee
+from app.utils.profile import profile_value
+
+
+# ---------------------------------------------------
+# What the model is told about the user
+# ---------------------------------------------------
+# prompt key -> where the value may live in user_profile (see profile_value).
+# Identity, contact and UI fields never reach the model.
+PROFILE_FIELDS = {
+    "gender": ("profile.gender", "gender"),
+    "height_cm": ("profile.height_cm", "height_cm"),
+    "weight_kg": ("profile.current_weight_kg", "current_weight_kg"),
+    "activity": ("profile.activity_level", "activity_level"),
+    "kitchen": ("profile.kitchen_type", "kitchen_type"),
+    "athlete": ("athlete_or_lifestyle.is_athlete", "is_athlete"),
+    "sport": ("athlete_or_lifestyle.sport", "sport"),
+    "role": ("athlete_or_lifestyle.role", "role"),
+    "phase": ("athlete_or_lifestyle.phase_or_goal", "phase_or_goal"),
+    "allergies": ("dietary_preferences.allergies", "allergies"),
+    "dislikes": ("dietary_preferences.dislikes", "dislikes"),
+    "medical": ("dietary_preferences.medical_conditions", "medical_conditions"),
+}
+
+# formData keys the prompt states elsewhere or the model has no use for
+SKIPPED_SETTINGS = {"duration", "engine", "id", "user_id", "startDate"}
+
+
+def profile_facts(user_profile: dict) -> Dict[str, Any]:
+    """The profile fields a plan depends on, under short keys."""
+    facts = {"age": age_on(parse_date(profile_value(user_profile, "profile.dob", "dob")))}
+    facts.update({key: profile_value(user_profile, *paths) for key, paths in PROFILE_FIELDS.items()})
+    facts["tdee"] = profile_tdee(user_profile)
+    return {k: v for k, v in facts.items() if v not in (None, "", [], False)}
+
+
+def settings_facts(formData: dict) -> Dict[str, Any]:
+    return {
+        k: v for k, v in formData.items()
+        if k not in SKIPPED_SETTINGS and v not in (None, "", [], {})
+    }
+
+
+def compact(data) -> str:
+    """JSON without the whitespace (it costs tokens, not meaning)."""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+# ---------------------------------------------------
+# Compact reply schema
+# ---------------------------------------------------
+# Meals come back as rows in this column order instead of objects that
+# repeat every key, and days as {"d": day, "t": tag, "m": [rows]}
+MEAL_ROW = ("time", "name", "description", "calories", "protein", "carbs", "fats")
+MEAL_ROW_EXAMPLE = ["08:00 AM", "Oatmeal", "string", 350, 25, 40, 10]
+MEAL_ROW_HELP = "time, name, description, calories (kcal), protein (g), carbs (g), fats (g)"
+
+
+def expand_meal(meal) -> dict:
+    """A meal row (or an already expanded meal) in the stored meal shape.
+    Raises AIReplyError for anything else."""
+    if isinstance(meal, list):
+        meal = dict(zip(MEAL_ROW, meal))
+    if not isinstance(meal, dict):
+        raise AIReplyError("Model returned an unusable meal")
+    return {**meal, "status": meal.get("status", "pending")}
+
+
+def expand_day(day: dict) -> dict:
+    if not isinstance(day, dict):
+        raise AIReplyError("Model returned an unusable day")
+    meals = day.get("m", day.get("meals"))
+    if meals is not None and not isinstance(meals, list):
+        raise AIReplyError("Model returned an unusable meal")
+    if "m" not in day:
+        return {**day, "meals": [expand_meal(meal) for meal in meals or []]}
+    return {
+        "day": day.get("d"),
+        "tag": day.get("t"),
+        "meals": [expand_meal(meal) for meal in meals or []],
+    }
+
+
+def expand_days(days: List[dict]) -> List[dict]:
+    return [expand_day(day) for day in days if isinstance(day, dict)]
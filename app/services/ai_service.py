@@ -1,12 +1,31 @@
-import os
+import asyncio
+import copy
 import json
-import google.generativeai as genai
+import logging
+import textwrap
+import uuid
+from contextlib import aclosing
 
-# Load API key
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from app.config import settings
+from app.services.ai_cache import ai_cache, plan_cache_key, swap_cache_key
+from app.services.ai_client import AIReplyError, AIServiceError, ai_client
+from app.services.ai_prompts import (
+    MEAL_ROW,
+    MEAL_ROW_EXAMPLE,
+    MEAL_ROW_HELP,
+    compact,
+    expand_day,
+    expand_days,
+    expand_meal,
+    profile_facts,
+    settings_facts,
+)
+from app.services.plan_validation import PlanValidationError, forbidden_word, validate_meal, validate_plan
+from app.utils.json_stream import ArrayItemStream
+from app.utils.profile import avoided_terms, profile_value
 
-model = genai.GenerativeModel("gemini-2.5-flash")
 
+logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------
 # Utility: Diet Rules
@@ -20,19 +39,177 @@ DIET_RULES = {
 }
 
 
+# ---------------------------------------------------
+# Utility: pull the JSON object out of a model reply
+# ---------------------------------------------------
+def _parse_json_object(text):
+    start = text.find("{")
+    end = text.rfind("}")
+
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError:
+        raise AIReplyError("Model returned malformed JSON")
+
+
+# ---------------------------------------------------
+# Utility: give every meal a fresh id
+# ---------------------------------------------------
+def _stamp_meals(days):
+    # Meal ids must be unique per plan (status updates and swaps look
+    # meals up by id), and cached plans are shared between users.
+    for day in days:
+        for meal in day.get("meals", []):
+            meal["id"] = str(uuid.uuid4())
+            meal["status"] = "pending"
+    return days
+
+
 # ---------------------------------------------------
 #  PLAN GENERATION (AI)
 # ---------------------------------------------------
 async def generate_plan_ai(user_profile, formData):
-    # Extract dietary preference safely
-    diet_type = user_profile.get("dietary_preferences", {}).get("diet_type", "veg")
+    cache_key = plan_cache_key(user_profile, formData)
+    plan = await ai_cache.get(cache_key)
+
+    if plan is None:
+        plan = await _generate_plan_uncached(user_profile, formData)
+        # Corrects macros in place and rejects diet violations, so only
+        # checked plans are cached
+        diet_type = profile_value(user_profile, "dietary_preferences.diet_type") or "veg"
+        validate_plan(plan.get("days", []), diet_type, avoid=avoided_terms(user_profile))
+        await ai_cache.set(cache_key, plan)
+
+    _stamp_meals(plan.get("days", []))
+    return plan
+
+
+async def stream_plan_ai(user_profile, formData):
+    """Like generate_plan_ai, but yields the plan as the model writes it:
+    ``("plan", {name, goal, duration})`` first, then ``("day", day)`` for
+    each day, validated and stamped, as soon as it has been parsed.
+
+    Raises AIServiceError when the reply breaks off or is not a plan; the
+    days already yielded stay valid.
+    """
+    cache_key = plan_cache_key(user_profile, formData)
+    diet_type = profile_value(user_profile, "dietary_preferences.diet_type") or "veg"
+    avoid = avoided_terms(user_profile)
+    plan = await ai_cache.get(cache_key)
+
+    if plan is not None:
+        yield "plan", _plan_header(plan, formData)
+        for day in _stamp_meals(plan.get("days", [])):
+            yield "day", day
+        return
+
+    parser = ArrayItemStream("days")
+    days = []
+    # aclosing: raising mid-stream must release the client's slot and the
+    # upstream stream now, not whenever the generator is collected
+    async with aclosing(ai_client.stream_text(_plan_prompt(user_profile, formData), kind="plan")) as chunks:
+        async for chunk in chunks:
+            try:
+                parsed = parser.feed(chunk)
+            except ValueError:
+                raise AIReplyError("Model returned malformed JSON")
+            for day in map(expand_day, parsed):
+                if not days:
+                    yield "plan", _plan_header(parser.header(), formData)
+                validate_plan([day], diet_type, avoid=avoid)
+                days.append(day)
+                yield "day", _stamp_meals([day])[0]
+
+    if not parser.complete or not days:
+        raise AIReplyError("Model reply ended before the plan was complete")
+    await ai_cache.set(cache_key, {**_plan_header(parser.header(), formData), "days": days})
+
+
+def _plan_header(plan, formData):
+    # Fall back on the request for members the model left out
+    return {
+        "name": plan.get("name") or "Nutrition Plan",
+        "goal": plan.get("goal") or formData.get("goal"),
+        "duration": plan.get("duration") or formData["duration"],
+    }
+
+
+async def _generate_plan_uncached(user_profile, formData):
+    duration = int(formData["duration"])
+
+    cycle = settings.AI_PLAN_CYCLE_DAYS
+    if 0 < cycle < duration:
+        # Later weeks repeat the first: one cycle-long plan (cached like any
+        # other, so shared by every duration) is generated and repeated
+        template = await generate_plan_ai(user_profile, {**formData, "duration": cycle})
+        return {**template, "duration": duration, "days": _repeat_days(template["days"], duration)}
+
+    size = settings.AI_PLAN_CHUNK_DAYS if settings.AI_PLAN_CHUNK_DAYS > 0 else duration
+    tasks = [
+        asyncio.ensure_future(
+            _generate_plan_chunk(user_profile, formData, first, min(first + size - 1, duration))
+        )
+        for first in range(1, duration + 1, size)
+    ]
+    try:
+        chunks = await asyncio.gather(*tasks)
+    except BaseException:
+        # One chunk gave up: the others are no use any more
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return {
+        **_plan_header(chunks[0], formData),
+        "duration": duration,
+        "days": [day for chunk in chunks for day in chunk["days"]],
+    }
+
+
+async def _generate_plan_chunk(user_profile, formData, first, last):
+    """Days ``first``..``last`` of a plan. A reply that parses but is
+    unusable (short, or breaking the diet) retries this chunk only;
+    ai_client already retries failed calls and malformed replies."""
+    diet_type = profile_value(user_profile, "dietary_preferences.diet_type") or "veg"
+    count = last - first + 1
+
+    for attempt in range(settings.AI_PLAN_CHUNK_RETRIES + 1):
+        try:
+            chunk = await ai_client.generate_text(
+                _plan_prompt(user_profile, formData, first, last), kind="plan", parse=_parse_json_object
+            )
+            days = expand_days(chunk.get("days")) if isinstance(chunk.get("days"), list) else []
+            if len(days) < count:
+                raise AIReplyError(f"Model returned {len(days)} of {count} days")
+            days = days[:count]
+            for number, day in enumerate(days, first):
+                day["day"] = number
+            validate_plan(days, diet_type, avoid=avoided_terms(user_profile))
+            return {**chunk, "days": days}
+        except (AIReplyError, PlanValidationError):
+            if attempt == settings.AI_PLAN_CHUNK_RETRIES:
+                raise
+            logger.warning("Plan days %d-%d unusable, retrying", first, last, exc_info=True)
+
+
+def _repeat_days(days, duration):
+    return [{**copy.deepcopy(days[i % len(days)]), "day": i + 1} for i in range(duration)]
+
+
+def _plan_prompt(user_profile, formData, first_day=1, last_day=None):
+    # Same lookup as validation and the cache key, so the prompt asks for
+    # the diet the plan is checked against
+    diet_type = profile_value(user_profile, "dietary_preferences.diet_type") or "veg"
     rules = DIET_RULES.get(diet_type, "")
+    last_day = last_day or int(formData["duration"])
 
     prompt = f"""
     Create a nutrition plan in VALID JSON ONLY.
 
     USER DIETARY PREFERENCE: {diet_type.upper()}
 
+    DAYS: write exactly {last_day - first_day + 1} days, numbered {first_day} to {last_day}.
+
     STRICT RULES:
     {rules}
     - Never violate dietary preference.
@@ -41,58 +218,72 @@ async def generate_plan_ai(user_profile, formData):
     - If JAIN → no onion, garlic, root vegetables.
     - If VEGAN → no dairy, eggs, honey.
 
-    Required JSON format:
-    {{
-        "name": "string",
-        "goal": "{formData.get("goal")}",
-        "duration": {formData["duration"]},
-        "days": [
-            {{
-                "day": 1,
-                "tag": "Training",
-                "meals": [
-                    {{
-                        "id": "uuid",
-                        "time": "08:00 AM",
-                        "name": "Oatmeal",
-                        "description": "string",
-                        "calories": 350,
-                        "protein": 25,
-                        "carbs": 40,
-                        "fats": 10,
-                        "status": "pending"
-                    }}
-                ]
-            }}
-        ]
-    }}
+    Required JSON format ("d" day, "t" tag, "m" meals; each meal is a row:
+    {MEAL_ROW_HELP}):
+    {{"name":"string","days":[{{"d":{first_day},"t":"Training","m":[{compact(MEAL_ROW_EXAMPLE)}]}}]}}
 
     USER PROFILE:
-    {json.dumps(user_profile)}
+    {compact(profile_facts(user_profile))}
 
     SETTINGS:
-    {json.dumps(formData)}
+    {compact(settings_facts(formData))}
 
     Return ONLY JSON. No explanation.
     """
-
-    response = model.generate_content(prompt)
-    text = response.text.strip()
-
-    start = text.find("{")
-    end = text.rfind("}")
-
-    json_text = text[start:end + 1]
-    return json.loads(json_text)
+    return textwrap.dedent(prompt).strip()
 
 
 # ---------------------------------------------------
 #  SWAP MEAL (AI)
 # ---------------------------------------------------
-async def generate_swap_ai(meal):
+async def generate_swap_ai(meal, avoid=()):
+    """A replacement for ``meal`` that avoids the plan owner's allergies
+    and dislikes (``avoid`` terms)."""
+    cache_key = swap_cache_key(meal, avoid)
+    new_meal = await ai_cache.get(cache_key)
+
+    if new_meal is None:
+        new_meal = await _generate_swap_uncached(meal, avoid)
+        validate_meal(new_meal, meal.get("diet_type", "veg"), avoid=avoid)
+        await ai_cache.set(cache_key, new_meal)
+
+    return new_meal
+
+
+async def _swap_or_error(meal, avoid):
+    try:
+        return await generate_swap_ai(meal, avoid)
+    except (AIServiceError, PlanValidationError) as exc:
+        return exc
+
+
+async def generate_swaps_ai(meals, avoid=()):
+    """Replacements for several meals at once, one result per meal: the new
+    meal, or the AIServiceError / PlanValidationError its swap raised. Any
+    other error propagates.
+
+    The swaps run concurrently (ai_client's semaphore still bounds the calls
+    in flight), so a batch takes about as long as its slowest swap. Meals
+    with the same swap cache key share one call.
+    """
+    keys = [swap_cache_key(meal, avoid) for meal in meals]
+    distinct = {}
+    for key, meal in zip(keys, meals):
+        distinct.setdefault(key, meal)
+
+    results = await asyncio.gather(*(_swap_or_error(meal, avoid) for meal in distinct.values()))
+    by_key = dict(zip(distinct, results))
+    return [
+        by_key[key] if isinstance(by_key[key], Exception) else dict(by_key[key])
+        for key in keys
+    ]
+
+
+async def _generate_swap_uncached(meal, avoid=()):
     # Extract diet
     diet_type = meal.get("diet_type", "veg")
     rules = DIET_RULES.get(diet_type, "")
+    avoid_rule = f"- It must not contain: {', '.join(avoid)}." if avoid else ""
 
     prompt = f"""
     Replace this meal with a new one of similar macros.
@@ -102,30 +293,60 @@ async def generate_swap_ai(meal):
     STRICT RULES:
     {rules}
     - The replacement meal MUST follow the diet preference.
+    {avoid_rule}
+
+    Meals are rows: {MEAL_ROW_HELP}.
 
     ORIGINAL MEAL:
-    {json.dumps(meal)}
-
-    Return ONLY JSON:
-    {{
-        "id": "uuid",
-        "time": "string",
-        "name": "string",
-        "description": "string",
-        "calories": number,
-        "protein": number,
-        "carbs": number,
-        "fats": number,
-        "status": "pending",
-        "isSwapped": true
-    }}
+    {compact([meal.get(key) for key in MEAL_ROW])}
+
+    Return ONLY JSON: {{"m": <the replacement meal's row>}}
     """
 
-    response = model.generate_content(prompt)
-    text = response.text.strip()
+    return await ai_client.generate_text(textwrap.dedent(prompt).strip(), kind="swap", parse=_parse_swap)
 
-    start = text.find("{")
-    end = text.rfind("}")
 
-    json_text = text[start:end + 1]
-    return json.loads(json_text)
+def _parse_swap(text):
+    # Inside parse=, so an unusable meal is retried like malformed JSON
+    reply = _parse_json_object(text)
+    return expand_meal(reply.get("m", reply))
+
+
+# ---------------------------------------------------
+#  PLAN ENRICHMENT (AI, optional)
+#  → writes descriptions for locally generated meals
+# ---------------------------------------------------
+async def enrich_plan_ai(plan, diet_type):
+    meals = {}
+    for day in plan["days"]:
+        for meal in day["meals"]:
+            meals.setdefault(meal["name"], meal["description"])
+
+    prompt = f"""
+    Write a short, appetizing description (max 25 words) for each meal
+    below, suggesting a simple Indian preparation of the listed ingredients.
+    Keep the portions exactly as given.
+
+    DIETARY PREFERENCE: {diet_type.upper()}
+    {DIET_RULES.get(diet_type, "")}
+
+    MEALS (name → ingredients):
+    {compact(meals)}
+
+    Return ONLY JSON mapping each meal name to its description.
+    """
+
+    descriptions = await ai_client.generate_text(
+        textwrap.dedent(prompt).strip(), kind="enrich", parse=_parse_json_object
+    )
+
+    for day in plan["days"]:
+        for meal in day["meals"]:
+            description = descriptions.get(meal["name"])
+            # A description that names a forbidden food is dropped
+            if (
+                isinstance(description, str) and description.strip()
+                and not forbidden_word(diet_type, description)
+            ):
+                meal["description"] = description.strip()
+    return plan
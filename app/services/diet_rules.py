@@ -0,0 +1,130 @@
+import re
+from functools import lru_cache
+from typing import FrozenSet, Pattern, Tuple
+
+
+# ---------------------------------------------------
+# IFCT 2017 food groups (first letter of the food code)
+# ---------------------------------------------------
+FOOD_GROUPS = {
+    "A": "Cereals and millets",
+    "B": "Grain legumes",
+    "C": "Green leafy vegetables",
+    "D": "Other vegetables",
+    "E": "Fruits",
+    "F": "Roots and tubers",
+    "G": "Condiments and spices",
+    "H": "Nuts and oil seeds",
+    "I": "Sugars",
+    "J": "Mushrooms",
+    "K": "Miscellaneous foods",
+    "L": "Milk and milk products",
+    "M": "Egg and egg products",
+    "N": "Poultry",
+    "O": "Animal meat",
+    "P": "Marine fish",
+    "Q": "Marine shellfish",
+    "R": "Marine mollusks",
+    "S": "Fresh water fish and shellfish",
+    "T": "Edible oils and fats",
+}
+
+_FLESH = frozenset("NOPQRS")
+
+
+# ---------------------------------------------------
+# Structured counterpart of ai_service.DIET_RULES
+# ---------------------------------------------------
+DIET_EXCLUDED_GROUPS = {
+    "nonveg": frozenset(),
+    "veg": _FLESH | {"M"},
+    "pure_veg": _FLESH | {"M"},
+    "vegan": _FLESH | {"M", "L"},
+    "jain": _FLESH | {"M", "F", "J"},
+}
+
+DIET_EXCLUDED_TERMS = {
+    "nonveg": (),
+    "veg": (),
+    "pure_veg": ("onion", "garlic", "pyaaz", "lahsun"),
+    "vegan": ("ghee", "butter", "honey", "milk", "paneer", "panner", "curd", "khoa", "cheese"),
+    "jain": (
+        "onion", "garlic", "pyaaz", "lahsun", "ginger", "potato", "aloo", "carrot", "gajar",
+        "beet root", "beetroot", "radish", "mooli", "yam", "tapioca",
+    ),
+}
+
+# Everyday words for the foods in each excluded group, used to check meal
+# names and descriptions written by the model.
+GROUP_TERMS = {
+    "M": ("egg", "eggs", "omelette", "omelet", "anda"),
+    "N": ("chicken", "turkey", "duck", "murgh", "poultry"),
+    "O": ("mutton", "lamb", "goat", "beef", "pork", "ham", "bacon", "keema", "gosht", "meat"),
+    "P": ("fish", "tuna", "salmon", "sardine", "mackerel", "pomfret", "machli", "machhi", "seafood"),
+    "Q": ("prawn", "prawns", "shrimp", "crab", "lobster", "jhinga"),
+    "R": ("clam", "clams", "oyster", "oysters", "mussel", "mussels", "squid"),
+    "S": ("fish", "rohu", "catla", "hilsa"),
+    "L": ("milk", "paneer", "curd", "dahi", "ghee", "butter", "cheese", "yogurt", "yoghurt",
+          "khoa", "cream", "lassi", "raita", "whey", "buttermilk", "chaas", "kheer"),
+    "F": ("potato", "potatoes", "aloo", "carrot", "carrots", "beetroot", "radish", "mooli",
+          "sweet potato", "yam", "tapioca", "arbi"),
+    "J": ("mushroom", "mushrooms"),
+}
+
+# Plant-based look-alikes that must not trip the dairy / egg checks
+PLANT_BASED = re.compile(
+    r"\b(?:(?:almond|soy|soya|coconut|oat|rice|cashew|peanut)\s+(?:milk|curd|yogurt|butter|cream)"
+    r"|cocoa\s+butter|butter\s*fruit|egg\s*-?\s*(?:less|free)|vegan\s+\w+)\b",
+    re.I,
+)
+
+_DIET_ALIASES = {
+    "non_veg": "nonveg",
+    "non_vegetarian": "nonveg",
+    "vegetarian": "veg",
+    "pure_vegetarian": "pure_veg",
+    "eggless": "pure_veg",
+}
+
+
+def normalize_diet_type(diet_type) -> str:
+    """Map free-form diet labels ("Non-Veg", "Vegetarian") onto DIET_RULES
+    keys. Unknown labels fall back to "veg", as plan generation does."""
+    key = str(diet_type or "veg").strip().lower().replace("-", "_").replace(" ", "_")
+    key = _DIET_ALIASES.get(key, key)
+    return key if key in DIET_EXCLUDED_GROUPS else "veg"
+
+
+@lru_cache(maxsize=None)
+def excluded_terms_pattern(diet_type: str) -> Pattern:
+    """Whole-word regex for a diet's excluded terms ("yam" must not match
+    "yamuna"). Never matches for diets without excluded terms."""
+    terms = DIET_EXCLUDED_TERMS[normalize_diet_type(diet_type)]
+    if not terms:
+        return re.compile(r"(?!x)x")
+    return re.compile(r"\b(?:" + "|".join(re.escape(t) for t in terms) + r")\b", re.I)
+
+
+@lru_cache(maxsize=None)
+def forbidden_words_pattern(diet_type: str) -> Pattern:
+    """Whole-word regex for everything a diet forbids, in everyday words:
+    GROUP_TERMS of its excluded groups plus its DIET_EXCLUDED_TERMS."""
+    key = normalize_diet_type(diet_type)
+    terms = set(DIET_EXCLUDED_TERMS[key])
+    for group in DIET_EXCLUDED_GROUPS[key]:
+        terms.update(GROUP_TERMS.get(group, ()))
+    if not terms:
+        return re.compile(r"(?!x)x")
+    ordered = sorted(terms, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(t) for t in ordered) + r")\b", re.I)
+
+
+def diet_exclusions(diet_type) -> Tuple[FrozenSet[str], Pattern]:
+    """Return the (excluded IFCT groups, excluded-terms pattern) for a diet."""
+    key = normalize_diet_type(diet_type)
+    return DIET_EXCLUDED_GROUPS[key], excluded_terms_pattern(key)
+
+
+def is_food_allowed(diet_type, code: str, name: str) -> bool:
+    groups, terms = diet_exclusions(diet_type)
+    return code[:1] not in groups and not terms.search(name)
@@ -0,0 +1,122 @@
+from datetime import date
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from app.utils.profile import profile_value
+
+
+# ---------------------------------------------------
+# BMI / BMR (Mifflin-St Jeor) / TDEE
+# ---------------------------------------------------
+ACTIVITY_FACTORS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "active": 1.55,
+    "very_active": 1.725,
+}
+DEFAULT_ACTIVITY_FACTOR = 1.2
+
+METRICS = ("age", "bmi", "bmr", "tdee")
+
+
+def parse_date(value) -> Optional[date]:
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def age_on(dob: Optional[date], today: Optional[date] = None) -> Optional[int]:
+    if dob is None:
+        return None
+    today = today or date.today()
+    return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+
+
+def _floats(values: Sequence) -> np.ndarray:
+    out = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+def _ages(dobs: Sequence[Optional[date]], today: date) -> np.ndarray:
+    born = np.array([np.datetime64(d, "D") if d else np.datetime64("NaT") for d in dobs], dtype="datetime64[D]")
+    missing = np.isnat(born)
+    years = born.astype("datetime64[Y]")
+    months = born.astype("datetime64[M]")
+    year = years.astype(np.int64) + 1970
+    month = months.astype(np.int64) - years.astype("datetime64[M]").astype(np.int64) + 1
+    day = (born - months.astype("datetime64[D]")).astype(np.int64) + 1
+    before_birthday = (month > today.month) | ((month == today.month) & (day > today.day))
+    age = (today.year - year - before_birthday).astype(float)
+    age[missing] = np.nan
+    return age
+
+
+def energy_metrics_batch(
+    genders: Sequence,
+    dobs: Sequence[Optional[date]],
+    heights_cm: Sequence,
+    weights_kg: Sequence,
+    activity_levels: Sequence,
+    today: Optional[date] = None,
+) -> Dict[str, np.ndarray]:
+    """Age, BMI, BMR and TDEE for many people at once.
+
+    Takes one sequence per input, all the same length; returns one float
+    array per metric, NaN where the inputs don't determine it.
+    """
+    today = today or date.today()
+    height = _floats(heights_cm)
+    weight = _floats(weights_kg)
+    age = _ages(dobs, today)
+    known_gender = np.array([bool(g) for g in genders], dtype=bool)
+    male = np.array([str(g).lower() == "male" for g in genders], dtype=bool)
+    factor = np.array(
+        [ACTIVITY_FACTORS.get(str(a).lower(), DEFAULT_ACTIVITY_FACTOR) for a in activity_levels]
+    )
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        body = (height > 0) & (weight > 0)
+        bmi = np.where(body, weight / (height / 100) ** 2, np.nan)
+        bmr = 10 * weight + 6.25 * height - 5 * age + np.where(male, 5, -161)
+        bmr = np.where(body & known_gender & ~np.isnan(age), bmr, np.nan)
+        tdee = np.round(bmr * factor)
+
+    return {"age": age, "bmi": np.round(bmi, 1), "bmr": np.round(bmr), "tdee": tdee}
+
+
+def _scalar(value: float, integer: bool):
+    if np.isnan(value):
+        return None
+    return int(value) if integer else float(value)
+
+
+def energy_metrics(
+    gender, dob: Optional[date], height_cm, weight_kg, activity_level, today: Optional[date] = None
+) -> Dict[str, Optional[float]]:
+    """Age, BMI, BMR and TDEE of one person (None where undetermined)."""
+    batch = energy_metrics_batch([gender], [dob], [height_cm], [weight_kg], [activity_level], today)
+    return {name: _scalar(batch[name][0], integer=name != "bmi") for name in METRICS}
+
+
+def profile_tdee(user_profile: dict) -> Optional[int]:
+    """TDEE for a plan request: the onboarding value when the profile has
+    one, else computed from the body stats it carries."""
+    tdee = profile_value(user_profile, "athlete_or_lifestyle.tdee", "tdee")
+    if tdee:
+        return round(float(tdee))
+    return energy_metrics(
+        profile_value(user_profile, "profile.gender", "gender"),
+        parse_date(profile_value(user_profile, "profile.dob", "dob")),
+        profile_value(user_profile, "profile.height_cm", "height_cm"),
+        profile_value(user_profile, "profile.current_weight_kg", "current_weight_kg"),
+        profile_value(user_profile, "profile.activity_level", "activity_level"),
+    )["tdee"]
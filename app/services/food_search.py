@@ -0,0 +1,300 @@
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.services.food_store import FoodCompositionStore, get_food_store
+
+
+# Common Indian / English meal words -> the words IFCT uses for that food.
+# Applied to queries only, so "Moong dal chilla" also looks for "green gram".
+ALIASES = {
+    "paneer": "panner",
+    "moong": "green gram", "mung": "green gram",
+    "chana": "bengal gram", "chickpea": "bengal gram", "chickpeas": "bengal gram",
+    "besan": "bengal gram", "sattu": "bengal gram",
+    "rajma": "rajmah",
+    "toor": "red gram", "arhar": "red gram",
+    "urad": "black gram",
+    "masoor": "lentil",
+    "lobia": "cowpea",
+    "soya": "soya bean", "tofu": "soya bean",
+    "atta": "wheat flour atta", "roti": "wheat flour atta", "chapati": "wheat flour atta",
+    "phulka": "wheat flour atta", "paratha": "wheat flour atta",
+    "maida": "wheat flour refined",
+    "suji": "wheat semolina", "sooji": "wheat semolina", "rava": "wheat semolina",
+    "upma": "wheat semolina",
+    "dalia": "wheat bulgur", "daliya": "wheat bulgur",
+    "poha": "rice flakes",
+    "chawal": "rice", "pulao": "rice", "biryani": "rice",
+    "idli": "rice black gram", "dosa": "rice black gram",
+    "khichdi": "rice green gram",
+    "makki": "maize", "corn": "maize",
+    "aloo": "potato",
+    "palak": "spinach",
+    "methi": "fenugreek leaves",
+    "bhindi": "ladies finger", "okra": "ladies finger",
+    "gobi": "cauliflower",
+    "matar": "peas",
+    "baingan": "brinjal", "eggplant": "brinjal",
+    "lauki": "bottle gourd", "doodhi": "bottle gourd",
+    "karela": "bitter gourd",
+    "kaddu": "pumpkin",
+    "gajar": "carrot",
+    "mooli": "radish",
+    "shakarkandi": "sweet potato",
+    "arbi": "colocasia",
+    "pyaaz": "onion", "pyaz": "onion",
+    "doodh": "milk", "dahi": "milk", "curd": "milk", "yogurt": "milk", "lassi": "milk",
+    "anda": "egg", "omelette": "egg omlet", "omelet": "egg omlet",
+    "murgh": "chicken",
+    "mutton": "goat", "gosht": "goat",
+    "jhinga": "prawns", "shrimp": "prawns",
+    "peanut": "ground nut", "peanuts": "ground nut", "groundnut": "ground nut",
+    "moongphali": "ground nut",
+    "til": "gingelly seeds", "sesame": "gingelly seeds",
+    "flax": "linseeds", "flaxseed": "linseeds",
+    "kaju": "cashew nut", "cashew": "cashew nut",
+    "badam": "almond", "akhrot": "walnut",
+    "amla": "goosberry", "gooseberry": "goosberry",
+    "chikoo": "sapota",
+    "kela": "banana",
+}
+
+# Allergy / dislike words -> further terms naming the same food, matched
+# like the word itself (name or scientific name). A missed allergen ends up
+# on the user's plate, so these err on the wide side.
+_PEANUT = ("ground nut", "groundnut", "arachis")
+_DAIRY = ("milk", "panner", "khoa", "ghee")
+AVOID_SYNONYMS = {
+    "peanut": _PEANUT, "groundnut": _PEANUT, "moongphali": _PEANUT,
+    "milk": _DAIRY, "dairy": _DAIRY, "lactose": _DAIRY,
+    "cheese": _DAIRY, "butter": _DAIRY,
+    "sesame": ("gingelly", "sesamum"), "til": ("gingelly", "sesamum"),
+    "soy": ("soya", "soyabean", "glycine"), "soya": ("soyabean", "glycine"),
+    "wheat": ("triticum",), "gluten": ("wheat", "triticum", "barley", "rye"),
+    "mustard": ("brassica",),
+}
+
+# ... and -> whole IFCT food groups (see diet_rules.FOOD_GROUPS)
+AVOID_GROUPS = {
+    "milk": "L", "dairy": "L", "lactose": "L",
+    "egg": "M",
+    "fish": "PS", "seafood": "PQRS", "shellfish": "QR",
+    "meat": "NO", "chicken": "N", "poultry": "N",
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_VARIANT_SUFFIX = re.compile(r"\s*-\s*(?:\d+|all varieties)$", re.I)
+
+
+def normalize(text: str) -> str:
+    return _NON_WORD.sub(" ", str(text).lower()).strip()
+
+
+def name_head(name: str) -> str:
+    """"Rajmah, red" -> "Rajmah"; "Brinjal-7" -> "Brinjal"."""
+    return _VARIANT_SUFFIX.sub("", name.split(",")[0])
+
+
+def expand_aliases(text: str) -> str:
+    """Text plus the IFCT wording of any aliased words, for scanning."""
+    words = normalize(text).split()
+    extra = [ALIASES[w] for w in words if w in ALIASES]
+    return " ".join(words + extra)
+
+
+def query_variants(text: str) -> List[str]:
+    """The query as typed, with aliased words replaced, and singularized;
+    each is matched on its own and the best match wins."""
+    words = normalize(text).split()
+    variants = [" ".join(words)]
+    for candidate in (
+        " ".join(ALIASES.get(w, w) for w in words),
+        " ".join(w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words),
+    ):
+        if candidate not in variants:
+            variants.append(candidate)
+    return variants
+
+
+@lru_cache(maxsize=8192)
+def _word_trigrams(word: str) -> FrozenSet[str]:
+    padded = f"  {word} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def trigrams(text: str) -> Set[str]:
+    """Character trigrams of each word, padded so word starts/ends count.
+    Meal texts repeat their words, so each word's trigrams are cached."""
+    grams: Set[str] = set()
+    for word in normalize(text).split():
+        grams |= _word_trigrams(word)
+    return grams
+
+
+class FoodSearchIndex:
+    """Trigram inverted index over IFCT ``name`` and ``scie``.
+
+    A query is scored against every food with one ``np.bincount`` over the
+    posting lists of its trigrams, so a lookup touches only the foods that
+    share at least one trigram and stays well under a millisecond.
+
+    Each food is indexed three times: full name (documents ``0..n``),
+    scientific name (``n..2n``) and the name's head before the first comma
+    (``2n..3n``, "Rajmah" for "Rajmah, red"), which is what meal names
+    tend to mention.
+    """
+
+    # Scientific-name matches rank slightly below common-name matches
+    SCIENTIFIC_WEIGHT = 0.9
+
+    def __init__(self, store: FoodCompositionStore) -> None:
+        self.store = store
+        n = len(store)
+        documents = (
+            list(store.names)
+            + [s or "" for s in store.scientific_names]
+            + [name_head(name) for name in store.names]
+        )
+
+        postings: Dict[str, List[int]] = {}
+        sizes = np.zeros(len(documents), dtype=np.float32)
+        for doc, text in enumerate(documents):
+            grams = trigrams(text)
+            sizes[doc] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(doc)
+
+        self._n = n
+        self._sizes = sizes
+        self._postings = {g: np.array(docs, dtype=np.int32) for g, docs in postings.items()}
+        self._heads = [normalize(name_head(name)) for name in store.names]
+
+        # The head documents again as one flat (CSR) posting array, for
+        # mention_coverage: gram -> id, id's rows in _head_rows[start:end]
+        head_postings: Dict[str, np.ndarray] = {}
+        for gram, docs in self._postings.items():
+            heads = docs[docs >= 2 * n] - 2 * n
+            if len(heads):
+                head_postings[gram] = heads
+        self._head_gram_ids = {gram: i for i, gram in enumerate(head_postings)}
+        lengths = np.fromiter((len(p) for p in head_postings.values()), dtype=np.int64, count=len(head_postings))
+        self._head_starts = np.concatenate(([0], np.cumsum(lengths)))
+        self._head_rows = np.concatenate(list(head_postings.values())).astype(np.int64)
+
+    def _shared(self, text: str) -> Tuple[np.ndarray, int]:
+        grams = trigrams(text)
+        lists = [self._postings[g] for g in grams if g in self._postings]
+        if not lists:
+            return np.zeros(len(self._sizes), dtype=np.float32), len(grams)
+        shared = np.bincount(np.concatenate(lists), minlength=len(self._sizes))
+        return shared.astype(np.float32), len(grams)
+
+    def search(self, query: str, k: int = 10, min_score: float = 0.2) -> List[Tuple[int, float]]:
+        """Ranked (row, score) pairs; score is trigram Jaccard similarity."""
+        n = self._n
+        score = np.zeros(n, dtype=np.float32)
+        for variant in query_variants(query):
+            shared, q = self._shared(variant)
+            if not q:
+                continue
+            jaccard = shared / np.maximum(q + self._sizes - shared, 1)
+            score = np.maximum.reduce([
+                score,
+                jaccard[:n],
+                jaccard[n:2 * n] * self.SCIENTIFIC_WEIGHT,
+            ])
+
+        candidates = np.flatnonzero(score >= min_score)
+        top = candidates[np.argsort(-score[candidates], kind="stable")[:k]]
+        return [(int(i), round(float(score[i]), 4)) for i in top]
+
+    def containing(self, term: str, threshold: float = 0.8) -> np.ndarray:
+        """Rows whose name or scientific name contains ``term`` (fuzzily):
+        most of the term's trigrams occur in it."""
+        n = self._n
+        rows = []
+        for variant in query_variants(term):
+            shared, q = self._shared(variant)
+            if q:
+                best = np.maximum(shared[:n], shared[n:2 * n])
+                rows.append(np.flatnonzero(best / q >= threshold))
+        return np.unique(np.concatenate(rows)) if rows else np.array([], dtype=np.int64)
+
+    def avoided(self, terms: Iterable[str]) -> np.ndarray:
+        """Rows a user with these allergies or dislikes must not be served:
+        foods containing a term or one of its AVOID_SYNONYMS, and every food
+        in the term's AVOID_GROUPS."""
+        rows = [np.array([], dtype=np.int64)]
+        for term in terms:
+            words = normalize(term).split()
+            keys = {" ".join(words), " ".join(w[:-1] if w.endswith("s") else w for w in words)}
+            for search in {term, *(s for k in keys for s in AVOID_SYNONYMS.get(k, ()))}:
+                rows.append(self.containing(search))
+            for group in {g for k in keys for g in AVOID_GROUPS.get(k, "")}:
+                rows.append(np.flatnonzero(self.store.groups == group))
+        return np.unique(np.concatenate(rows))
+
+    def mentions(self, text: str, threshold: float = 0.75) -> List[Tuple[int, float]]:
+        """Foods named in free text such as a meal name or description:
+        most trigrams of the food's name head occur in the text. Varieties
+        of one food collapse to a single row."""
+        shared, q = self._shared(expand_aliases(text))
+        if not q:
+            return []
+        n = self._n
+        coverage = shared[2 * n:] / np.maximum(self._sizes[2 * n:], 1)
+        full = shared[:n] / np.maximum(self._sizes[:n], 1)
+        rows = np.flatnonzero(coverage >= threshold)
+        # Best head match first; among varieties, the one whose full name
+        # the text covers best ("atta" picks "Wheat flour, atta")
+        rows = rows[np.lexsort((-full[rows], -coverage[rows]))]
+
+        found: List[Tuple[int, float]] = []
+        seen = set()
+        for i in rows:
+            if self._heads[i] in seen:
+                continue
+            seen.add(self._heads[i])
+            found.append((int(i), round(float(coverage[i]), 4)))
+        return found
+
+    def mention_coverage(self, texts: Sequence[str]) -> np.ndarray:
+        """Head coverage of every food by each text, shape (len(texts), n).
+
+        The batch form of ``mentions``: all distinct texts are scored with a
+        single ``np.bincount`` over ``text * n + row`` ids, gathered from the
+        head postings without a Python loop over posting lists, so plan
+        validation pays one NumPy pass instead of one per meal.
+        """
+        n = self._n
+        # Plans repeat meals, so each distinct text is scored once
+        unique: Dict[str, int] = {}
+        slots = np.fromiter((unique.setdefault(t, len(unique)) for t in texts), dtype=np.int64, count=len(texts))
+
+        gram_ids = self._head_gram_ids
+        grams, owners = [], []
+        for u, text in enumerate(unique):
+            found = [gram_ids[g] for g in trigrams(expand_aliases(text)) if g in gram_ids]
+            grams += found
+            owners += [u] * len(found)
+        if not grams:
+            return np.zeros((len(texts), n), dtype=np.float32)
+
+        grams = np.asarray(grams, dtype=np.int64)
+        starts = self._head_starts[grams]
+        lengths = self._head_starts[grams + 1] - starts
+        # Ragged gather: positions starts[i] .. starts[i] + lengths[i] - 1
+        # of every posting, flattened
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        rows = self._head_rows[offsets + np.arange(offsets.size)]
+        ids = np.repeat(np.asarray(owners, dtype=np.int64) * n, lengths) + rows
+        shared = np.bincount(ids, minlength=len(unique) * n).reshape(len(unique), n)[slots]
+        return (shared / np.maximum(self._sizes[2 * n:], 1)).astype(np.float32)
+
+
+@lru_cache(maxsize=1)
+def get_food_search() -> FoodSearchIndex:
+    return FoodSearchIndex(get_food_store())
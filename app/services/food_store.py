@@ -0,0 +1,208 @@
+import csv
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.diet_rules import FOOD_GROUPS
+
+
+IFCT_PATH = Path(__file__).resolve().parents[2] / "ifct2017.csv"
+
+# Descriptive (non-numeric) IFCT columns
+TEXT_COLUMNS = ("code", "name", "scie", "regn")
+
+# Column order of FoodCompositionStore.macros
+MACROS = ("calories", "protein", "carbs", "fats", "fibre")
+MACRO_SOURCES = {"protein": "protcnt", "carbs": "choavldf", "fats": "fatce", "fibre": "fibtg"}
+
+
+def _atwater_kcal(protein, carbs, fats, fibre):
+    # Computed from the proximates rather than read from ``enerc`` so a
+    # meal's calories always agree with the macros shown next to them.
+    return 4 * protein + 4 * carbs + 9 * fats + 2 * fibre
+
+
+class FoodCompositionStore:
+    """Columnar, read-only view of the IFCT 2017 composition table.
+
+    Every nutrient column is a float32 column of ``values`` (per 100 g
+    edible portion) with its ``_e`` standard deviation at the same position
+    in ``errors``. Rows are addressed by IFCT ``code``; ``macros`` holds the
+    derived calories/protein/carbs/fats/fibre used by plan generation.
+    """
+
+    def __init__(
+        self,
+        codes: List[str],
+        names: List[str],
+        scientific_names: List[str],
+        regions: np.ndarray,
+        columns: Tuple[str, ...],
+        values: np.ndarray,
+        errors: np.ndarray,
+    ) -> None:
+        self.codes = codes
+        self.names = names
+        self.scientific_names = scientific_names
+        self.regions = regions
+        self.columns = columns
+        self.values = values
+        self.errors = errors
+        self.groups = np.array([code[:1] for code in codes])
+
+        self._rows: Dict[str, int] = {code: i for i, code in enumerate(codes)}
+        self._columns: Dict[str, int] = {col: j for j, col in enumerate(columns)}
+
+        protein, carbs, fats, fibre = (
+            values[:, self._columns[MACRO_SOURCES[m]]].copy() for m in MACROS[1:]
+        )
+        # IFCT lists only fatty-acid profiles for oils and fats; treat them
+        # as pure fat so they can be used for cooking fat.
+        pure_fat = (self.groups == "T") & (protein == 0) & (carbs == 0) & (fats == 0)
+        fats[pure_fat] = 100.0
+        self.macros = np.stack(
+            [_atwater_kcal(protein, carbs, fats, fibre), protein, carbs, fats, fibre], axis=1
+        ).astype(np.float32)
+
+    @classmethod
+    def from_csv(cls, path: Path = IFCT_PATH) -> "FoodCompositionStore":
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            rows = list(reader)
+
+        numeric = header[len(TEXT_COLUMNS):]
+        value_idx = [i for i, col in enumerate(numeric) if not col.endswith("_e")]
+        error_idx = [numeric.index(numeric[i] + "_e") for i in value_idx]
+
+        # A few cells are "null" (not analysed); they become NaN
+        matrix = np.array(
+            [[v if v not in ("", "null") else "nan" for v in row[len(TEXT_COLUMNS):]] for row in rows],
+            dtype=np.float32,
+        )
+
+        return cls(
+            codes=[row[0] for row in rows],
+            names=[row[1] for row in rows],
+            scientific_names=[row[2] for row in rows],
+            regions=np.array([int(row[3] or 0) for row in rows], dtype=np.int8),
+            columns=tuple(numeric[i] for i in value_idx),
+            values=np.ascontiguousarray(matrix[:, value_idx]),
+            errors=np.ascontiguousarray(matrix[:, error_idx]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._rows
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.errors.nbytes + self.macros.nbytes
+
+    # -----------------------------------------------
+    # Lookups
+    # -----------------------------------------------
+    def row(self, code: str) -> int:
+        """Row index of ``code``; raises KeyError for unknown codes."""
+        return self._rows[code]
+
+    def vector(self, nutrient: str) -> np.ndarray:
+        """One nutrient for every food: a raw IFCT column or a macro name."""
+        if nutrient in MACROS:
+            return self.macros[:, MACROS.index(nutrient)]
+        try:
+            return self.values[:, self._columns[nutrient]]
+        except KeyError:
+            raise KeyError(f"Unknown nutrient: {nutrient}")
+
+    def _column_indices(self, nutrients: Optional[Sequence[str]]) -> List[int]:
+        if nutrients is None:
+            return list(range(len(self.columns)))
+        try:
+            return [self._columns[n] for n in nutrients]
+        except KeyError as exc:
+            raise KeyError(f"Unknown nutrient: {exc.args[0]}")
+
+    @staticmethod
+    def _number(value) -> Optional[float]:
+        return None if np.isnan(value) else round(float(value), 4)
+
+    def summary(self, i: int) -> dict:
+        return {
+            "code": self.codes[i],
+            "name": self.names[i],
+            "group": FOOD_GROUPS.get(self.codes[i][:1]),
+            **{m: round(float(v), 2) for m, v in zip(MACROS, self.macros[i])},
+        }
+
+    def food(
+        self,
+        code: str,
+        nutrients: Optional[Sequence[str]] = None,
+        errors: bool = False,
+    ) -> dict:
+        i = self.row(code)
+        cols = self._column_indices(nutrients)
+        data = {
+            **self.summary(i),
+            "scientific_name": self.scientific_names[i] or None,
+            "regions": int(self.regions[i]),
+            "nutrients": {self.columns[j]: self._number(self.values[i, j]) for j in cols},
+        }
+        if errors:
+            data["errors"] = {self.columns[j]: self._number(self.errors[i, j]) for j in cols}
+        return data
+
+    # -----------------------------------------------
+    # Vectorized queries
+    # -----------------------------------------------
+    def totals(
+        self,
+        items: Iterable[Tuple[str, float]],
+        nutrients: Optional[Sequence[str]] = None,
+    ) -> dict:
+        """Sum macros and nutrients for (code, grams) pairs in one product.
+        Values IFCT did not analyse count as zero."""
+        pairs = list(items)
+        rows = np.fromiter((self.row(code) for code, _ in pairs), dtype=np.int64, count=len(pairs))
+        grams = np.fromiter((g for _, g in pairs), dtype=np.float32, count=len(pairs)) / 100
+        cols = self._column_indices(nutrients)
+
+        macros = grams @ self.macros[rows]
+        values = grams @ np.nan_to_num(self.values[np.ix_(rows, cols)])
+        return {
+            **{m: round(float(v), 2) for m, v in zip(MACROS, macros)},
+            "nutrients": {self.columns[j]: round(float(v), 4) for j, v in zip(cols, values)},
+        }
+
+    def top_k(
+        self,
+        nutrient: str,
+        k: int = 10,
+        per: Optional[str] = None,
+        groups: Optional[str] = None,
+    ) -> List[dict]:
+        """Foods with the highest ``nutrient``, optionally as a ratio
+        (``per="calories"`` for e.g. protein per kcal) and limited to IFCT
+        group letters."""
+        score = np.nan_to_num(self.vector(nutrient).astype(np.float64), nan=-np.inf)
+        if per:
+            denominator = self.vector(per).astype(np.float64)
+            score = np.divide(score, denominator, out=np.zeros_like(score), where=denominator > 0)
+        if groups:
+            score = np.where(np.isin(self.groups, list(groups.upper())), score, -np.inf)
+
+        k = max(0, min(k, int(np.isfinite(score).sum())))
+        top = np.argpartition(-score, k - 1)[:k] if k else np.array([], dtype=np.int64)
+        top = top[np.argsort(-score[top], kind="stable")]
+        return [{**self.summary(int(i)), "score": round(float(score[i]), 4)} for i in top]
+
+
+@lru_cache(maxsize=1)
+def get_food_store() -> FoodCompositionStore:
+    """The process-wide store; loaded on first use (at startup)."""
+    return FoodCompositionStore.from_csv()
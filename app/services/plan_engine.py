@@ -0,0 +1,320 @@
+import hashlib
+import itertools
+import json
+import re
+import uuid
+from functools import lru_cache
+from typing import AbstractSet, Dict, List
+
+import numpy as np
+
+from app.services.diet_rules import diet_exclusions, normalize_diet_type
+from app.services.energy_metrics import profile_tdee
+from app.services.food_search import get_food_search
+from app.services.food_store import FoodCompositionStore, get_food_store
+from app.utils.profile import avoided_terms, profile_value
+
+
+# ---------------------------------------------------
+# Plan layout
+# ---------------------------------------------------
+# (time, label, share of the day's energy, food roles)
+MEAL_SLOTS = (
+    ("08:00 AM", "Breakfast", 0.25, ("cereal", "protein", "fruit")),
+    ("01:00 PM", "Lunch", 0.35, ("cereal", "protein", "vegetable", "oil")),
+    ("05:00 PM", "Snack", 0.10, ("fruit", "nuts")),
+    ("08:00 PM", "Dinner", 0.30, ("cereal", "protein", "vegetable", "oil")),
+)
+MAX_ITEMS = max(len(slot[3]) for slot in MEAL_SLOTS)
+
+# role -> (IFCT groups, nutrient index used to rank candidates, per kcal)
+ROLES = {
+    "cereal": ("A", 4),
+    "protein": ("BLMNOPS", 1),
+    "vegetable": ("CDFJ", 4),
+    "fruit": ("E", 4),
+    "nuts": ("H", 1),
+    "oil": ("T", 3),
+}
+CANDIDATES_PER_GROUP = 6
+
+# Raw-weight portion bounds in grams, per IFCT group
+GROUP_PORTIONS = {
+    "A": (30, 150), "B": (25, 100), "C": (50, 200), "D": (75, 250),
+    "E": (75, 250), "F": (50, 200), "H": (10, 40), "J": (50, 150),
+    "L": (100, 300), "M": (50, 150), "N": (75, 250), "O": (75, 250),
+    "P": (75, 250), "Q": (75, 200), "R": (75, 200), "S": (75, 250),
+    "T": (3, 20),
+}
+
+# Entries that are in IFCT but are not something to put on a plate
+NOT_A_MEAL = re.compile(
+    r"\b(?:betel|arecanut|toddy|vanaspati|brain|tongue|lungs|heart|liver|tripe|spleen|"
+    r"kidneys|tube|testis|stomach|gizzard|khoa|seeds|dried|flower)\b",
+    re.I,
+)
+# Eggs only as whole cooked eggs
+PLATED_EGG = re.compile(r"whole.*\b(?:boiled|omlet)\b", re.I)
+_VARIANT_SUFFIX = re.compile(r"\s*-\s*(?:\d+|all varieties)$", re.I)
+
+# Relative weight of each target in the fit: calories, protein, carbs, fats
+TARGET_WEIGHTS = np.array([2.0, 1.5, 1.0, 1.0], dtype=np.float32)
+
+
+# ---------------------------------------------------
+# Targets
+# ---------------------------------------------------
+def _goal_factor(goal: str) -> float:
+    goal = goal.lower()
+    if any(word in goal for word in ("loss", "lose", "cut", "lean")):
+        return 0.8
+    if any(word in goal for word in ("gain", "bulk", "muscle", "mass")):
+        return 1.1
+    return 1.0
+
+
+def daily_targets(user_profile: dict, formData: dict) -> Dict[str, float]:
+    """Daily calories and macro grams from the onboarding TDEE and the goal."""
+    weight = profile_value(user_profile, "profile.current_weight_kg", "current_weight_kg")
+    tdee = profile_tdee(user_profile)
+    if not tdee:
+        # Rough maintenance estimate without the stats for Mifflin-St Jeor
+        tdee = float(weight) * 30 if weight else 2000
+
+    goal = str(formData.get("goal") or "")
+    calories = float(tdee) * _goal_factor(goal)
+
+    athlete = bool(profile_value(user_profile, "athlete_or_lifestyle.is_athlete", "is_athlete"))
+    if weight:
+        per_kg = 1.8 if athlete or _goal_factor(goal) != 1.0 else 1.2
+        protein = min(float(weight) * per_kg, calories * 0.30 / 4)
+    else:
+        protein = calories * 0.20 / 4
+    fats = calories * 0.25 / 9
+    carbs = max(calories - protein * 4 - fats * 9, 0) / 4
+
+    return {"calories": calories, "protein": protein, "carbs": carbs, "fats": fats}
+
+
+# ---------------------------------------------------
+# Candidate foods
+# ---------------------------------------------------
+def display_name(name: str) -> str:
+    """"Bengal gram, dal" -> "Bengal gram (dal)"."""
+    head, _, rest = _VARIANT_SUFFIX.sub("", name).partition(", ")
+    return f"{head} ({rest})" if rest else head
+
+
+def _is_plateable(code: str, name: str) -> bool:
+    if NOT_A_MEAL.search(name):
+        return False
+    return not code.startswith("M") or bool(PLATED_EGG.search(name))
+
+
+def role_candidates(
+    table: FoodCompositionStore,
+    diet_type: str,
+    avoid: AbstractSet[int] = frozenset(),
+) -> Dict[str, List[int]]:
+    """Row indices usable for each role, best first, groups interleaved.
+
+    Numbered varieties of one food ("Brinjal-1" .. "Brinjal-21") collapse
+    into one candidate so a plan doesn't repeat the same vegetable under
+    different labels.
+    """
+    excluded_groups, excluded_terms = diet_exclusions(diet_type)
+    kcal = np.maximum(table.macros[:, 0], 1.0)
+
+    candidates: Dict[str, List[int]] = {}
+    for role, (groups, nutrient) in ROLES.items():
+        score = table.macros[:, nutrient] / kcal
+        per_group = []
+        for group in groups:
+            if group in excluded_groups:
+                continue
+            seen = set()
+            rows = []
+            for i in np.flatnonzero(table.groups == group)[np.argsort(-score[table.groups == group], kind="stable")]:
+                name = table.names[i]
+                base = display_name(name)
+                if (
+                    base in seen
+                    or not _is_plateable(table.codes[i], name)
+                    or excluded_terms.search(name)
+                    or i in avoid
+                ):
+                    continue
+                seen.add(base)
+                rows.append(int(i))
+            per_group.append(rows[:CANDIDATES_PER_GROUP])
+
+        # Round-robin across groups so e.g. non-veg plans still rotate
+        # legumes and dairy in with meat and fish.
+        merged = []
+        for rank in range(CANDIDATES_PER_GROUP):
+            merged.extend(rows[rank] for rows in per_group if rank < len(rows))
+        candidates[role] = merged
+
+    return candidates
+
+
+# ---------------------------------------------------
+# Portion solver
+# ---------------------------------------------------
+def solve_portions(
+    per_100g: np.ndarray,
+    targets: np.ndarray,
+    lower: np.ndarray,
+    upper: np.ndarray,
+) -> np.ndarray:
+    """Bounded least-squares portion sizes for a batch of meals at once.
+
+    ``per_100g`` is (meals, items, 4) with calories/protein/carbs/fats per
+    100 g, ``targets`` is (meals, 4) and the bounds are (meals, items) in
+    units of 100 g; padding slots have ``lower == upper == 0``. Each meal
+    minimizes the weighted relative error to its targets.
+
+    With at most four items per meal the box-constrained optimum can be
+    found exactly: every item is either at its lower bound, at its upper
+    bound or free, so all 3**items faces are solved in one stacked
+    ``np.linalg.solve`` and the best feasible one is kept.
+    """
+    n, k, _ = per_100g.shape
+    a = per_100g.transpose(0, 2, 1) / targets[:, :, None] * TARGET_WEIGHTS[None, :, None]
+    gram = a.transpose(0, 2, 1) @ a + 1e-6 * np.eye(k, dtype=a.dtype)
+    rhs = (a.transpose(0, 2, 1) @ TARGET_WEIGHTS[None, :, None])[:, :, 0]
+
+    faces = _faces(k)                                     # (faces, k)
+    pinned = faces != 1
+    values = np.where(faces[None] == 0, lower[:, None], upper[:, None])  # (n, faces, k)
+
+    eye = np.eye(k, dtype=a.dtype)
+    system = np.where(pinned[None, :, :, None], eye, gram[:, None])
+    b = np.where(pinned[None], values, rhs[:, None])
+    x = np.linalg.solve(system, b[..., None])[..., 0]     # (n, faces, k)
+
+    feasible = ((x >= lower[:, None] - 1e-6) & (x <= upper[:, None] + 1e-6)).all(axis=2)
+    objective = 0.5 * np.einsum("nfi,nij,nfj->nf", x, gram, x) - np.einsum("nfi,ni->nf", x, rhs)
+    best = np.where(feasible, objective, np.inf).argmin(axis=1)
+
+    return np.clip(x[np.arange(n), best], lower, upper)
+
+
+@lru_cache(maxsize=None)
+def _faces(k: int) -> np.ndarray:
+    # 0 = at lower bound, 1 = free, 2 = at upper bound
+    return np.array(list(itertools.product((0, 1, 2), repeat=k)), dtype=np.int8)
+
+
+# ---------------------------------------------------
+# Plan builder
+# ---------------------------------------------------
+def _seed(user_profile: dict, formData: dict) -> int:
+    canonical = json.dumps(
+        {"user": str(user_profile.get("id")), "form": formData},
+        sort_keys=True,
+        default=str,
+    )
+    return int.from_bytes(hashlib.sha256(canonical.encode("utf-8")).digest()[:8], "little")
+
+
+def _round_grams(grams: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    step = np.where(groups == "T", 1.0, 5.0)
+    return np.round(grams / step) * step
+
+
+def build_local_plan(user_profile: dict, formData: dict) -> dict:
+    """Generate a plan from IFCT 2017 without calling the model.
+
+    Output matches the AI plan shape; each meal additionally lists its
+    ``items`` (IFCT code, name, grams). The same inputs always produce the
+    same plan.
+    """
+    table = get_food_store()
+    duration = int(formData["duration"])
+    goal = formData.get("goal") or "Balanced nutrition"
+
+    diet_type = normalize_diet_type(profile_value(user_profile, "dietary_preferences.diet_type"))
+    # Allergies and dislikes are free text ("peanuts, milk", "baingan");
+    # the search index maps them onto every IFCT food they name.
+    avoid = {int(row) for row in get_food_search().avoided(avoided_terms(user_profile))}
+    candidates = role_candidates(table, diet_type, avoid)
+    athlete = bool(profile_value(user_profile, "athlete_or_lifestyle.is_athlete", "is_athlete"))
+    daily = daily_targets(user_profile, formData)
+
+    rng = np.random.default_rng(_seed(user_profile, formData))
+    order = {role: rng.permutation(len(rows)) for role, rows in candidates.items()}
+    used = {role: 0 for role in candidates}
+
+    n_meals = duration * len(MEAL_SLOTS)
+    items = np.full((n_meals, MAX_ITEMS), -1, dtype=np.int64)
+    targets = np.zeros((n_meals, 4), dtype=np.float32)
+    tags = []
+
+    for day in range(duration):
+        rest_day = athlete and day % 7 in (3, 6)
+        tags.append("Rest" if rest_day else "Training")
+        day_factor = 0.9 if rest_day else 1.0
+
+        for s, (_, _, share, roles) in enumerate(MEAL_SLOTS):
+            m = day * len(MEAL_SLOTS) + s
+            targets[m] = [
+                daily["calories"] * share * day_factor,
+                daily["protein"] * share,
+                daily["carbs"] * share * day_factor,
+                daily["fats"] * share,
+            ]
+            for j, role in enumerate(roles):
+                rows = candidates[role]
+                if not rows:
+                    continue
+                items[m, j] = rows[order[role][used[role] % len(rows)]]
+                used[role] += 1
+
+    valid = items >= 0
+    safe = np.where(valid, items, 0)
+    per_100g = np.where(valid[:, :, None], table.macros[safe, :4], 0.0)
+    groups = np.where(valid, table.groups[safe], "")
+    lower = np.zeros(items.shape, dtype=np.float32)
+    upper = np.zeros(items.shape, dtype=np.float32)
+    for group, (lo, hi) in GROUP_PORTIONS.items():
+        mask = valid & (groups == group)
+        lower[mask] = lo / 100
+        upper[mask] = hi / 100
+
+    grams = _round_grams(solve_portions(per_100g, targets, lower, upper) * 100, groups)
+    totals = np.einsum("mk,mkn->mn", grams / 100, per_100g)
+
+    days = []
+    for day in range(duration):
+        meals = []
+        for s, (time, label, _, _) in enumerate(MEAL_SLOTS):
+            m = day * len(MEAL_SLOTS) + s
+            meal_items = [
+                {"code": table.codes[i], "name": table.names[i], "grams": int(g)}
+                for i, g in zip(items[m], grams[m])
+                if i >= 0 and g > 0
+            ]
+            dishes = [display_name(it["name"]) for it in meal_items if not it["code"].startswith("T")]
+            meals.append({
+                "id": str(uuid.uuid4()),
+                "time": time,
+                "name": ", ".join(dishes[:-1]) + " & " + dishes[-1] if len(dishes) > 1 else "".join(dishes),
+                "description": f"{label}: " + ", ".join(
+                    f"{it['grams']} g {display_name(it['name'])}" for it in meal_items
+                ),
+                "calories": int(round(totals[m, 0])),
+                "protein": int(round(totals[m, 1])),
+                "carbs": int(round(totals[m, 2])),
+                "fats": int(round(totals[m, 3])),
+                "status": "pending",
+                "items": meal_items,
+            })
+        days.append({"day": day + 1, "tag": tags[day], "meals": meals})
+
+    return {
+        "name": f"{goal} plan ({diet_type.replace('_', ' ')})",
+        "goal": goal,
+        "duration": duration,
+        "days": days,
+    }
@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.database.connection import async_session
+from app.services.ai_client import AIServiceError, AITimeoutError, AIUnavailableError
+from app.services.plan_service import generate_plan
+from app.services.plan_store import create_plan, serialize_plan
+from app.services.plan_validation import PlanValidationError
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+# What a failed job reports, most specific first; anything else is
+# "Plan generation failed" (the exception itself goes to the log)
+JOB_FAILURES = (
+    (AITimeoutError, "AI service timed out"),
+    (AIUnavailableError, "AI service unavailable"),
+    (PlanValidationError, "Generated plan broke the diet rules"),
+    (AIServiceError, "AI service error"),
+)
+
+
+def _job_failure(exc: Exception) -> str:
+    return next((message for kind, message in JOB_FAILURES if isinstance(exc, kind)), "Plan generation failed")
+
+
+class PlanJob:
+    """A single plan-generation request and its outcome."""
+
+    def __init__(self, idempotency_key: str, user_profile: dict, formData: dict) -> None:
+        self.id = str(uuid.uuid4())
+        self.idempotency_key = idempotency_key
+        self.user_profile = user_profile
+        self.formData = formData
+        self.status = QUEUED
+        self.plan: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        # Bumped by every save; watchers wait for it to move past the
+        # revision they last saw
+        self.revision = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "plan": self.plan,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+# ---------------------------------------------------
+# Backends
+# ---------------------------------------------------
+class JobBackend(ABC):
+    """Storage and dispatch for plan jobs.
+
+    The in-process queue only talks to this interface, so a shared backend
+    (Redis, a Postgres table) can replace the local one without touching
+    the routes or the workers.
+    """
+
+    @abstractmethod
+    async def add(self, job: PlanJob) -> PlanJob:
+        """Store and enqueue ``job`` unless its idempotency key is already
+        known, in which case the existing job is returned."""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[PlanJob]:
+        """The job, or None if unknown or evicted."""
+
+    @abstractmethod
+    async def next(self) -> PlanJob:
+        """Block until a queued job is available and return it."""
+
+    @abstractmethod
+    async def save(self, job: PlanJob) -> None:
+        """Store ``job``'s changes and bump its ``revision``."""
+
+    @abstractmethod
+    async def wait(self, job_id: str, revision: int, timeout: float) -> None:
+        """Return once ``job_id`` is past ``revision`` (at once if it
+        already is) or ``timeout`` elapses."""
+
+
+class InMemoryJobBackend(JobBackend):
+    """Single-process stand-in backend. Finished jobs are kept for
+    ``retention`` seconds so polling clients and retries can still see them."""
+
+    def __init__(self, retention: float) -> None:
+        self.retention = retention
+        self._jobs: Dict[str, PlanJob] = {}
+        self._by_key: Dict[str, str] = {}
+        self._changes: Dict[str, asyncio.Condition] = {}
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.retention
+        expired = [
+            job for job in self._jobs.values()
+            if job.status in FINISHED and job.updated_at < cutoff
+        ]
+        for job in expired:
+            del self._jobs[job.id]
+            self._by_key.pop(job.idempotency_key, None)
+            self._changes.pop(job.id, None)
+
+    async def add(self, job: PlanJob) -> PlanJob:
+        self._evict()
+        existing_id = self._by_key.get(job.idempotency_key)
+        if existing_id:
+            existing = self._jobs[existing_id]
+            # A failed job may be retried under the same key.
+            if existing.status != FAILED:
+                return existing
+
+        self._jobs[job.id] = job
+        self._by_key[job.idempotency_key] = job.id
+        self._changes[job.id] = asyncio.Condition()
+        self._queue.put_nowait(job.id)
+        return job
+
+    async def get(self, job_id: str) -> Optional[PlanJob]:
+        return self._jobs.get(job_id)
+
+    async def next(self) -> PlanJob:
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job and job.status == QUEUED:
+                return job
+
+    async def save(self, job: PlanJob) -> None:
+        job.updated_at = time.time()
+        job.revision += 1
+        changed = self._changes.get(job.id)
+        if changed:
+            async with changed:
+                changed.notify_all()
+
+    async def wait(self, job_id: str, revision: int, timeout: float) -> None:
+        job, changed = self._jobs.get(job_id), self._changes.get(job_id)
+        if not job or not changed:
+            return
+        try:
+            async with changed:
+                await asyncio.wait_for(changed.wait_for(lambda: job.revision > revision), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+JOB_BACKENDS = {
+    "memory": InMemoryJobBackend,
+}
+
+
+def make_job_backend(name: str) -> JobBackend:
+    try:
+        backend_cls = JOB_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown plan job backend: {name!r}")
+    return backend_cls(retention=settings.PLAN_JOB_RETENTION_SECONDS)
+
+
+# ---------------------------------------------------
+# Queue + worker pool
+# ---------------------------------------------------
+def idempotency_key_for(user_profile: dict, formData: dict) -> str:
+    """Derive a key from the request body for clients that send none, so a
+    retried submit joins the in-flight job instead of regenerating."""
+    canonical = json.dumps(
+        {"user_profile": user_profile, "formData": formData},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PlanJobQueue:
+    """Runs plan generation in background workers instead of the request."""
+
+    def __init__(self, backend: JobBackend, workers: int) -> None:
+        self.backend = backend
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+
+    async def submit(
+        self,
+        user_profile: dict,
+        formData: dict,
+        idempotency_key: Optional[str] = None,
+    ) -> PlanJob:
+        user_id = str(user_profile["id"])
+        key = f"{user_id}:{idempotency_key or idempotency_key_for(user_profile, formData)}"
+        return await self.backend.add(PlanJob(key, user_profile, formData))
+
+    async def get(self, job_id: str) -> Optional[PlanJob]:
+        return await self.backend.get(job_id)
+
+    async def start(self) -> None:
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.backend.next()
+            job.status = RUNNING
+            await self.backend.save(job)
+            try:
+                await self._run(job)
+            finally:
+                await self.backend.save(job)
+
+    async def _run(self, job: PlanJob) -> None:
+        try:
+            plan_data = await generate_plan(job.user_profile, job.formData)
+            async with async_session() as db:
+                plan = await create_plan(db, job.user_profile["id"], plan_data)
+            job.plan = serialize_plan(plan, plan_data["days"])
+            job.status = SUCCEEDED
+        except asyncio.CancelledError:
+            job.status = FAILED
+            job.error = "Worker shut down"
+            raise
+        except Exception as exc:
+            logger.exception("Plan job %s failed", job.id)
+            job.status = FAILED
+            job.error = _job_failure(exc)
+
+
+plan_job_queue = PlanJobQueue(
+    make_job_backend(settings.PLAN_JOB_BACKEND),
+    workers=settings.PLAN_JOB_WORKERS,
+)
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+from app.config import settings
+from app.services.ai_client import AIServiceError, AIUnavailableError
+from app.services.ai_service import enrich_plan_ai, generate_plan_ai, stream_plan_ai
+from app.services.diet_rules import normalize_diet_type
+from app.services.plan_engine import build_local_plan
+from app.services.plan_validation import validate_plan
+from app.utils.profile import avoided_terms, profile_value
+
+
+logger = logging.getLogger(__name__)
+
+
+def _engine(formData: dict) -> str:
+    return str(formData.get("engine") or settings.PLAN_ENGINE).lower()
+
+
+async def generate_plan(user_profile: dict, formData: dict) -> dict:
+    """Produce plan data for /plans/generate and plan jobs.
+
+    ``formData["engine"]`` overrides PLAN_ENGINE per request. While the AI
+    circuit breaker is open, plans not in the AI cache are built locally.
+    """
+    if _engine(formData) == "ai":
+        try:
+            return await generate_plan_ai(user_profile, formData)
+        except AIUnavailableError:
+            logger.warning("AI unavailable, building the plan locally")
+
+    return await _local_plan(user_profile, formData)
+
+
+async def _local_plan(user_profile: dict, formData: dict) -> dict:
+    plan = await asyncio.to_thread(build_local_plan, user_profile, formData)
+    diet_type = normalize_diet_type(profile_value(user_profile, "dietary_preferences.diet_type"))
+
+    if settings.PLAN_AI_ENRICH:
+        try:
+            await enrich_plan_ai(plan, diet_type)
+        except AIServiceError:
+            # Descriptions are cosmetic; keep the local ones.
+            logger.warning("Plan enrichment failed", exc_info=True)
+
+    # AI plans are validated in generate_plan_ai, before they are cached
+    validate_plan(plan["days"], diet_type, avoid=avoided_terms(user_profile))
+    return plan
+
+
+async def stream_plan(user_profile: dict, formData: dict):
+    """Produce plan data for /plans/generate/stream: ``("plan", header)``,
+    then ``("day", day)`` per day (see stream_plan_ai). Local plans are
+    built whole, so their days all follow at once."""
+    if _engine(formData) == "ai":
+        started = False
+        try:
+            async for event in stream_plan_ai(user_profile, formData):
+                started = True
+                yield event
+            return
+        except AIUnavailableError:
+            if started:
+                raise
+            logger.warning("AI unavailable, building the plan locally")
+
+    plan = await _local_plan(user_profile, formData)
+    yield "plan", {key: plan[key] for key in ("name", "goal", "duration")}
+    for day in plan["days"]:
+        yield "day", day
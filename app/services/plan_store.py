@@ -0,0 +1,630 @@
+import hashlib
+import json
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+
+from app.config import settings
+from app.database.connection import mark_written
+from app.models.dietary_preferences import DietaryPreferences
+from app.models.plans import NutritionPlan
+from app.models.users import User
+from app.services import plan_tables
+from app.services.response_cache import invalidate_user
+from app.utils.profile import avoided_terms
+
+
+def serialize_plan(plan: NutritionPlan, days: Optional[List[dict]] = None) -> dict:
+    """Shape a plan row the way the frontend expects it. Pass ``days`` for
+    plans whose meals are not in the row (storage "tables")."""
+    return {
+        "id": str(plan.id),
+        "name": plan.name,
+        "goal": plan.goal,
+        "duration": plan.duration,
+        "status": plan.status,
+        "days": plan.days if days is None else days,
+        "startDate": plan.startDate,
+        "created_at": plan.created_at.isoformat() if plan.created_at else None,
+    }
+
+
+def plan_etag(plan_id, version, variant: str = "") -> str:
+    return f'"plan-{plan_id}-{version or 0}{variant}"'
+
+
+async def _written(user_id) -> None:
+    # A user's plan changed: read it from the primary for a while and drop
+    # cached responses
+    mark_written(user_id)
+    await invalidate_user(user_id)
+
+
+def build_meal_index(days: List[dict]) -> Dict[str, List[int]]:
+    """meal id -> [day index, meal index] into ``days``."""
+    return {
+        meal["id"]: [d, m]
+        for d, day in enumerate(days)
+        for m, meal in enumerate(day.get("meals", []))
+        if "id" in meal
+    }
+
+
+async def _archive_active(db: AsyncSession, user_id) -> None:
+    # Lock the user row so concurrent generations for one user run one
+    # after the other and exactly one plan stays active
+    await db.execute(select(User.id).where(User.id == user_id).with_for_update())
+    await db.execute(
+        update(NutritionPlan)
+        .where(NutritionPlan.user_id == user_id, NutritionPlan.status == "active")
+        .values(status="archived")
+    )
+
+
+async def create_plan(db: AsyncSession, user_id, plan_data: dict) -> NutritionPlan:
+    """Persist a generated plan as the user's active plan, archiving the
+    previous one in the same transaction."""
+    await _archive_active(db, user_id)
+
+    tables = settings.PLAN_STORAGE == "tables"
+    plan = NutritionPlan(
+        id=uuid.uuid4(),
+        user_id=user_id,
+        name=plan_data["name"],
+        goal=plan_data["goal"],
+        duration=plan_data["duration"],
+        status="active",
+        days=[] if tables else plan_data["days"],
+        meal_index={} if tables else build_meal_index(plan_data["days"]),
+        meal_status_ts={},
+        storage="tables" if tables else "json",
+        startDate=datetime.utcnow().isoformat(),
+        created_at=datetime.now(timezone.utc),
+    )
+
+    db.add(plan)
+    if tables:
+        await db.flush()
+        await plan_tables.write_days(db, plan, plan_data["days"])
+    await db.commit()
+    await _written(user_id)
+    await db.refresh(plan)
+    return plan
+
+
+# ---------------------------------------------------
+# Plans written while they are generated
+# ---------------------------------------------------
+_APPEND_DAYS = text("""
+    UPDATE nutrition_plans
+    SET days = days || CAST(:days AS jsonb),
+        meal_index = COALESCE(meal_index, '{}'::jsonb) || CAST(:index AS jsonb)
+    WHERE id = :plan_id
+""")
+
+
+async def start_plan(db: AsyncSession, user_id, header: dict) -> NutritionPlan:
+    """Create a plan with no days yet (status "generating"). Add days with
+    append_days; activate_plan then makes it the user's active plan."""
+    tables = settings.PLAN_STORAGE == "tables"
+    plan = NutritionPlan(
+        id=uuid.uuid4(),
+        user_id=user_id,
+        name=header["name"],
+        goal=header["goal"],
+        duration=header["duration"],
+        status="generating",
+        days=[],
+        meal_index={},
+        meal_status_ts={},
+        storage="tables" if tables else "json",
+        startDate=datetime.utcnow().isoformat(),
+        created_at=datetime.now(timezone.utc),
+    )
+    db.add(plan)
+    await db.commit()
+    return plan
+
+
+async def append_days(db: AsyncSession, plan: NutritionPlan, days: List[dict], offset: int) -> None:
+    """Add ``days`` after the ``offset`` days written so far."""
+    if plan.storage == "tables":
+        await plan_tables.write_days(db, plan, days, offset)
+    else:
+        index = {k: [d + offset, m] for k, (d, m) in build_meal_index(days).items()}
+        await db.execute(_APPEND_DAYS, {
+            "plan_id": plan.id, "days": json.dumps(days), "index": json.dumps(index),
+        })
+    await db.commit()
+
+
+async def activate_plan(db: AsyncSession, plan: NutritionPlan) -> None:
+    """Make a fully written plan the user's active plan, archiving the
+    previous one."""
+    await _archive_active(db, plan.user_id)
+    await db.execute(
+        update(NutritionPlan)
+        .where(NutritionPlan.id == plan.id)
+        .values(status="active", version=NutritionPlan.version + 1)
+    )
+    await db.commit()
+    await _written(plan.user_id)
+
+
+async def fail_plan(db: AsyncSession, plan_id) -> None:
+    """Keep the days of a plan whose generation broke off, out of the way
+    of the active plan."""
+    await db.execute(update(NutritionPlan).where(NutritionPlan.id == plan_id).values(status="failed"))
+    await db.commit()
+
+
+# Longer than any generation runs; older "generating" plans were orphaned
+# by a worker that stopped mid-stream
+STALE_GENERATING = timedelta(hours=1)
+
+
+async def fail_stale_plans(db: AsyncSession, older_than: timedelta = STALE_GENERATING) -> int:
+    """Mark plans left in "generating" by a stopped worker as failed."""
+    result = await db.execute(
+        update(NutritionPlan)
+        .where(
+            NutritionPlan.status == "generating",
+            NutritionPlan.created_at < datetime.now(timezone.utc) - older_than,
+        )
+        .values(status="failed")
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def latest_active_plan(db: AsyncSession, user_id, with_days: bool = True) -> Optional[NutritionPlan]:
+    """The user's active plan; ``with_days=False`` leaves the (large)
+    ``days`` column unread, for callers that load days with a window."""
+    query = (
+        select(NutritionPlan)
+        .where(NutritionPlan.user_id == user_id, NutritionPlan.status == "active")
+        .order_by(NutritionPlan.created_at.desc())
+        .limit(1)
+    )
+    if not with_days:
+        query = query.options(defer(NutritionPlan.days), defer(NutritionPlan.meal_index))
+    result = await db.execute(query)
+    return result.scalar_one_or_none()
+
+
+async def active_plan_etag(db: AsyncSession, user_id, variant: str = "") -> Optional[str]:
+    """ETag of the user's active plan from one index probe, without
+    loading its meals."""
+    result = await db.execute(
+        select(NutritionPlan.id, NutritionPlan.version)
+        .where(NutritionPlan.user_id == user_id, NutritionPlan.status == "active")
+        .order_by(NutritionPlan.created_at.desc())
+        .limit(1)
+    )
+    row = result.first()
+    return plan_etag(row.id, row.version, variant) if row else None
+
+
+async def load_days(
+    db: AsyncSession, plan: NutritionPlan, window: Optional["PlanWindow"] = None
+) -> List[dict]:
+    if window is None or window.is_full:
+        if plan.storage == "tables":
+            return await plan_tables.load_days(db, plan.id)
+        return plan.days
+
+    from_day, to_day = window.day_range(plan)
+    if plan.storage == "tables":
+        return await plan_tables.load_days(
+            db, plan.id, from_day, to_day, window.day_keys, window.meal_keys
+        )
+    return await _load_json_window(db, plan.id, from_day, to_day, window)
+
+
+# ---------------------------------------------------
+# Day windows and field projection
+# ---------------------------------------------------
+LAST_DAY = 2**31 - 1
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[Optional[Set[str]], Optional[Set[str]]]:
+    """``fields=tag,meals.name,meals.status`` -> (day keys, meal keys).
+
+    None means every key. "day" and a meal's "id" are always kept; meals
+    are left out unless a "meals" or "meals.<key>" field is given.
+    """
+    if fields is None:
+        return None, None
+    day_keys, meal_keys, whole_meals = {"day"}, set(), False
+    for field in filter(None, (f.strip() for f in fields.split(","))):
+        if field == "meals":
+            whole_meals = True
+        elif field.startswith("meals."):
+            meal_keys.add(field[len("meals."):])
+        else:
+            day_keys.add(field)
+    if whole_meals:
+        return day_keys | {"meals"}, None
+    if meal_keys:
+        return day_keys | {"meals"}, meal_keys | {"id"}
+    return day_keys, set()
+
+
+class PlanWindow:
+    """The days (``from_day``..``to_day``, or the one on ``on_date``) and
+    ``fields`` a plan GET asks for. Raises ValueError for a window that
+    can't be served."""
+
+    def __init__(
+        self,
+        from_day: Optional[int] = None,
+        to_day: Optional[int] = None,
+        on_date: Optional[date] = None,
+        fields: Optional[str] = None,
+    ) -> None:
+        if on_date and (from_day or to_day):
+            raise ValueError("Use either date or from_day / to_day")
+        if from_day and to_day and to_day < from_day:
+            raise ValueError("to_day must not be before from_day")
+        self.from_day = from_day
+        self.to_day = to_day
+        self.on_date = on_date
+        self.fields = fields
+        self.day_keys, self.meal_keys = parse_fields(fields)
+
+    @property
+    def is_full(self) -> bool:
+        return not (self.from_day or self.to_day or self.on_date) and self.fields is None
+
+    @property
+    def variant(self) -> str:
+        """Distinguishes this window's ETag and cache entry from the full plan's."""
+        if self.is_full:
+            return ""
+        canonical = json.dumps([
+            self.from_day, self.to_day, self.on_date and self.on_date.isoformat(),
+            sorted(self.day_keys) if self.day_keys is not None else None,
+            sorted(self.meal_keys) if self.meal_keys is not None else None,
+        ])
+        return "-" + hashlib.sha256(canonical.encode()).hexdigest()[:12]
+
+    def day_range(self, plan: NutritionPlan) -> Tuple[int, int]:
+        if self.on_date:
+            start = plan_tables.start_date(plan)
+            day = (self.on_date - start).days + 1 if start else 0
+            return day, day
+        return self.from_day or 1, self.to_day or LAST_DAY
+
+    def describe(self, plan: NutritionPlan) -> dict:
+        from_day, to_day = self.day_range(plan)
+        return {"from_day": from_day, "to_day": min(to_day, plan.duration or to_day), "fields": self.fields}
+
+
+# Days are picked by their "day" number (array position when missing);
+# only the requested keys leave the database
+_DAY_NUMBER = (
+    "COALESCE(CASE jsonb_typeof(e.d -> 'day') WHEN 'number' THEN (e.d ->> 'day')::numeric END, e.i)"
+)
+
+
+def _keys_of(value: str, keys_param: str) -> str:
+    return (
+        f"(SELECT COALESCE(jsonb_object_agg(f.k, f.v), '{{}}'::jsonb) FROM jsonb_each({value}) AS f(k, v)"
+        f" WHERE f.k = ANY(CAST(:{keys_param} AS text[])))"
+    )
+
+
+def _window_query(day_keys: Optional[Set[str]], meal_keys: Optional[Set[str]]):
+    if day_keys is None:
+        day = "e.d"
+    else:
+        day = _keys_of("e.d - 'meals'", "day_keys")
+        if "meals" in day_keys:
+            meals = "COALESCE(e.d -> 'meals', '[]'::jsonb)"
+            if meal_keys is not None:
+                meals = (
+                    f"(SELECT COALESCE(jsonb_agg({_keys_of('m.meal', 'meal_keys')} ORDER BY m.j), '[]'::jsonb)"
+                    " FROM jsonb_array_elements(e.d -> 'meals') WITH ORDINALITY AS m(meal, j))"
+                )
+            day = f"{day} || jsonb_build_object('meals', {meals})"
+    return text(f"""
+        SELECT COALESCE(jsonb_agg({day} ORDER BY e.i), '[]'::jsonb)
+        FROM nutrition_plans p
+        CROSS JOIN jsonb_array_elements(p.days) WITH ORDINALITY AS e(d, i)
+        WHERE p.id = :plan_id
+          AND {_DAY_NUMBER} BETWEEN CAST(:from_day AS numeric) AND CAST(:to_day AS numeric)
+    """)
+
+
+async def _load_json_window(
+    db: AsyncSession, plan_id, from_day: int, to_day: int, window: PlanWindow
+) -> List[dict]:
+    result = await db.execute(
+        _window_query(window.day_keys, window.meal_keys),
+        {
+            "plan_id": plan_id,
+            "from_day": from_day,
+            "to_day": to_day,
+            "day_keys": sorted(window.day_keys or ()),
+            "meal_keys": sorted(window.meal_keys or ()),
+        },
+    )
+    return result.scalar_one()
+
+
+# ---------------------------------------------------
+# Single-meal updates
+# ---------------------------------------------------
+# Both statements locate the meal through meal_index and rewrite only that
+# path with jsonb_set, in one UPDATE. Postgres re-evaluates them against the
+# latest row version when another write to the plan commits first, so a
+# status change and a concurrent swap never overwrite each other. The id
+# check guards against an index that does not match ``days``.
+_MEAL_PATH = (
+    "ARRAY[meal_index -> CAST(:meal_id AS text) ->> 0, 'meals',"
+    " meal_index -> CAST(:meal_id AS text) ->> 1]"
+)
+
+_SET_MEAL_STATUS = text(f"""
+    UPDATE nutrition_plans
+    SET days = jsonb_set(days, {_MEAL_PATH} || ARRAY['status'], to_jsonb(CAST(:status AS text))),
+        meal_status_ts = COALESCE(meal_status_ts, '{{}}'::jsonb)
+                         || jsonb_build_object(CAST(:meal_id AS text), extract(epoch FROM now())),
+        version = version + 1
+    WHERE id = :plan_id AND days #>> ({_MEAL_PATH} || ARRAY['id']) = :meal_id
+    RETURNING user_id
+""")
+
+_REPLACE_MEAL = text(f"""
+    UPDATE nutrition_plans
+    SET days = jsonb_set(days, {_MEAL_PATH}, CAST(:meal AS jsonb)),
+        meal_index = (meal_index - CAST(:meal_id AS text))
+                     || jsonb_build_object(CAST(:new_id AS text), meal_index -> CAST(:meal_id AS text)),
+        version = version + 1
+    WHERE id = :plan_id AND days #>> ({_MEAL_PATH} || ARRAY['id']) = :meal_id
+    RETURNING user_id
+""")
+
+
+async def _set_meal_status_json(db: AsyncSession, plan_id, meal_id: str, status: str):
+    result = await db.execute(
+        _SET_MEAL_STATUS, {"plan_id": plan_id, "meal_id": meal_id, "status": status}
+    )
+    await db.commit()
+    return result.scalar_one_or_none()
+
+
+async def _replace_meal_json(db: AsyncSession, plan_id, meal_id: str, new_meal: dict):
+    result = await db.execute(_REPLACE_MEAL, {
+        "plan_id": plan_id,
+        "meal_id": meal_id,
+        "new_id": new_meal["id"],
+        "meal": json.dumps(new_meal),
+    })
+    await db.commit()
+    return result.scalar_one_or_none()
+
+
+def _by_storage(json_update, tables_update):
+    # Each update is a single statement that matches nothing for plans kept
+    # in the other storage, so the configured one is tried first and the
+    # other only for plans created before PLAN_STORAGE changed. Each returns
+    # the plan owner's id, or None when it matched nothing.
+    if settings.PLAN_STORAGE == "tables":
+        return tables_update, json_update
+    return json_update, tables_update
+
+
+async def set_meal_status(db: AsyncSession, plan_id, meal_id: str, status: str) -> bool:
+    """Set one meal's status in place. False if the plan or meal is missing."""
+    for apply in _by_storage(_set_meal_status_json, plan_tables.set_meal_status):
+        user_id = await apply(db, plan_id, meal_id, status)
+        if user_id:
+            await _written(user_id)
+            return True
+    return False
+
+
+async def replace_meal(db: AsyncSession, plan_id, meal_id: str, new_meal: dict) -> bool:
+    """Swap one meal for ``new_meal`` in place. False if the plan or meal is missing."""
+    for apply in _by_storage(_replace_meal_json, plan_tables.replace_meal):
+        user_id = await apply(db, plan_id, meal_id, new_meal)
+        if user_id:
+            await _written(user_id)
+            return True
+    return False
+
+
+async def remove_plan(db: AsyncSession, plan_id) -> bool:
+    result = await db.execute(
+        delete(NutritionPlan).where(NutritionPlan.id == plan_id).returning(NutritionPlan.user_id)
+    )
+    await db.commit()
+    user_id = result.scalar_one_or_none()
+    await _written(user_id)
+    return user_id is not None
+
+
+# ---------------------------------------------------
+# Bulk meal changes
+# ---------------------------------------------------
+# The plan row (locked) with, for the requested meals only, their position
+# and status in ``days`` and their last change time. Plans kept in tables
+# get one row per requested meal found in plan_meals.
+_READ_MEALS = text("""
+    SELECT p.storage, p.user_id,
+           (SELECT jsonb_object_agg(i.k, jsonb_build_object(
+                       'at', i.v,
+                       'id', p.days #>> ARRAY[i.v ->> 0, 'meals', i.v ->> 1, 'id'],
+                       'status', p.days #>> ARRAY[i.v ->> 0, 'meals', i.v ->> 1, 'status']))
+            FROM jsonb_each(COALESCE(p.meal_index, '{}'::jsonb)) AS i(k, v)
+            WHERE i.k = ANY(CAST(:ids AS text[]))) AS json_meals,
+           (SELECT jsonb_object_agg(t.k, t.v)
+            FROM jsonb_each(COALESCE(p.meal_status_ts, '{}'::jsonb)) AS t(k, v)
+            WHERE t.k = ANY(CAST(:ids AS text[]))) AS json_ts,
+           m.meal_id, m.status, m.status_updated_at
+    FROM nutrition_plans p
+    LEFT JOIN plan_meals m ON m.plan_id = p.id AND m.meal_id = ANY(CAST(:ids AS text[]))
+    WHERE p.id = :plan_id
+    FOR UPDATE OF p
+""")
+
+
+def _epoch(ts: Optional[datetime]) -> Optional[float]:
+    if ts is None:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+async def _lock_meals(db: AsyncSession, plan_id, meal_ids: Set[str]):
+    """Lock the plan row and read the given meals: ``(storage, user_id,
+    {meal_id: (status, last change)}, {meal_id: [day, meal] position})``,
+    positions for JSON plans only. None if the plan does not exist."""
+    rows = (await db.execute(_READ_MEALS, {"plan_id": plan_id, "ids": sorted(meal_ids)})).all()
+    if not rows:
+        return None
+
+    storage, user_id = rows[0].storage, rows[0].user_id
+    if storage == "tables":
+        current = {
+            r.meal_id: (r.status, _epoch(r.status_updated_at)) for r in rows if r.meal_id is not None
+        }
+        return storage, user_id, current, {}
+
+    json_meals, json_ts = rows[0].json_meals or {}, rows[0].json_ts or {}
+    # An index entry that points at another meal counts as missing
+    found = {k: v for k, v in json_meals.items() if v["id"] == k}
+    current = {k: (v["status"], json_ts.get(k)) for k, v in found.items()}
+    return storage, user_id, current, {k: v["at"] for k, v in found.items()}
+
+
+async def _apply_statuses_json(db: AsyncSession, plan_id, changes: List[dict], at: dict) -> None:
+    # One jsonb_set per meal, nested into a single UPDATE
+    days, params = "days", {"plan_id": plan_id}
+    for n, change in enumerate(changes):
+        d, m = at[change["meal_id"]]
+        days = (
+            f"jsonb_set({days}, ARRAY[CAST(:d{n} AS text), 'meals', CAST(:m{n} AS text), 'status'],"
+            f" to_jsonb(CAST(:s{n} AS text)))"
+        )
+        params.update({f"d{n}": str(d), f"m{n}": str(m), f"s{n}": change["status"]})
+    params["ts"] = json.dumps({c["meal_id"]: c["ts"] for c in changes})
+    await db.execute(text(f"""
+        UPDATE nutrition_plans
+        SET days = {days},
+            meal_status_ts = COALESCE(meal_status_ts, '{{}}'::jsonb) || CAST(:ts AS jsonb),
+            version = version + 1
+        WHERE id = :plan_id
+    """), params)
+
+
+async def set_meal_statuses(db: AsyncSession, plan_id, changes: List[dict]) -> Optional[List[dict]]:
+    """Apply many ``{meal_id, status, client_ts}`` changes to one plan with
+    one read and one write, in one transaction.
+
+    Per meal the latest ``client_ts`` wins, both within the request and
+    against the change stored last; a missing ``client_ts`` counts as now.
+    Returns one result per change, in order ("updated", "stale",
+    "superseded" or "not_found"), or None if the plan does not exist.
+    """
+    now = datetime.now(timezone.utc).timestamp()
+    locked = await _lock_meals(db, plan_id, {c["meal_id"] for c in changes})
+    if locked is None:
+        return None
+    storage, user_id, current, at = locked
+
+    # The winning change per meal: latest client_ts, later in the list on ties
+    stamped = [{**c, "ts": _epoch(c.get("client_ts")) or now} for c in changes]
+    winner = {}
+    for n, change in enumerate(stamped):
+        best = winner.get(change["meal_id"])
+        if best is None or change["ts"] >= stamped[best]["ts"]:
+            winner[change["meal_id"]] = n
+
+    results, applied = [], []
+    for n, change in enumerate(stamped):
+        meal_id = change["meal_id"]
+        result = {"meal_id": meal_id, "status": change["status"]}
+        if meal_id not in current:
+            result["result"] = "not_found"
+        elif winner[meal_id] != n:
+            result["result"] = "superseded"
+        elif current[meal_id][1] is not None and current[meal_id][1] > change["ts"]:
+            result.update(result="stale", status=current[meal_id][0])
+        else:
+            result["result"] = "updated"
+            applied.append({"meal_id": meal_id, "status": change["status"], "ts": change["ts"]})
+        results.append(result)
+
+    if applied:
+        if storage == "tables":
+            await plan_tables.apply_statuses(db, plan_id, applied)
+        else:
+            await _apply_statuses_json(db, plan_id, applied, at)
+    await db.commit()
+    if applied:
+        await _written(user_id)
+    return results
+
+
+async def _apply_replacements_json(db: AsyncSession, plan_id, replacements: Dict[str, dict], at: dict) -> None:
+    days, params = "days", {"plan_id": plan_id}
+    for n, (old_id, new_meal) in enumerate(replacements.items()):
+        d, m = at[old_id]
+        days = (
+            f"jsonb_set({days}, ARRAY[CAST(:d{n} AS text), 'meals', CAST(:m{n} AS text)],"
+            f" CAST(:meal{n} AS jsonb))"
+        )
+        params.update({f"d{n}": str(d), f"m{n}": str(m), f"meal{n}": json.dumps(new_meal)})
+    params["old_ids"] = list(replacements)
+    params["index"] = json.dumps({new_meal["id"]: at[old_id] for old_id, new_meal in replacements.items()})
+    await db.execute(text(f"""
+        UPDATE nutrition_plans
+        SET days = {days},
+            meal_index = (meal_index - CAST(:old_ids AS text[])) || CAST(:index AS jsonb),
+            version = version + 1
+        WHERE id = :plan_id
+    """), params)
+
+
+async def replace_meals(db: AsyncSession, plan_id, replacements: Dict[str, dict]) -> Optional[Set[str]]:
+    """Swap several meals (``{old meal id: new meal}``) with one read and
+    one write, in one transaction. Returns the ids that were replaced, the
+    rest were not in the plan, or None if the plan does not exist."""
+    locked = await _lock_meals(db, plan_id, set(replacements))
+    if locked is None:
+        return None
+    storage, user_id, current, at = locked
+
+    found = {old_id: new_meal for old_id, new_meal in replacements.items() if old_id in current}
+    if found:
+        if storage == "tables":
+            await plan_tables.apply_replacements(db, plan_id, found)
+        else:
+            await _apply_replacements_json(db, plan_id, found, at)
+    await db.commit()
+    if found:
+        await _written(user_id)
+    return set(found)
+
+
+async def plan_exists(db: AsyncSession, plan_id) -> bool:
+    result = await db.execute(select(NutritionPlan.id).where(NutritionPlan.id == plan_id))
+    return result.first() is not None
+
+
+async def plan_avoided_terms(db: AsyncSession, plan_id) -> List[str]:
+    """The plan owner's allergies and dislikes (swaps must avoid them)."""
+    result = await db.execute(
+        select(DietaryPreferences.allergies, DietaryPreferences.dislikes)
+        .join(NutritionPlan, NutritionPlan.user_id == DietaryPreferences.user_id)
+        .where(NutritionPlan.id == plan_id)
+    )
+    row = result.first()
+    return avoided_terms({"allergies": row.allergies, "dislikes": row.dislikes}) if row else []
@@ -0,0 +1,340 @@
+import json
+import logging
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.plan_meals import PlanDay, PlanMeal
+from app.models.plans import NutritionPlan
+
+
+logger = logging.getLogger(__name__)
+
+MACROS = ("calories", "protein", "carbs", "fats")
+MEAL_COLUMNS = ("id", "time", "name", "description", *MACROS, "status", "isSwapped")
+# JSON meal key -> plan_meals attribute
+MEAL_KEY_COLUMNS = {
+    **{k: k for k in ("time", "name", "description", *MACROS, "status")},
+    "id": "meal_id",
+    "isSwapped": "is_swapped",
+}
+DAY_COLUMNS = ("day", "tag", "meals")
+
+
+# ---------------------------------------------------
+# JSON shape <-> rows
+# ---------------------------------------------------
+def _number(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _plain(value: Optional[float]):
+    # 350.0 -> 350, so numbers come back the way the plan was generated
+    return int(value) if value is not None and value.is_integer() else value
+
+
+def start_date(plan: NutritionPlan) -> Optional[date]:
+    try:
+        return datetime.fromisoformat(str(plan.startDate)).date()
+    except ValueError:
+        return None
+
+
+def meal_values(meal: dict) -> dict:
+    """Column values for one meal; anything without a column (``items``,
+    non-numeric macros) is kept in ``extra``."""
+    numbers = {k: _number(meal.get(k)) for k in MACROS}
+    extra = {
+        k: v for k, v in meal.items()
+        if k not in MEAL_COLUMNS or (k in numbers and numbers[k] is None and v is not None)
+    }
+    return {
+        "meal_id": str(meal["id"]),
+        "time": meal.get("time"),
+        "name": meal.get("name"),
+        "description": meal.get("description"),
+        **numbers,
+        "status": meal.get("status", "pending"),
+        "is_swapped": bool(meal.get("isSwapped", False)),
+        "extra": extra or None,
+    }
+
+
+def plan_rows(plan: NutritionPlan, days: List[dict], offset: int = 0) -> Tuple[List[dict], List[dict]]:
+    """Rows for ``days``, which follow the plan's first ``offset`` days."""
+    start = start_date(plan)
+    status_ts = plan.meal_status_ts or {}
+    day_rows, meal_rows = [], []
+    seen, seen_days = set(), set()
+    for d, day in enumerate(days):
+        # A missing, non-integer or repeated day number (or one of the
+        # first ``offset`` days) gets the next free number instead
+        number = _number(day.get("day"))
+        if number is None or not number.is_integer() or number <= offset or number in seen_days:
+            number = offset + d + 1
+            while number in seen_days:
+                number += 1
+        number = int(number)
+        seen_days.add(number)
+        when = start + timedelta(days=number - 1) if start else None
+        extra = {k: v for k, v in day.items() if k not in DAY_COLUMNS}
+        day_rows.append({
+            "plan_id": plan.id, "day": number, "date": when,
+            "tag": day.get("tag"), "extra": extra or None,
+        })
+        for position, meal in enumerate(day.get("meals") or []):
+            # Old AI plans can repeat an id (often the literal "uuid");
+            # meal ids must be unique per plan here
+            if not meal.get("id") or str(meal["id"]) in seen:
+                meal = {**meal, "id": str(uuid.uuid4())}
+            seen.add(str(meal["id"]))
+            changed = status_ts.get(str(meal["id"]))
+            meal_rows.append({
+                "plan_id": plan.id, "user_id": plan.user_id,
+                "day": number, "position": position, "date": when,
+                **meal_values(meal),
+                "status_updated_at": datetime.fromtimestamp(changed, timezone.utc) if changed else None,
+            })
+    return day_rows, meal_rows
+
+
+def _meal_dict(row) -> dict:
+    """JSON shape of a PlanMeal, or of a row holding only some of its
+    columns (the others come out as None)."""
+    get = lambda key: getattr(row, key, None)
+    extra = get("extra") or {}
+    meal = {
+        "id": get("meal_id"),
+        "time": get("time"),
+        "name": get("name"),
+        "description": get("description"),
+        **{k: _plain(get(k)) if get(k) is not None else extra.get(k) for k in MACROS},
+        "status": get("status"),
+    }
+    if get("is_swapped"):
+        meal["isSwapped"] = True
+    meal.update({k: v for k, v in extra.items() if k not in meal})
+    return meal
+
+
+def _project(item: dict, keys: Optional[Set[str]]) -> dict:
+    return item if keys is None else {k: v for k, v in item.items() if k in keys}
+
+
+# ---------------------------------------------------
+# Reads and writes
+# ---------------------------------------------------
+async def write_days(db: AsyncSession, plan: NutritionPlan, days: List[dict], offset: int = 0) -> None:
+    """Insert a plan's days and meals: one batched statement per table.
+    ``offset`` is the number of days already written (see plan_rows)."""
+    day_rows, meal_rows = plan_rows(plan, days, offset)
+    if day_rows:
+        await db.execute(insert(PlanDay), day_rows)
+    if meal_rows:
+        await db.execute(insert(PlanMeal), meal_rows)
+
+
+async def load_days(
+    db: AsyncSession,
+    plan_id,
+    from_day: Optional[int] = None,
+    to_day: Optional[int] = None,
+    day_keys: Optional[Set[str]] = None,
+    meal_keys: Optional[Set[str]] = None,
+) -> List[dict]:
+    """Assemble ``days`` in the JSON shape from plan_days / plan_meals.
+
+    Only days ``from_day``..``to_day`` are read. ``day_keys`` / ``meal_keys``
+    (None for all) limit the keys returned; meal columns are only selected
+    when asked for, and meals not at all when ``day_keys`` lacks "meals".
+    """
+    window = [PlanDay.plan_id == plan_id]
+    if from_day is not None:
+        window.append(PlanDay.day >= from_day)
+    if to_day is not None:
+        window.append(PlanDay.day <= to_day)
+    day_rows = (await db.execute(
+        select(PlanDay).where(*window).order_by(PlanDay.day)
+    )).scalars().all()
+
+    days = {
+        row.day: {"day": row.day, "tag": row.tag, **(row.extra or {}), "meals": []}
+        for row in day_rows
+    }
+    with_meals = day_keys is None or "meals" in day_keys
+    if days and with_meals:
+        meal_window = [PlanMeal.plan_id == plan_id, PlanMeal.day.between(min(days), max(days))]
+        if meal_keys is None:
+            query = select(PlanMeal)
+        else:
+            names = {MEAL_KEY_COLUMNS[k] for k in meal_keys if k in MEAL_KEY_COLUMNS}
+            # Unknown keys and non-numeric macros are kept in ``extra``
+            if any(k not in MEAL_KEY_COLUMNS or k in MACROS for k in meal_keys):
+                names.add("extra")
+            query = select(PlanMeal.day, *(getattr(PlanMeal, n) for n in sorted(names)))
+        rows = await db.execute(query.where(*meal_window).order_by(PlanMeal.day, PlanMeal.position))
+        for row in (rows.scalars() if meal_keys is None else rows):
+            days[row.day]["meals"].append(_project(_meal_dict(row), meal_keys))
+
+    return [_project(day, day_keys) for day in days.values()]
+
+
+async def _bump_version(db: AsyncSession, plan_id) -> None:
+    await db.execute(
+        update(NutritionPlan)
+        .where(NutritionPlan.id == plan_id)
+        .values(version=NutritionPlan.version + 1)
+    )
+
+
+async def _update_meal(db: AsyncSession, plan_id, meal_id: str, values: dict):
+    # The plan row is locked (version bump) before the meal row, the same
+    # order as set_meal_statuses, so concurrent single and bulk updates
+    # never deadlock
+    await _bump_version(db, plan_id)
+    result = await db.execute(
+        update(PlanMeal)
+        .where(PlanMeal.plan_id == plan_id, PlanMeal.meal_id == meal_id)
+        .values(**values)
+        .returning(PlanMeal.user_id)
+    )
+    user_id = result.scalar_one_or_none()
+    if user_id:
+        await db.commit()
+    else:
+        await db.rollback()
+    return user_id
+
+
+async def set_meal_status(db: AsyncSession, plan_id, meal_id: str, status: str):
+    """Returns the plan owner's id, or None when the meal is not found."""
+    return await _update_meal(db, plan_id, meal_id, {"status": status, "status_updated_at": func.now()})
+
+
+async def replace_meal(db: AsyncSession, plan_id, meal_id: str, new_meal: dict):
+    """Returns the plan owner's id, or None when the meal is not found."""
+    return await _update_meal(db, plan_id, meal_id, {**meal_values(new_meal), "status_updated_at": None})
+
+
+# Status changes chosen by plan_store.set_meal_statuses, plus the plan's
+# version bump, in one statement
+_APPLY_STATUSES = text("""
+    WITH bump AS (
+        UPDATE nutrition_plans SET version = version + 1 WHERE id = :plan_id
+    )
+    UPDATE plan_meals m
+    SET status = c.status, status_updated_at = c.ts
+    FROM jsonb_to_recordset(CAST(:changes AS jsonb)) AS c(meal_id text, status text, ts timestamptz)
+    WHERE m.plan_id = :plan_id AND m.meal_id = c.meal_id
+""")
+
+
+async def apply_statuses(db: AsyncSession, plan_id, changes: List[dict]) -> None:
+    """Write ``{meal_id, status, ts}`` changes (``ts`` in epoch seconds)."""
+    await db.execute(_APPLY_STATUSES, {
+        "plan_id": plan_id,
+        "changes": json.dumps([
+            {**c, "ts": datetime.fromtimestamp(c["ts"], timezone.utc).isoformat()} for c in changes
+        ]),
+    })
+
+
+# Meals swapped by plan_store.replace_meals, plus the plan's version bump,
+# in one statement
+_APPLY_REPLACEMENTS = text("""
+    WITH bump AS (
+        UPDATE nutrition_plans SET version = version + 1 WHERE id = :plan_id
+    )
+    UPDATE plan_meals m
+    SET meal_id = c.meal_id, time = c.time, name = c.name, description = c.description,
+        calories = c.calories, protein = c.protein, carbs = c.carbs, fats = c.fats,
+        status = c.status, is_swapped = c.is_swapped, extra = c.extra, status_updated_at = NULL
+    FROM jsonb_to_recordset(CAST(:meals AS jsonb)) AS c(
+        old_id text, meal_id text, time text, name text, description text,
+        calories float8, protein float8, carbs float8, fats float8,
+        status text, is_swapped boolean, extra jsonb
+    )
+    WHERE m.plan_id = :plan_id AND m.meal_id = c.old_id
+""")
+
+
+async def apply_replacements(db: AsyncSession, plan_id, replacements: Dict[str, dict]) -> None:
+    """Write ``{old meal id: new meal}`` swaps."""
+    await db.execute(_APPLY_REPLACEMENTS, {
+        "plan_id": plan_id,
+        "meals": json.dumps([
+            {**meal_values(new_meal), "old_id": old_id} for old_id, new_meal in replacements.items()
+        ]),
+    })
+
+
+# ---------------------------------------------------
+# Migration from JSON plans
+# ---------------------------------------------------
+async def _insert_rows(db: AsyncSession, plans: List[NutritionPlan]) -> None:
+    day_rows, meal_rows = [], []
+    for plan in plans:
+        days, meals = plan_rows(plan, plan.days or [])
+        day_rows += days
+        meal_rows += meals
+    if day_rows:
+        await db.execute(insert(PlanDay), day_rows)
+    if meal_rows:
+        await db.execute(insert(PlanMeal), meal_rows)
+
+
+async def migrate_json_plans(db: AsyncSession, batch_size: int = 50) -> int:
+    """Move plans still stored in ``days`` into plan_days / plan_meals.
+
+    Works through ``batch_size`` plans per transaction and can be
+    interrupted and re-run; returns the number of plans moved. A plan
+    that can't be moved is logged and left in ``days``.
+    """
+    moved, skipped = 0, []
+    while True:
+        plans = (await db.execute(
+            select(NutritionPlan)
+            .where(NutritionPlan.storage == "json", NutritionPlan.id.notin_(skipped))
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )).scalars().all()
+        if not plans:
+            break
+
+        # One statement per table for the batch; if that fails, plan by
+        # plan to find the ones that can't be moved
+        try:
+            async with db.begin_nested():
+                await _insert_rows(db, plans)
+            done = list(plans)
+        except Exception:
+            done = []
+            for plan in plans:
+                try:
+                    async with db.begin_nested():
+                        await _insert_rows(db, [plan])
+                    done.append(plan)
+                except Exception:
+                    logger.exception("Could not move plan %s to plan_days / plan_meals", plan.id)
+                    skipped.append(plan.id)
+
+        if done:
+            await db.execute(
+                update(NutritionPlan)
+                .where(NutritionPlan.id.in_([p.id for p in done]))
+                .values(storage="tables", days=[], meal_index={})
+            )
+        await db.commit()
+        moved += len(done)
+
+    if moved:
+        logger.info("Moved %d plans to plan_days / plan_meals", moved)
+    return moved
@@ -0,0 +1,324 @@
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.diet_rules import (
+    FOOD_GROUPS,
+    PLANT_BASED,
+    diet_exclusions,
+    forbidden_words_pattern,
+    normalize_diet_type,
+)
+from app.services.food_search import get_food_search, name_head, normalize
+from app.services.food_store import get_food_store
+from app.services.plan_engine import display_name
+
+
+logger = logging.getLogger(__name__)
+
+MACRO_KEYS = ("calories", "protein", "carbs", "fats")
+
+# Differences up to these amounts (kcal, g, g, g) are never worth flagging,
+# however large they are relative to a small meal
+ABSOLUTE_SLACK = np.array([50.0, 5.0, 5.0, 5.0])
+
+# A food counts as mentioned when this share of its name head's trigrams
+# occurs in the meal text; diet violations need the whole head
+MENTION_THRESHOLD = 0.75
+VIOLATION_THRESHOLD = 0.999
+
+# "<plant> milk / butter / ..." -> the plant
+PLANT_MILK = re.compile(
+    r"\b(almond|soy|soya|coconut|oat|rice|cashew|peanut)\s+(?:milk|curd|yogurt|butter|cream)\b", re.I
+)
+
+# How far a meal's protein share of energy may exceed that of the most
+# protein-dense food it mentions
+PROTEIN_SHARE_SLACK = 0.10
+
+
+class PlanValidationError(Exception):
+    """A generated plan or meal breaks the user's diet rules, or contains
+    something the user is allergic to or dislikes."""
+
+    def __init__(self, violations: List[dict]) -> None:
+        self.violations = violations
+        names = ", ".join(sorted({v["name"] for v in violations})[:5])
+        super().__init__(f"Generated meals violate the diet: {names}")
+
+
+def _meal_text(meal: dict) -> str:
+    """Name and description of a meal. Names of IFCT items are cut out so
+    "Chicken mushroom" is judged by its code, not by the word "chicken"."""
+    text = f"{meal.get('name', '')} {meal.get('description', '')}"
+    for item in meal.get("items") or []:
+        if isinstance(item, dict) and item.get("name"):
+            for name in (display_name(item["name"]), item["name"]):
+                text = text.replace(name, " ")
+    return text
+
+
+def forbidden_word(diet_type, text: str) -> Optional[str]:
+    """The first word in ``text`` the diet forbids ("Egg bhurji" -> "Egg"
+    for veg), ignoring plant-based look-alikes such as "coconut milk"."""
+    match = forbidden_words_pattern(normalize_diet_type(diet_type)).search(PLANT_BASED.sub(" ", text))
+    return match.group(0) if match else None
+
+
+def avoided_word_pattern(avoid: Sequence[str]) -> Optional["re.Pattern"]:
+    """Whole-word (optionally plural) match of any allergy / dislike term,
+    for foods IFCT doesn't list ("Cheese toast" for a cheese allergy)."""
+    words = {" ".join(normalize(t).split()) for t in avoid} - {""}
+    # "peanuts" -> "peanut", so either form matches
+    words = sorted({w[:-1] if w.endswith("s") and len(w) > 3 else w for w in words}, key=len, reverse=True)
+    if not words:
+        return None
+    return re.compile(r"\b(?:" + "|".join(map(re.escape, words)) + r")(?:e?s)?\b", re.I)
+
+
+def _claimed(meals: Sequence[dict]) -> np.ndarray:
+    """(meals, 4) calories/protein/carbs/fats as stated; NaN when missing."""
+    def number(value) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    return np.array([[number(m.get(k)) for k in MACRO_KEYS] for m in meals], dtype=np.float64).reshape(-1, 4)
+
+
+def _item_totals(meals: Sequence[dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """Recompute macros of meals that list IFCT ``items`` in one scatter-add.
+
+    Returns (has_items mask, (meals, 4) totals); meals naming an unknown
+    code are treated as not having items.
+    """
+    store = get_food_store()
+    has_items = np.zeros(len(meals), dtype=bool)
+    owners, rows, grams = [], [], []
+    for m, meal in enumerate(meals):
+        items = meal.get("items")
+        if not items or not all(isinstance(it, dict) and it.get("code") in store for it in items):
+            continue
+        has_items[m] = True
+        for it in items:
+            owners.append(m)
+            rows.append(store.row(it["code"]))
+            grams.append(float(it.get("grams") or 0))
+
+    totals = np.zeros((len(meals), 4), dtype=np.float64)
+    if owners:
+        per_item = np.asarray(grams)[:, None] / 100 * store.macros[np.asarray(rows), :4]
+        np.add.at(totals, np.asarray(owners), per_item)
+    return has_items, totals
+
+
+def _rows_by_meal(mask: np.ndarray) -> Dict[int, List[int]]:
+    """meal -> the columns set in its row of a (meals, foods) mask."""
+    rows: Dict[int, List[int]] = {}
+    for m, i in zip(*np.nonzero(mask)):
+        rows.setdefault(int(m), []).append(int(i))
+    return rows
+
+
+def validate_meals(
+    meals: Sequence[dict],
+    diet_type,
+    labels: Optional[Sequence[dict]] = None,
+    correct: bool = True,
+    tolerance: Optional[float] = None,
+    avoid: Sequence[str] = (),
+) -> dict:
+    """Check generated meals against IFCT and the diet rules.
+
+    Meals built by the local engine carry ``items`` and get their macros
+    recomputed exactly from IFCT. Model-written meals are checked for
+    Atwater consistency (calories vs 4p + 4c + 9f) and for a protein share
+    no food they mention could supply. With ``correct``, macros that are
+    off by more than ``tolerance`` are overwritten in place.
+
+    Diet violations (a forbidden word, or a mentioned IFCT food from an
+    excluded group) are reported, not corrected; so are foods the user is
+    allergic to or dislikes (``avoid`` terms, see FoodSearchIndex.avoided).
+    """
+    started = time.perf_counter()
+    tolerance = settings.PLAN_MACRO_TOLERANCE if tolerance is None else tolerance
+    diet_type = normalize_diet_type(diet_type)
+    labels = labels or [{} for _ in meals]
+    store = get_food_store()
+
+    # Anything that is not a meal object is a violation, not checked further
+    unusable = [
+        {**label, "meal_id": None, "name": str(meal)[:40], "reasons": ["not a meal"]}
+        for meal, label in zip(meals, labels) if not isinstance(meal, dict)
+    ]
+    if unusable:
+        labels = [label for meal, label in zip(meals, labels) if isinstance(meal, dict)]
+        meals = [meal for meal in meals if isinstance(meal, dict)]
+
+    claimed = _claimed(meals)
+    has_items, item_totals = _item_totals(meals)
+
+    # Expected macros: IFCT totals for itemised meals; for the rest the
+    # stated macros with calories recomputed from them
+    expected = claimed.copy()
+    expected[:, 0] = claimed[:, 1:] @ np.array([4.0, 4.0, 9.0])
+    expected[has_items] = item_totals[has_items]
+
+    # Macros that cannot be recomputed are reported; missing ones that can
+    # (calories, or anything on an itemised meal) are filled in
+    missing = np.isnan(expected).any(axis=1)
+    diff = np.abs(claimed - expected)
+    off = (diff > ABSOLUTE_SLACK) & (diff > tolerance * np.abs(expected))
+    off |= np.isnan(claimed) & ~np.isnan(expected)
+    off_meals = off.any(axis=1)
+
+    # Foods named in each meal, for all meals in one batch. For allergies
+    # and dislikes, "peanut butter" is dairy-free but still peanut, so
+    # plant milks are read as their plant there rather than dropped; both
+    # readings are scored in the same batch.
+    raw_texts = [_meal_text(meal) for meal in meals]
+    cleaned = {}
+    texts = [cleaned.setdefault(t, PLANT_BASED.sub(" ", t)) for t in raw_texts]
+    avoid_texts = [PLANT_BASED.sub(" ", PLANT_MILK.sub(r"\1", t)) for t in raw_texts] if avoid else texts
+    scored = get_food_search().mention_coverage(texts + avoid_texts if avoid else texts)
+    coverage = scored[:len(meals)]
+    mentioned = coverage >= MENTION_THRESHOLD
+
+    kcal = np.asarray(store.macros[:, 0], dtype=np.float64)
+    food_share = np.divide(
+        4 * store.macros[:, 1], kcal, out=np.zeros_like(kcal), where=kcal > 0
+    )
+    max_share = np.where(mentioned, food_share, 0.0).max(axis=1, initial=0.0)
+    meal_share = np.divide(
+        4 * expected[:, 1], expected[:, 0],
+        out=np.zeros(len(meals)), where=expected[:, 0] > 0,
+    )
+    implausible = (
+        ~has_items & ~missing & mentioned.any(axis=1)
+        & (meal_share > max_share + PROTEIN_SHARE_SLACK)
+    )
+
+    excluded, _ = diet_exclusions(diet_type)
+    excluded_foods = np.isin(store.groups, list(excluded))
+    banned = (coverage >= VIOLATION_THRESHOLD) & excluded_foods
+
+    pattern = forbidden_words_pattern(diet_type)
+    words = {t: pattern.search(t) for t in set(texts)}
+
+    # Allergies and dislikes: the foods they map to, wherever mentioned
+    avoided_foods = np.zeros(len(store), dtype=bool)
+    avoided_foods[get_food_search().avoided(avoid)] = True
+    avoided_pattern = avoided_word_pattern(avoid)
+    if avoid:
+        avoided = (scored[len(meals):] >= VIOLATION_THRESHOLD) & avoided_foods
+    else:
+        avoided = np.zeros_like(banned)
+
+    # IFCT rows behind each meal's violations, found in one pass rather
+    # than a row scan per meal
+    banned_rows = _rows_by_meal(banned)
+    avoided_rows = _rows_by_meal(avoided)
+
+    flagged, violations = [], unusable
+    corrected = 0
+    for m, meal in enumerate(meals):
+        where = {**labels[m], "meal_id": meal.get("id"), "name": meal.get("name")}
+
+        reasons = []
+        if has_items[m]:
+            reasons += [
+                f"contains {it['name']}" for it in meal["items"]
+                if it["code"][:1] in excluded
+            ]
+        word = words[texts[m]]
+        if word:
+            reasons.append(f"mentions '{word.group(0)}'")
+        heads = {name_head(store.names[i]): store.groups[i] for i in banned_rows.get(m, ())}
+        reasons += [f"mentions {head} ({FOOD_GROUPS[group]})" for head, group in heads.items()]
+        if has_items[m]:
+            reasons += [
+                f"contains {it['name']} (allergy or dislike)" for it in meal["items"]
+                if avoided_foods[store.row(it["code"])]
+            ]
+        heads = {name_head(store.names[i]).lower(): name_head(store.names[i]) for i in avoided_rows.get(m, ())}
+        if avoided_pattern:
+            for word in avoided_pattern.finditer(avoid_texts[m]):
+                heads.setdefault(word.group(0).lower(), word.group(0))
+        reasons += [f"mentions {head} (allergy or dislike)" for head in sorted(heads.values())]
+        if reasons:
+            violations.append({**where, "reasons": reasons})
+
+        issues = []
+        if missing[m]:
+            issues.append("missing or non-numeric macros")
+        if off_meals[m]:
+            fields = [k for k, bad in zip(MACRO_KEYS, off[m]) if bad]
+            issues.append("macros off: " + ", ".join(
+                f"{k} {claimed[m, MACRO_KEYS.index(k)]:g} vs {expected[m, MACRO_KEYS.index(k)]:.0f}"
+                for k in fields
+            ))
+            if correct:
+                for k in fields:
+                    meal[k] = int(round(expected[m, MACRO_KEYS.index(k)]))
+                corrected += 1
+        if implausible[m]:
+            issues.append(
+                f"protein is {meal_share[m]:.0%} of energy; mentioned foods give at most {max_share[m]:.0%}"
+            )
+        if issues:
+            flagged.append({**where, "issues": issues})
+
+    return {
+        "diet_type": diet_type,
+        "meals_checked": len(meals) + len(unusable),
+        "corrected": corrected,
+        "flagged": flagged,
+        "violations": violations,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def validate_plan(
+    days: List[dict], diet_type, correct: bool = True, strict: bool = True, avoid: Sequence[str] = ()
+) -> dict:
+    """Validate every meal of a plan in one batch (see ``validate_meals``).
+
+    With ``strict``, diet, allergy and dislike violations raise
+    PlanValidationError.
+    """
+    meals, labels = [], []
+    for day in days:
+        for meal in day.get("meals") or []:
+            meals.append(meal)
+            labels.append({"day": day.get("day")})
+
+    report = validate_meals(meals, diet_type, labels, correct=correct, avoid=avoid)
+    _log(report, "plan")
+    if strict and report["violations"]:
+        raise PlanValidationError(report["violations"])
+    return report
+
+
+def validate_meal(
+    meal: dict, diet_type, correct: bool = True, strict: bool = True, avoid: Sequence[str] = ()
+) -> dict:
+    """Validate a single (swapped) meal."""
+    report = validate_meals([meal], diet_type, correct=correct, avoid=avoid)
+    _log(report, "swap")
+    if strict and report["violations"]:
+        raise PlanValidationError(report["violations"])
+    return report
+
+
+def _log(report: dict, kind: str) -> None:
+    if report["flagged"] or report["violations"]:
+        logger.info(
+            "Validated %s: %d meals, %d corrected, %d flagged, %d violations in %.2f ms",
+            kind, report["meals_checked"], report["corrected"], len(report["flagged"]),
+            len(report["violations"]), report["elapsed_ms"],
+        )
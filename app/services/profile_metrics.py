@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+import numpy as np
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database.connection import async_session, engine
+from app.models.profiles import UserProfile
+from app.services.energy_metrics import age_on, energy_metrics, energy_metrics_batch
+
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------
+# BMI / BMR / TDEE stored on user_profiles
+# ---------------------------------------------------
+def metric_values(
+    gender, dob: Optional[date], height_cm, weight_kg, activity_level, today: Optional[date] = None
+) -> Dict[str, Any]:
+    """The metric columns for a profile being saved with these inputs."""
+    today = today or date.today()
+    metrics = energy_metrics(gender, dob, height_cm, weight_kg, activity_level, today)
+    return {
+        "bmi": metrics["bmi"],
+        "bmr": metrics["bmr"],
+        "tdee": metrics["tdee"],
+        "metrics_age": metrics["age"],
+        "metrics_on": today,
+    }
+
+
+def stored_metrics(profile: UserProfile, today: Optional[date] = None) -> Dict[str, Any]:
+    """BMI / BMR / TDEE of a profile: the stored values while the age they
+    were computed for is still current, else computed now."""
+    if profile.metrics_on is None or profile.metrics_age != age_on(profile.dob, today):
+        metrics = metric_values(
+            profile.gender, profile.dob, profile.height_cm,
+            profile.current_weight_kg, profile.activity_level, today,
+        )
+    else:
+        metrics = {"bmi": profile.bmi, "bmr": profile.bmr, "tdee": profile.tdee}
+    return {key: metrics[key] for key in ("bmi", "bmr", "tdee")}
+
+
+_WRITE_METRICS = text("""
+    UPDATE user_profiles p
+    SET bmi = c.bmi, bmr = c.bmr, tdee = c.tdee,
+        metrics_age = c.metrics_age, metrics_on = :today, version = p.version + 1
+    FROM jsonb_to_recordset(CAST(:rows AS jsonb)) AS c(
+        user_id uuid, version int, bmi float8, bmr int, tdee int, metrics_age int
+    )
+    WHERE p.user_id = c.user_id AND p.version = c.version
+""")
+
+
+def _column(values) -> np.ndarray:
+    return np.array([np.nan if v is None else float(v) for v in values])
+
+
+def _same(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a == b) | (np.isnan(a) & np.isnan(b))
+
+
+def _value(value: float, integer: bool = True):
+    if np.isnan(value):
+        return None
+    return int(value) if integer else float(value)
+
+
+async def refresh_all_metrics(
+    db: AsyncSession, batch_size: Optional[int] = None, today: Optional[date] = None
+) -> int:
+    """Recompute the stored metrics of every profile whose age changed
+    since they were computed (or that has none yet).
+
+    One pass over user_profiles in primary-key order: each page of
+    ``batch_size`` profiles is computed as arrays and its stale rows are
+    written with one UPDATE. A profile saved meanwhile (new version) is
+    left alone. Returns the number of profiles updated.
+    """
+    batch_size = batch_size or settings.ENERGY_METRICS_BATCH_SIZE
+    today = today or date.today()
+    updated, after = 0, None
+    while True:
+        query = (
+            select(
+                UserProfile.user_id, UserProfile.version, UserProfile.gender, UserProfile.dob,
+                UserProfile.height_cm, UserProfile.current_weight_kg, UserProfile.activity_level,
+                UserProfile.bmi, UserProfile.bmr, UserProfile.tdee,
+                UserProfile.metrics_age, UserProfile.metrics_on,
+            )
+            .order_by(UserProfile.user_id)
+            .limit(batch_size)
+        )
+        if after is not None:
+            query = query.where(UserProfile.user_id > after)
+        rows = (await db.execute(query)).all()
+        if not rows:
+            break
+        after = rows[-1].user_id
+
+        (user_ids, versions, genders, dobs, heights, weights, activities,
+         bmis, bmrs, tdees, ages, computed_on) = zip(*rows)
+        metrics = energy_metrics_batch(genders, dobs, heights, weights, activities, today)
+        stale = (
+            np.array([on is None for on in computed_on])
+            | ~_same(metrics["age"], _column(ages))
+            | ~_same(metrics["bmi"], _column(bmis))
+            | ~_same(metrics["bmr"], _column(bmrs))
+            | ~_same(metrics["tdee"], _column(tdees))
+        )
+
+        changes = [
+            {
+                "user_id": str(user_ids[i]),
+                "version": versions[i],
+                "bmi": _value(metrics["bmi"][i], integer=False),
+                "bmr": _value(metrics["bmr"][i]),
+                "tdee": _value(metrics["tdee"][i]),
+                "metrics_age": _value(metrics["age"][i]),
+            }
+            for i in np.flatnonzero(stale)
+        ]
+        if changes:
+            result = await db.execute(_WRITE_METRICS, {"rows": json.dumps(changes), "today": today})
+            await db.commit()
+            updated += result.rowcount
+
+    if updated:
+        logger.info("Recomputed energy metrics of %d profiles", updated)
+    return updated
+
+
+# ---------------------------------------------------
+# Nightly refresh (ages, and so BMR / TDEE, change daily)
+# ---------------------------------------------------
+_nightly_task: Optional[asyncio.Task] = None
+
+# Every worker schedules the refresh; the one holding this advisory lock
+# runs it, the others skip that night's pass
+REFRESH_LOCK_KEY = 0x6E757472
+
+
+async def refresh_once() -> Optional[int]:
+    """One refresh pass, unless another worker is running one (None)."""
+    async with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as lock:
+        if not await lock.scalar(select(func.pg_try_advisory_lock(REFRESH_LOCK_KEY))):
+            logger.info("Energy metrics refresh already running elsewhere, skipped")
+            return None
+        try:
+            async with async_session() as db:
+                return await refresh_all_metrics(db)
+        finally:
+            await lock.scalar(select(func.pg_advisory_unlock(REFRESH_LOCK_KEY)))
+
+
+async def _refresh_nightly(hour: int) -> None:
+    while True:
+        now = datetime.now(timezone.utc)
+        next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+        try:
+            await refresh_once()
+        except Exception:
+            logger.exception("Energy metrics refresh failed")
+
+
+def start_nightly_refresh() -> None:
+    global _nightly_task
+    hour = settings.ENERGY_METRICS_REFRESH_HOUR
+    if 0 <= hour < 24 and _nightly_task is None:
+        _nightly_task = asyncio.create_task(_refresh_nightly(hour))
+
+
+async def stop_nightly_refresh() -> None:
+    global _nightly_task
+    if _nightly_task is not None:
+        _nightly_task.cancel()
+        try:
+            await _nightly_task
+        except asyncio.CancelledError:
+            pass
+        _nightly_task = None
+
+
+if __name__ == "__main__":
+    # One pass from cron instead of (or as well as) the in-process schedule:
+    #   python -m app.services.profile_metrics
+    import app.models.users  # noqa: F401  (UserProfile's relationship needs User mapped)
+
+    async def _main() -> None:
+        updated = await refresh_once()
+        print("Another refresh is running" if updated is None else f"Updated {updated} profiles")
+
+    asyncio.run(_main())
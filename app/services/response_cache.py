@@ -0,0 +1,75 @@
+from typing import Awaitable, Callable, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response
+
+from app.config import settings
+from app.utils.cache import TwoTierCache
+from app.utils.responses import ORJSONResponse, raw_json_response
+
+
+# A per-worker LRU, optionally in front of a SQLite file every worker on
+# the host shares (its own table, so it may share the AI cache's file)
+response_cache = TwoTierCache(
+    enabled=settings.RESPONSE_CACHE_ENABLED,
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl=settings.RESPONSE_CACHE_TTL_SECONDS,
+    sqlite_path=settings.RESPONSE_CACHE_SQLITE_PATH,
+    table="response_cache",
+)
+
+
+def plan_key(user_id) -> str:
+    return f"plan:{user_id}"
+
+
+def onboarding_key(user_id) -> str:
+    return f"onboarding:{user_id}"
+
+
+async def invalidate_user(user_id) -> None:
+    """Drop a user's cached responses after one of their writes."""
+    if user_id:
+        await response_cache.delete(plan_key(user_id))
+        await response_cache.delete(onboarding_key(user_id))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def _with_etag(body: bytes, etag: str) -> Response:
+    # no-cache: clients may store the body but must revalidate each time
+    return raw_json_response(body, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+async def conditional_response(
+    request: Request,
+    key: str,
+    etag: Optional[str],
+    build: Callable[[], Awaitable[Tuple[Optional[str], dict]]],
+) -> Response:
+    """Serve a GET revalidated by ``etag``, the resource's current version.
+
+    304 when the client already has it, the cached body when that is
+    still current, otherwise ``build()``, which returns the body and its
+    own ETag (None for bodies that should not be cached). Bodies must be
+    JSON-native; they are cached already encoded.
+    """
+    if etag and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    if etag:
+        cached = await response_cache.get(key)
+        if cached and cached["etag"] == etag:
+            return _with_etag(cached["body"].encode(), etag)
+
+    etag, body = await build()
+    if etag is None:
+        return ORJSONResponse(body)
+    encoded = orjson.dumps(body)
+    await response_cache.set(key, {"etag": etag, "body": encoded.decode()})
+    return _with_etag(encoded, etag)
@@ -0,0 +1,78 @@
+import time
+from typing import Optional
+
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.users import User
+from app.utils.jwt_handler import decode_token
+from app.utils.lru import LRUCache
+
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
+
+# token -> claims, each kept until the token's own ``exp``
+_verified_tokens = LRUCache(settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.AUTH_TOKEN_CACHE_TTL_SECONDS)
+# user id -> public user record
+_user_records = LRUCache(settings.AUTH_USER_CACHE_SIZE, ttl=settings.AUTH_USER_CACHE_TTL_SECONDS)
+
+
+class AuthContext:
+    """Who is calling: the verified token's claims and its user id."""
+
+    def __init__(self, user_id: str, claims: dict) -> None:
+        self.user_id = user_id
+        self.claims = claims
+
+
+def verify_token(token: str) -> dict:
+    """Decode and check a JWT, skipping the work for tokens seen recently."""
+    claims = _verified_tokens.get(token)
+    if claims is None:
+        claims = decode_token(token)
+        exp = claims.get("exp")
+        remaining = exp - time.time() if exp else settings.AUTH_TOKEN_CACHE_TTL_SECONDS
+        if remaining > 0:
+            _verified_tokens.set(token, claims, ttl=min(remaining, settings.AUTH_TOKEN_CACHE_TTL_SECONDS))
+    return dict(claims)
+
+
+async def get_auth(token: str = Depends(oauth2_scheme)) -> AuthContext:
+    """The per-request auth context. FastAPI resolves a dependency once per
+    request, so the token is verified once however many routes use it."""
+    claims = verify_token(token)
+    user_id = claims.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+    return AuthContext(str(user_id), claims)
+
+
+async def require_user(user_id: str, auth: AuthContext = Depends(get_auth)) -> AuthContext:
+    """For routes with a ``{user_id}`` path: the token must belong to it."""
+    if user_id != auth.user_id:
+        raise HTTPException(status_code=403, detail="Not allowed for this user")
+    return auth
+
+
+async def get_user_record(db: AsyncSession, user_id: str) -> Optional[dict]:
+    """Public fields of a user, served from a short-lived cache."""
+    record = _user_records.get(user_id)
+    if record is None:
+        q = await db.execute(
+            select(User.id, User.email, User.full_name, User.created_at).where(User.id == user_id)
+        )
+        row = q.one_or_none()
+        if not row:
+            return None
+        record = {
+            "id": str(row.id),
+            "email": row.email,
+            "full_name": row.full_name,
+            "created_at": row.created_at,
+        }
+        _user_records.set(user_id, record)
+    return dict(record)
+
@@ -0,0 +1,130 @@
+import asyncio
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+
+import orjson
+
+from app.utils.lru import LRUCache
+
+
+class SQLiteCache:
+    """Persistent tier backed by a table in a local SQLite file.
+
+    Survives restarts and is shared by every worker on the host. Calls are
+    pushed to a thread so disk I/O never blocks the event loop. Caches
+    sharing a file keep apart by using different ``table`` names.
+    """
+
+    def __init__(self, path: str, table: str) -> None:
+        if not table.isidentifier():
+            raise ValueError(f"Invalid cache table name: {table!r}")
+        self.path = path
+        self.table = table
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT value FROM {self.table} WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: str, expires_at: float) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+
+    def _delete(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await asyncio.to_thread(self._set, key, value, time.time() + ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+
+class TwoTierCache:
+    """JSON values in a memory LRU in front of an optional SQLite tier
+    (``sqlite_path``, table ``table``), with hit/miss counters per key
+    prefix (the part before the first ":")."""
+
+    def __init__(
+        self,
+        enabled: bool,
+        max_entries: int,
+        ttl: float,
+        sqlite_path: Optional[str] = None,
+        table: str = "cache",
+    ) -> None:
+        self.enabled = enabled
+        self.ttl = ttl
+        self.memory = LRUCache(max_entries, ttl)
+        self.persistent = SQLiteCache(sqlite_path, table) if enabled and sqlite_path else None
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, key: str, event: str) -> None:
+        kind = key.split(":", 1)[0]
+        counters = self.counters.setdefault(
+            kind, {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "stores": 0}
+        )
+        counters[event] += 1
+
+    async def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+
+        value = self.memory.get(key)
+        if value is not None:
+            self._count(key, "memory_hits")
+            return orjson.loads(value)
+
+        if self.persistent:
+            value = await self.persistent.get(key)
+            if value is not None:
+                self._count(key, "persistent_hits")
+                self.memory.set(key, value)
+                return orjson.loads(value)
+
+        self._count(key, "misses")
+        return None
+
+    async def set(self, key: str, data: Any) -> None:
+        if not self.enabled:
+            return
+        value = orjson.dumps(data).decode()
+        self.memory.set(key, value)
+        if self.persistent:
+            await self.persistent.set(key, value, self.ttl)
+        self._count(key, "stores")
+
+    async def delete(self, key: str) -> None:
+        if not self.enabled:
+            return
+        self.memory.delete(key)
+        if self.persistent:
+            await self.persistent.delete(key)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self.memory),
+            "persistent": self.persistent.path if self.persistent else None,
+            "counters": self.counters,
+        }
@@ -0,0 +1,57 @@
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional: without it responses are only gzipped
+    brotli = None
+
+
+def accepts(accept_encoding: str, coding: str) -> bool:
+    """True if ``coding`` is listed in Accept-Encoding without q=0."""
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        if name.strip() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int, **kwargs) -> None:
+        super().__init__(app, minimum_size, **kwargs)
+        self.quality = quality
+        self.compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self.compressor is None:
+            if not more_body:
+                return brotli.compress(body, quality=self.quality)
+            self.compressor = brotli.Compressor(quality=self.quality)
+        data = self.compressor.process(body)
+        return data + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Starlette's GZipMiddleware, preferring brotli when the client accepts
+    it and the ``brotli`` package is installed.
+
+    Bodies under ``minimum_size`` and event streams are sent as they are.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int, compresslevel: int, brotli_quality: int) -> None:
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and brotli is not None:
+            if accepts(Headers(scope=scope).get("Accept-Encoding", ""), "br"):
+                responder = BrotliResponder(
+                    self.app, self.minimum_size, self.brotli_quality,
+                    exclude_content_types=self.exclude_content_types,
+                )
+                await responder(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
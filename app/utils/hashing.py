@@ -1,8 +1,16 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 from passlib.context import CryptContext
 
+from app.config import settings
+
+# Hashes below PASSWORD_BCRYPT_ROUNDS (e.g. the old rounds=8 ones) still
+# verify but report needs_rehash(), and are upgraded after login.
 pwd_context = CryptContext(
     schemes=["bcrypt"],
-    bcrypt__rounds=8,  # faster than 12
+    bcrypt__rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
     deprecated="auto",
 )
 
@@ -18,3 +26,63 @@ def verify_password(raw: str, hashed: str) -> bool:
     """Verify a raw password against a stored bcrypt hash."""
     raw = raw[:72]
     return pwd_context.verify(raw, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True for hashes made with fewer rounds than configured."""
+    return pwd_context.needs_update(hashed)
+
+
+# ---------------------------------------------------
+# Off-loop hashing
+# ---------------------------------------------------
+class HasherBusyError(Exception):
+    """Raised when too many hashes are already queued or running."""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool.
+
+    bcrypt releases the GIL, so hashing here never blocks the event loop.
+    At most ``max_pending`` calls may be queued or running; beyond that
+    callers get HasherBusyError (503 with Retry-After) instead of piling
+    up behind a burst.
+    """
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HasherBusyError("Too many sign-ins in progress, retry shortly")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, raw: str, hashed: str) -> bool:
+        return await self._run(verify_password, raw, hashed)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "rounds": settings.PASSWORD_BCRYPT_ROUNDS,
+        }
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
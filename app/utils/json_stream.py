@@ -0,0 +1,105 @@
+import json
+from typing import List, Optional
+
+
+class ArrayItemStream:
+    """Incremental parser for a JSON object arriving in pieces, yielding the
+    items of one of its array members as soon as each is complete.
+
+    Feed it text as it streams in (model replies may wrap the object in
+    prose or a code fence; anything before the first ``{`` is skipped)::
+
+        days = ArrayItemStream("days")
+        for chunk in chunks:
+            for day in days.feed(chunk):
+                ...
+
+    Items are parsed one by one, so a reply cut off mid-array still yields
+    every item before the cut. Only object items are supported.
+    """
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.text = ""
+        self.started = False   # inside the top-level object
+        self.finished = False  # its closing brace was seen
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._member: Optional[str] = None
+        self._member_start = 0
+        self._array_start: Optional[int] = None  # where the "key" member starts
+        self._in_array = False
+        self._array_closed = False
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[dict]:
+        """Add ``chunk``; return the items completed by it. Raises
+        ValueError on an item that is not valid JSON."""
+        self.text += chunk
+        items = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start:i + 1]
+                continue
+            if self.finished:
+                break
+            if not self.started:
+                if c == "{":
+                    self.started, self._depth = True, 1
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._string_start = i
+            elif c == ":" and self._depth == 1:
+                self._member = json.loads(self._last_string) if self._last_string else None
+                self._member_start = self._string_start
+            elif c in "{[":
+                if self._depth == 1 and c == "[" and self._member == self.key and not self._array_closed:
+                    self._in_array = True
+                    self._array_start = self._member_start
+                elif self._depth == 2 and self._in_array and c == "{":
+                    self._item_start = i
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 2 and self._item_start is not None:
+                    items.append(json.loads(text[self._item_start:i + 1]))
+                    self._item_start = None
+                elif self._depth == 1 and self._in_array:
+                    self._in_array, self._array_closed = False, True
+                elif self._depth == 0:
+                    self.finished = True
+        self._pos = len(text)
+        return items
+
+    @property
+    def complete(self) -> bool:
+        """True once the array has been closed."""
+        return self._array_closed
+
+    def header(self) -> dict:
+        """The object's members before the array (e.g. a plan's name and
+        goal), or ``{}`` if they are not parseable yet."""
+        if self._array_start is None:
+            return {}
+        start = self.text.find("{")
+        head = self.text[start:self._array_start].rstrip().rstrip(",")
+        try:
+            return json.loads(head + "}")
+        except ValueError:
+            return {}
@@ -0,0 +1,39 @@
+from typing import Any, List
+
+
+def profile_value(data: dict, *paths: str) -> Any:
+    """Return the first non-empty value among dotted ``paths``.
+
+    Clients send ``user_profile`` either flat or shaped like the onboarding
+    GET response (``profile.*``, ``athlete_or_lifestyle.*``,
+    ``dietary_preferences.*``), so callers list every place a field may live.
+    """
+    for path in paths:
+        value: Any = data
+        for part in path.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        if value not in (None, "", []):
+            return value
+    return None
+
+
+def text_list(values: Any) -> List[str]:
+    """A list field that may arrive as a list or as comma-separated text
+    ("peanuts, milk"), as sorted, lower-cased, de-duplicated items."""
+    if not values:
+        return []
+    if isinstance(values, str):
+        values = values.split(",")
+    return sorted({str(v).strip().lower() for v in values if str(v).strip()})
+
+
+def avoided_terms(data: dict) -> List[str]:
+    """The user's allergies and dislikes, as one list of terms."""
+    return sorted({
+        term
+        for paths in (
+            ("dietary_preferences.allergies", "allergies"),
+            ("dietary_preferences.dislikes", "dislikes"),
+        )
+        for term in text_list(profile_value(data, *paths))
+    })
@@ -0,0 +1,21 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON rendered with orjson; the app's default response class.
+
+    Route return values still pass through FastAPI's jsonable_encoder
+    first. Returning an ORJSONResponse directly skips that walk, which is
+    what plan routes do: their content is already JSON-native.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def raw_json_response(body: bytes, **kwargs) -> Response:
+    """A response for JSON that is already encoded (e.g. from a cache)."""
+    return Response(body, media_type="application/json", **kwargs)
@@ -0,0 +1,100 @@
+"""Serialization and compression cost of a 30-day plan response.
+
+Compares the previous path (jsonable_encoder + stdlib json, as FastAPI's
+default JSONResponse renders it) with orjson on the same content, and the
+bytes on the wire with gzip / brotli at the app's settings.
+
+    python -m benchmarks.plan_payload [--days 30] [--repeat 50]
+"""
+import argparse
+import gzip
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from app.config import settings
+from app.services.plan_engine import build_local_plan
+from app.utils.compression import brotli
+
+
+def sample_plan(days: int) -> dict:
+    profile = {
+        "id": str(uuid.uuid4()),
+        "profile": {"gender": "female", "current_weight_kg": 62, "activity_level": "active"},
+        "dietary_preferences": {"diet_type": "veg"},
+    }
+    plan = build_local_plan(profile, {"duration": days, "goal": "Maintain"})
+    return {
+        "id": str(uuid.uuid4()),
+        "name": plan["name"],
+        "goal": plan["goal"],
+        "duration": plan["duration"],
+        "status": "active",
+        "days": plan["days"],
+        "startDate": datetime.utcnow().isoformat(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def stdlib_render(content: dict) -> bytes:
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def orjson_render(content: dict) -> bytes:
+    return orjson.dumps(content)
+
+
+def cpu_ms(fn, arg, repeat: int) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        fn(arg)
+    return (time.process_time() - started) * 1000 / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    content = sample_plan(args.days)
+    meals = sum(len(d["meals"]) for d in content["days"])
+    body = orjson_render(content)
+    print(f"{args.days}-day plan, {meals} meals")
+
+    print("\nserialization (CPU ms per response)")
+    stdlib = cpu_ms(stdlib_render, content, args.repeat)
+    fast = cpu_ms(orjson_render, content, args.repeat)
+    print(f"  jsonable_encoder + json  {stdlib:8.2f}")
+    print(f"  orjson                   {fast:8.2f}   ({stdlib / fast:.0f}x less)")
+
+    print("\nbytes on the wire (CPU ms to compress)")
+    rows = [("identity", body, 0.0)]
+    level = settings.RESPONSE_GZIP_LEVEL
+    rows.append((
+        f"gzip -{level}",
+        gzip.compress(body, compresslevel=level),
+        cpu_ms(lambda b: gzip.compress(b, compresslevel=level), body, args.repeat),
+    ))
+    if brotli is not None:
+        quality = settings.RESPONSE_BROTLI_QUALITY
+        rows.append((
+            f"brotli q{quality}",
+            brotli.compress(body, quality=quality),
+            cpu_ms(lambda b: brotli.compress(b, quality=quality), body, args.repeat),
+        ))
+    else:
+        print("  (brotli not installed)")
+    for name, data, ms in rows:
+        print(f"  {name:<12} {len(data):>9,d} B  {len(data) / len(body):6.1%}  {ms:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()